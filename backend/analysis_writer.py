@@ -0,0 +1,185 @@
+"""
+Write-behind persistence for farm analyses
+
+Analyses submitted by /predict are queued in-process and written by a
+background thread in batched transactions, so the request never waits on
+SQLite's single-writer lock. Ids are handed out from blocks reserved up
+front, which lets the caller return the prediction_id immediately.
+"""
+
+import logging
+import atexit
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AnalysisWriter:
+    def __init__(self, db_manager, max_queue_size=1000, batch_size=100,
+                 flush_interval=0.5, enqueue_timeout=2.0, id_block_size=100):
+        self.db = db_manager
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.id_block_size = id_block_size
+
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._id_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._next_id = None
+        self._block_end = None
+        self._closed = False
+
+        atexit.register(self.close)
+
+    def submit(self, farm_id, analysis_data):
+        """
+        Queue an analysis for persistence and return its id
+
+        When the queue stays full for longer than enqueue_timeout the
+        analysis is written synchronously, so producers slow down to the
+        writer's pace instead of growing memory without bound.
+        """
+        self._ensure_started()
+        analysis_id = self._allocate_id()
+        item = (analysis_id, farm_id, analysis_data)
+
+        if self._closed:
+            self.db.save_analyses([item])
+            return analysis_id
+
+        try:
+            self._queue.put(item, timeout=self.enqueue_timeout)
+        except queue.Full:
+            logger.warning("Analysis queue full, writing synchronously")
+            self.db.save_analyses([item])
+
+        return analysis_id
+
+    def flush(self):
+        """Block until every queued analysis has been written"""
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self, timeout=10.0):
+        """Drain the queue and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._thread is None or self._pid != os.getpid():
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        """Current queue state"""
+        return {
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'max_queue_size': self.max_queue_size,
+            'writer_alive': bool(self._thread and self._thread.is_alive())
+        }
+
+    def _ensure_started(self):
+        """Start the writer thread, restarting it in forked worker processes"""
+        if self._pid == os.getpid():
+            return
+
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+
+            # Threads and reserved id blocks do not survive a fork
+            self._queue = queue.Queue(maxsize=self.max_queue_size)
+            self._next_id = None
+            self._block_end = None
+            self._thread = threading.Thread(
+                target=self._run, name='analysis-writer', daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _allocate_id(self):
+        """Hand out the next id from the reserved block"""
+        with self._id_lock:
+            if self._next_id is None or self._next_id > self._block_end:
+                self._next_id = self.db.reserve_analysis_ids(self.id_block_size)
+                self._block_end = self._next_id + self.id_block_size - 1
+
+            analysis_id = self._next_id
+            self._next_id += 1
+            return analysis_id
+
+    def _run(self):
+        """Drain the queue in batches until told to stop"""
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            received = 1
+            if item is _STOP:
+                stopping = True
+            else:
+                batch.append(item)
+
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                received += 1
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+
+            self._write_batch(batch)
+            for _ in range(received):
+                self._queue.task_done()
+
+        # Anything that raced in behind the stop marker
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                remaining.append(item)
+            self._queue.task_done()
+        self._write_batch(remaining)
+
+    def _write_batch(self, batch):
+        """Write a batch, isolating rows that fail so the rest still land"""
+        if not batch:
+            return
+
+        try:
+            self.db.save_analyses(batch)
+            return
+        except Exception as e:
+            logger.warning("Batched analysis write failed, retrying per row: %s", e)
+
+        for item in batch:
+            for attempt in range(3):
+                try:
+                    self.db.save_analyses([item])
+                    break
+                except Exception as e:
+                    if attempt == 2:
+                        logger.error("Dropped analysis %s for farm %s: %s", item[0], item[1], e, exc_info=True)
+                    else:
+                        time.sleep(0.1 * (attempt + 1))
@@ -1,41 +1,110 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request
 from flask_cors import CORS
-import pandas as pd
-import numpy as np
-import joblib
 import os
 import sqlite3
 import json
+import logging
+import time
 from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
-# Import ML services
-from services.crop_recommendation import CropRecommendationService
-from services.yield_prediction import YieldPredictionService
-from services.farm_efficiency import FarmEfficiencyService
-from services.market_price import MarketPriceService
+# ML services; built on first use so startup stays fast
+from services.registry import create_registry
+from services.warmup import Warmup
+from services.workflow import SECTIONS, select_fields
 
 # Import database API
-from database import db_api
+from database import db_api, DatabaseManager, connect, get_data_versions
+from analysis_writer import AnalysisWriter
+from archival import ArchiveScheduler, get_archiver
+from config import get_config
+from executors import run_inference, run_io
+from utils.responses import create_response, handle_errors, json_response, ndjson_response, init_app as init_responses
+from utils.conditional import conditional
+from utils.admission import admission_control, admission_stats
+from utils import log, metrics, profiling
+from utils.cache import get_cache
+from utils.batch import parse_requests, run_batch
+import events
+
+log.setup_logging(get_config())
+logger = logging.getLogger(__name__)
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
+# Request ids first so every later hook and log record sees them
+log.init_app(app)
+# Profiling next so a profile covers the remaining hooks too
+profiling.init_app(app)
+# Metrics next: its after_request hook then runs after compression and times it too
+metrics.init_app(app)
+init_responses(app)
 
 # Register database blueprint
 app.register_blueprint(db_api)
 
-# Initialize services
-crop_service = CropRecommendationService()
-yield_service = YieldPredictionService()
-efficiency_service = FarmEfficiencyService()
-price_service = MarketPriceService()
+# Services registry (crop, yield, efficiency, price, workflow)
+services = create_registry()
+
+def service_metrics():
+    """Model versions and price-data freshness for /metrics, for services loaded so far"""
+    models = []
+    for name, label in (('crop', 'crop_recommendation'), ('yield', 'yield_prediction')):
+        if services.loaded(name):
+            service = services.get(name)
+            models.append(([label, service.model_version or 'fallback'], int(service.model is not None)))
+    yield metrics.gauge(
+        'agri_model_loaded', 'Model in use per service (1) or fallback rules (0), by model file version',
+        ['service', 'version'], models
+    )
+    
+    price_service = services.get('price') if services.loaded('price') else None
+    if price_service is not None and price_service.price_data is not None:
+        newest = price_service.price_data['Date'].max()
+        yield metrics.gauge(
+            'agri_price_data_age_seconds', 'Age of the newest price in the loaded dataset',
+            ['version'], [([price_service.data_version or 'unknown'], time.time() - newest.timestamp())]
+        )
+
+metrics.add_gauge_callback(service_metrics)
+
+# Optional write-behind persistence for /predict analyses
+config = get_config()
+analysis_writer = None
+if config.ANALYSIS_WRITE_BEHIND:
+    analysis_writer = AnalysisWriter(
+        DatabaseManager(),
+        max_queue_size=config.ANALYSIS_QUEUE_SIZE,
+        batch_size=config.ANALYSIS_BATCH_SIZE,
+        flush_interval=config.ANALYSIS_FLUSH_INTERVAL,
+        enqueue_timeout=config.ANALYSIS_ENQUEUE_TIMEOUT,
+        id_block_size=config.ANALYSIS_ID_BLOCK_SIZE
+    )
+
+# Periodic archival of old analyses
+archive_scheduler = None
+if config.ARCHIVE_ENABLED:
+    archive_scheduler = ArchiveScheduler(get_archiver(), config.ARCHIVE_INTERVAL_HOURS)
+    archive_scheduler.start()
+
+# Warmup gates /health/ready; started by the runner (start_warmup)
+warmup = Warmup(services, rounds=config.WARMUP_ROUNDS)
+
+def start_warmup(background=True):
+    """Warm the services up, or report ready straight away when WARMUP_ENABLED is off"""
+    if not config.WARMUP_ENABLED:
+        warmup.skip()
+    elif background:
+        warmup.start()
+    else:
+        warmup.run()
 
 @app.route('/')
-def home():
+async def home():
     """API Health Check"""
-    return jsonify({
+    return json_response({
         'status': 'success',
         'message': 'AI Agricultural Platform API',
         'version': '1.0.0',
@@ -53,8 +122,30 @@ def home():
         }
     })
 
+@app.route('/health/live', methods=['GET'])
+async def health_live():
+    """Liveness: the process is up and serving requests"""
+    return json_response({'status': 'alive'})
+
+@app.route('/health/ready', methods=['GET'])
+async def health_ready():
+    """Readiness: services built and warmed up; 503 until then"""
+    status = warmup.status()
+    return json_response(status, 200 if status['ready'] else 503)
+
+@app.route('/admission/stats', methods=['GET'])
+async def get_admission_stats():
+    """Rate limiting and load shedding counters for this worker"""
+    return create_response('success', 'Admission stats retrieved', admission_stats())
+
+@app.route('/cache/stats', methods=['GET'])
+async def get_cache_stats():
+    """Cache backend usage and per-namespace hit ratios for this worker"""
+    return create_response('success', 'Cache stats retrieved', await run_io(lambda: get_cache().stats()))
+
 @app.route('/api/recommend-crop', methods=['POST'])
-def recommend_crop():
+@admission_control
+async def recommend_crop():
     """Recommend best crop based on soil and weather conditions"""
     try:
         data = request.get_json()
@@ -62,10 +153,10 @@ def recommend_crop():
         # Validate input
         required_fields = ['temperature', 'humidity', 'ph', 'rainfall']
         if not validate_input_data(data, required_fields):
-            return create_response('error', 'Missing required fields', 400)
+            return create_response('error', 'Missing required fields', status_code=400)
         
         # Get recommendation
-        result = crop_service.recommend_crop(data)
+        result = await run_inference(services.get('crop').recommend_crop, data)
         
         return create_response('success', 'Crop recommendation completed', result)
     
@@ -73,7 +164,8 @@ def recommend_crop():
         return handle_errors(e)
 
 @app.route('/api/predict-yield', methods=['POST'])
-def predict_yield():
+@admission_control
+async def predict_yield():
     """Predict crop yield based on farm conditions"""
     try:
         data = request.get_json()
@@ -82,10 +174,11 @@ def predict_yield():
         required_fields = ['N', 'P', 'K', 'Soil_pH', 'Temperature', 'Humidity', 
                           'Rainfall', 'Crop_Type', 'Irrigation_Type']
         if not validate_input_data(data, required_fields):
-            return create_response('error', 'Missing required fields for yield prediction', 400)
+            return create_response('error', 'Missing required fields for yield prediction', status_code=400)
         
         # Get prediction
-        result = yield_service.predict_yield(data)
+        result = await run_inference(services.get('yield').predict_yield, data,
+                                     explain=bool(data.get('explain', True)))
         
         return create_response('success', 'Yield prediction completed', result)
     
@@ -93,7 +186,7 @@ def predict_yield():
         return handle_errors(e)
 
 @app.route('/api/calculate-efficiency', methods=['POST'])
-def calculate_efficiency():
+async def calculate_efficiency():
     """Calculate farm efficiency metrics"""
     try:
         data = request.get_json()
@@ -102,24 +195,29 @@ def calculate_efficiency():
         required_fields = ['farm_area', 'fertilizer_used', 'pesticide_used', 
                           'water_usage', 'yield']
         if not validate_input_data(data, required_fields):
-            return create_response('error', 'Missing required fields for efficiency calculation', 400)
+            return create_response('error', 'Missing required fields for efficiency calculation', status_code=400)
         
         # Get efficiency metrics
-        result = efficiency_service.calculate_efficiency(data)
+        result = services.get('efficiency').calculate_efficiency(data)
         
         return create_response('success', 'Efficiency calculation completed', result)
     
     except Exception as e:
         return handle_errors(e)
 
+def price_data_version():
+    price_service = services.get('price')
+    return {'price_data': (price_service.data_version, price_service.data_updated_at)}
+
 @app.route('/api/market-price', methods=['GET'])
-def get_market_price():
+@conditional(price_data_version)
+async def get_market_price():
     """Get current market prices for crops"""
     try:
         crop_name = request.args.get('crop')
         
         # Get price data
-        result = price_service.get_market_price(crop_name)
+        result = services.get('price').get_market_price(crop_name)
         
         return create_response('success', 'Market price data retrieved', result)
     
@@ -127,7 +225,7 @@ def get_market_price():
         return handle_errors(e)
 
 @app.route('/api/predict-revenue', methods=['POST'])
-def predict_revenue():
+async def predict_revenue():
     """Predict revenue based on yield and market prices"""
     try:
         data = request.get_json()
@@ -135,10 +233,10 @@ def predict_revenue():
         # Validate input
         required_fields = ['crop_type', 'predicted_yield', 'farm_area']
         if not validate_input_data(data, required_fields):
-            return create_response('error', 'Missing required fields for revenue prediction', 400)
+            return create_response('error', 'Missing required fields for revenue prediction', status_code=400)
         
         # Get revenue prediction
-        result = price_service.predict_revenue(data)
+        result = services.get('price').predict_revenue(data)
         
         return create_response('success', 'Revenue prediction completed', result)
     
@@ -146,152 +244,83 @@ def predict_revenue():
         return handle_errors(e)
 
 @app.route('/api/farmer-workflow', methods=['POST'])
-def farmer_workflow():
+@admission_control
+async def farmer_workflow():
     """Complete workflow for farmer - recommendation, yield, revenue, efficiency"""
     try:
         data = request.get_json()
         
-        # Validate comprehensive input
-        required_fields = ['temperature', 'humidity', 'ph', 'rainfall', 
-                          'farm_area', 'fertilizer_used', 'pesticide_used', 
-                          'water_usage']
-        if not validate_input_data(data, required_fields):
-            return create_response('error', 'Missing required fields for farmer workflow', 400)
-        
-        # Step 1: Crop Recommendation
-        crop_data = {
-            'temperature': data['temperature'],
-            'humidity': data['humidity'],
-            'ph': data['ph'],
-            'rainfall': data['rainfall']
-        }
-        crop_recommendation = crop_service.recommend_crop(crop_data)
-        recommended_crop = crop_recommendation['recommended_crop']
+        error = validate_workflow_request(data)
+        if error is not None:
+            return error
+        engine = services.get('workflow')
+        try:
+            sections, targets, extras = workflow_fields(engine, data)
+        except (TypeError, ValueError) as e:
+            return create_response('error', f'Invalid fields: {e}', status_code=400)
         
-        # Step 2: Yield Prediction (using recommended crop)
-        yield_data = {
-            'N': data.get('N', 50),
-            'P': data.get('P', 50),
-            'K': data.get('K', 50),
-            'Soil_pH': data['ph'],
-            'Temperature': data['temperature'],
-            'Humidity': data['humidity'],
-            'Rainfall': data['rainfall'],
-            'Crop_Type': recommended_crop,
-            'Irrigation_Type': data.get('irrigation_type', 'Canal'),
-            'Fertilizer_Used': data['fertilizer_used'],
-            'Pesticide_Used': data['pesticide_used']
-        }
-        yield_prediction = yield_service.predict_yield(yield_data)
-        
-        # Step 3: Revenue Prediction
-        revenue_data = {
-            'crop_type': recommended_crop,
-            'predicted_yield': yield_prediction['predicted_yield'],
-            'farm_area': data['farm_area']
-        }
-        revenue_prediction = price_service.predict_revenue(revenue_data)
-        
-        # Step 4: Efficiency Calculation
-        efficiency_data = {
-            'farm_area': data['farm_area'],
-            'fertilizer_used': data['fertilizer_used'],
-            'pesticide_used': data['pesticide_used'],
-            'water_usage': data['water_usage'],
-            'yield': yield_prediction['predicted_yield']
-        }
-        efficiency_metrics = efficiency_service.calculate_efficiency(efficiency_data)
+        # Crop -> (yield, candidate prices) -> (revenue, efficiency) -> insights
+        workflow = await engine.run(data, targets=targets, extras=extras)
+        results = workflow['results']
         
-        # Step 5: Generate Insights
-        insights = generate_insights(crop_recommendation, yield_prediction, 
-                                    revenue_prediction, efficiency_metrics)
-        
-        # Compile complete workflow result
+        # Compile workflow result from the requested sections
         workflow_result = {
-            'recommended_crop': crop_recommendation,
-            'yield_prediction': yield_prediction,
-            'revenue_prediction': revenue_prediction,
-            'efficiency_metrics': efficiency_metrics,
-            'insights': insights,
-            'timestamp': datetime.now().isoformat()
+            section: workflow['timings'] if stage is None else results[stage]
+            for section, stage in SECTIONS.items() if section in sections
         }
+        workflow_result['timestamp'] = datetime.now().isoformat()
         
         return create_response('success', 'Farmer workflow completed successfully', workflow_result)
     
     except Exception as e:
         return handle_errors(e)
 
-@app.route('/farms/<int:farm_id>', methods=['GET'])
-def get_farm(farm_id):
-    """Get farm details by ID"""
+@app.route('/api/farmer-workflow/stream', methods=['POST'])
+@admission_control
+async def farmer_workflow_stream():
+    """Farmer workflow as NDJSON: one line per section as soon as its stage finishes, then a summary line"""
     try:
-        from database import DatabaseManager
-        db = DatabaseManager()
-        
-        conn = sqlite3.connect(db.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT f.*, u.name as owner_name, u.email as owner_email
-            FROM farms f
-            JOIN users u ON f.user_id = u.id
-            WHERE f.id = ?
-        ''', (farm_id,))
-        
-        farm = cursor.fetchone()
-        conn.close()
-        
-        if not farm:
-            return create_response('error', 'Farm not found', 404)
-        
-        # Convert to dictionary
-        farm_columns = ['id', 'user_id', 'name', 'location', 'area_hectares', 
-                       'crop_type', 'soil_type', 'irrigation_type', 'status', 
-                       'created_at', 'updated_at', 'owner_name', 'owner_email']
-        
-        farm_dict = dict(zip(farm_columns, farm))
+        data = request.get_json()
         
-        return create_response('success', 'Farm retrieved successfully', farm_dict)
-    
-    except Exception as e:
-        return handle_errors(e)
-
-@app.route('/farms/<int:farm_id>/predictions', methods=['GET'])
-def get_farm_predictions(farm_id):
-    """Get prediction history for a farm"""
-    try:
-        from database import DatabaseManager
-        db = DatabaseManager()
-        
-        analyses = db.get_farm_analyses(farm_id)
-        
-        # Convert to list of dictionaries
-        prediction_columns = ['id', 'farm_id', 'analysis_type', 'temperature', 
-                              'humidity', 'ph', 'rainfall', 'nitrogen', 'phosphorus', 
-                              'potassium', 'organic_carbon', 'sunlight_hours', 
-                              'wind_speed', 'altitude', 'fertilizer_used', 
-                              'pesticide_used', 'season', 'region', 'predicted_yield', 
-                              'predicted_revenue', 'efficiency_score', 'recommendations', 
-                              'created_at']
-        
-        predictions = []
-        for analysis in analyses:
-            pred_dict = dict(zip(prediction_columns, analysis))
-            # Parse JSON recommendations
-            if pred_dict['recommendations']:
-                try:
-                    pred_dict['recommendations'] = json.loads(pred_dict['recommendations'])
-                except:
-                    pred_dict['recommendations'] = []
-            predictions.append(pred_dict)
-        
-        return create_response('success', 'Predictions retrieved successfully', predictions)
+        error = validate_workflow_request(data)
+        if error is not None:
+            return error
+        engine = services.get('workflow')
+        try:
+            sections, targets, extras = workflow_fields(engine, data)
+        except (TypeError, ValueError) as e:
+            return create_response('error', f'Invalid fields: {e}', status_code=400)
+        
+        section_of = {stage: section for section, stage in SECTIONS.items() if section in sections and stage}
+        
+        async def lines():
+            started = time.perf_counter()
+            timings = {}
+            try:
+                async for stage, result, timing in engine.stream(data, targets=targets, extras=extras):
+                    timings[stage] = timing
+                    if stage in section_of:
+                        yield {'section': section_of[stage], 'data': result, 'timing_ms': timing}
+            except Exception as e:
+                logger.error("Streamed workflow failed: %s", e, exc_info=True)
+                yield {'status': 'error', 'message': f'Internal server error: {e}'}
+                return
+            
+            timings['total_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            done = {'status': 'success', 'message': 'Farmer workflow completed successfully',
+                    'timestamp': datetime.now().isoformat()}
+            if 'stage_timings_ms' in sections:
+                done['stage_timings_ms'] = timings
+            yield done
+        
+        return ndjson_response(lines())
     
     except Exception as e:
         return handle_errors(e)
 
 @app.route('/predict', methods=['POST'])
-def predict():
+@admission_control
+async def predict():
     """Main prediction endpoint - receives farm input data and runs ML models"""
     try:
         data = request.get_json()
@@ -301,64 +330,24 @@ def predict():
                           'farm_area', 'fertilizer_used', 'pesticide_used', 
                           'water_usage']
         if not validate_input_data(data, required_fields):
-            return create_response('error', 'Missing required fields', 400)
+            return create_response('error', 'Missing required fields', status_code=400)
         
         # Get farm_id if provided
         farm_id = data.get('farm_id')
         
-        # Step 1: Crop Recommendation
-        crop_data = {
-            'temperature': data['temperature'],
-            'humidity': data['humidity'],
-            'ph': data['ph'],
-            'rainfall': data['rainfall']
-        }
-        crop_recommendation = crop_service.recommend_crop(crop_data)
-        recommended_crop = crop_recommendation['recommended_crop']
-        
-        # Step 2: Yield Prediction
-        yield_data = {
-            'N': data.get('N', 50),
-            'P': data.get('P', 50),
-            'K': data.get('K', 50),
-            'Soil_pH': data['ph'],
-            'Temperature': data['temperature'],
-            'Humidity': data['humidity'],
-            'Rainfall': data['rainfall'],
-            'Crop_Type': recommended_crop,
-            'Irrigation_Type': data.get('irrigation_type', 'Canal'),
-            'Fertilizer_Used': data['fertilizer_used'],
-            'Pesticide_Used': data['pesticide_used']
-        }
-        yield_prediction = yield_service.predict_yield(yield_data)
-        predicted_yield = yield_prediction['predicted_yield']
+        # Steps 1-4: crop, yield, revenue and efficiency (no insights needed here)
+        workflow = await services.get('workflow').run(data, targets=['revenue', 'efficiency'], extras={})
+        results = workflow['results']
         
-        # Step 3: Revenue Calculation
-        revenue_data = {
-            'crop_type': recommended_crop,
-            'predicted_yield': predicted_yield,
-            'farm_area': data['farm_area']
-        }
-        revenue_prediction = price_service.predict_revenue(revenue_data)
-        predicted_revenue = revenue_prediction['predicted_revenue']
-        
-        # Step 4: Efficiency Score Calculation
-        efficiency_data = {
-            'farm_area': data['farm_area'],
-            'fertilizer_used': data['fertilizer_used'],
-            'pesticide_used': data['pesticide_used'],
-            'water_usage': data['water_usage'],
-            'yield': predicted_yield
-        }
-        efficiency_metrics = efficiency_service.calculate_efficiency(efficiency_data)
-        efficiency_score = efficiency_metrics.get('final_efficiency_score', 0.5)
+        crop_recommendation = results['crop']
+        recommended_crop = crop_recommendation['recommended_crop']
+        predicted_yield = results['yield']['predicted_yield']
+        predicted_revenue = results['revenue'].get('gross_revenue_egp', 0)
+        efficiency_score = results['efficiency'].get('final_efficiency_score', 0.5)
         
         # Step 5: Save to database if farm_id provided
         prediction_id = None
         if farm_id:
-            from database import DatabaseManager
-            db = DatabaseManager()
-            
             analysis_data = {
                 'analysis_type': 'ml_prediction',
                 'temperature': data['temperature'],
@@ -378,7 +367,10 @@ def predict():
                 'region': data.get('region', 'Unknown')
             }
             
-            prediction_id = db.save_analysis(farm_id, analysis_data)
+            if analysis_writer is not None:
+                prediction_id = await run_io(analysis_writer.submit, farm_id, analysis_data)
+            else:
+                prediction_id = await run_io(save_analysis, farm_id, analysis_data)
         
         # Compile response
         result = {
@@ -390,6 +382,7 @@ def predict():
             'efficiency_score': efficiency_score,
             'crop_confidence': crop_recommendation.get('confidence', 0),
             'input_data': data,
+            'stage_timings_ms': workflow['timings'],
             'timestamp': datetime.now().isoformat()
         }
         
@@ -399,92 +392,41 @@ def predict():
         return handle_errors(e)
 
 @app.route('/dashboard/<int:farm_id>', methods=['GET'])
-def get_dashboard_data(farm_id):
+@conditional(lambda farm_id: get_data_versions([f'farm:{farm_id}', 'prices']))
+async def get_dashboard_data(farm_id):
     """Get dashboard data for a specific farm"""
     try:
-        from database import DatabaseManager
-        db = DatabaseManager()
-        
-        # Get farm details
-        conn = sqlite3.connect(db.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT f.*, u.name as owner_name
-            FROM farms f
-            JOIN users u ON f.user_id = u.id
-            WHERE f.id = ?
-        ''', (farm_id,))
-        
-        farm = cursor.fetchone()
+        # Farm details, last 10 predictions and price trends in one trip to the I/O pool
+        farm, recent_predictions, price_data = await run_io(load_dashboard_cached, farm_id)
         if not farm:
-            return create_response('error', 'Farm not found', 404)
+            return create_response('error', 'Farm not found', status_code=404)
         
         farm_columns = ['id', 'user_id', 'name', 'location', 'area_hectares', 
                        'crop_type', 'soil_type', 'irrigation_type', 'status', 
                        'created_at', 'updated_at', 'owner_name']
         farm_dict = dict(zip(farm_columns, farm))
         
-        # Get latest prediction
-        cursor.execute('''
-            SELECT * FROM farm_analyses 
-            WHERE farm_id = ? 
-            ORDER BY created_at DESC 
-            LIMIT 1
-        ''', (farm_id,))
-        
-        latest_prediction = cursor.fetchone()
-        latest_dict = None
-        if latest_prediction:
-            pred_columns = ['id', 'farm_id', 'analysis_type', 'temperature', 
-                           'humidity', 'ph', 'rainfall', 'nitrogen', 'phosphorus', 
-                           'potassium', 'organic_carbon', 'sunlight_hours', 
-                           'wind_speed', 'altitude', 'fertilizer_used', 
-                           'pesticide_used', 'season', 'region', 'predicted_yield', 
-                           'predicted_revenue', 'efficiency_score', 'recommendations', 
-                           'created_at']
-            latest_dict = dict(zip(pred_columns, latest_prediction))
-            if latest_dict['recommendations']:
-                try:
-                    latest_dict['recommendations'] = json.loads(latest_dict['recommendations'])
-                except:
-                    latest_dict['recommendations'] = []
-        
-        # Get prediction history (last 10)
-        cursor.execute('''
-            SELECT predicted_yield, predicted_revenue, efficiency_score, 
-                   recommended_crop, created_at
-            FROM farm_analyses
-            WHERE farm_id = ?
-            ORDER BY created_at DESC
-            LIMIT 10
-        ''', (farm_id,))
-        
-        history = cursor.fetchall()
-        history_columns = ['predicted_yield', 'predicted_revenue', 'efficiency_score', 
-                          'recommended_crop', 'created_at']
-        history_list = []
-        for h in history:
-            history_dict = dict(zip(history_columns, h))
-            history_list.append(history_dict)
+        # Latest prediction and history
+        latest_dict = recent_predictions[0] if recent_predictions else None
         
-        # Get market price trends
-        cursor.execute('''
-            SELECT crop, price_per_ton, date
-            FROM market_prices
-            ORDER BY date DESC
-            LIMIT 12
-        ''')
+        history_list = [
+            {
+                'predicted_yield': prediction['predicted_yield'],
+                'predicted_revenue': prediction['predicted_revenue'],
+                'efficiency_score': prediction['efficiency_score'],
+                'recommended_crop': prediction['recommendations'][0] if prediction['recommendations'] else None,
+                'created_at': prediction['created_at']
+            }
+            for prediction in recent_predictions
+        ]
         
-        price_data = cursor.fetchall()
+        # Market price trends
         price_columns = ['crop', 'price_per_ton', 'date']
         price_list = []
         for p in price_data:
             price_dict = dict(zip(price_columns, p))
             price_list.append(price_dict)
         
-        conn.close()
-        
         # Compile dashboard data
         dashboard_data = {
             'farm': farm_dict,
@@ -509,48 +451,107 @@ def get_dashboard_data(farm_id):
     except Exception as e:
         return handle_errors(e)
 
-def generate_insights(crop_rec, yield_pred, revenue_pred, efficiency):
-    """Generate actionable insights for farmer"""
-    insights = []
-    
-    # Crop insights
-    confidence = crop_rec.get('confidence', 0)
-    if confidence > 0.9:
-        insights.append(f"High confidence ({confidence:.1%}) in {crop_rec['recommended_crop']} recommendation")
-    
-    # Yield insights
-    predicted_yield = yield_pred.get('predicted_yield', 0)
-    if predicted_yield > 20:
-        insights.append("Excellent yield potential predicted")
-    elif predicted_yield > 10:
-        insights.append("Good yield potential predicted")
-    else:
-        insights.append("Consider optimizing inputs for better yield")
+@app.route('/api/batch', methods=['POST'])
+async def batch():
+    """Run several API requests in one round trip; answers are returned in request order"""
+    try:
+        try:
+            subrequests = parse_requests(request.get_json(silent=True), config.BATCH_MAX_REQUESTS)
+        except ValueError as e:
+            return create_response('error', f'Invalid batch: {e}', status_code=400)
+        
+        results = await run_batch(app, subrequests)
+        return create_response('success', 'Batch completed', {'responses': results})
     
-    # Revenue insights
-    revenue = revenue_pred.get('predicted_revenue', 0)
-    if revenue > 100000:
-        insights.append(f"High revenue potential: {revenue:,.0f} EGP")
+    except Exception as e:
+        return handle_errors(e)
+
+@app.route('/events', methods=['GET'])
+def event_stream():
+    """Server-sent events for ?topics=farm:<id>,... (served natively on the event loop under ASGI)"""
+    try:
+        stream = events.open_stream(request.args.get('topics'), request.headers.get('Last-Event-ID'))
+    except ValueError as e:
+        return create_response('error', str(e), status_code=400)
+    if stream is None:
+        # Every stream holds one of this worker's threads; poll until one frees up
+        poll = config.EVENTS_FALLBACK_POLL
+        response = create_response('error', 'Too many open event streams', {'poll_interval': poll}, status_code=503)
+        response.headers['Retry-After'] = str(poll)
+        return response
     
-    # Efficiency insights
-    efficiency_score = efficiency.get('final_efficiency_score', 0)
-    if efficiency_score > 0.7:
-        insights.append("Excellent farm efficiency score")
-    elif efficiency_score > 0.5:
-        insights.append("Good farm efficiency, room for improvement")
-    else:
-        insights.append("Consider optimizing resource usage")
+    response = Response(events.wsgi_stream(*stream), headers=events.STREAM_HEADERS)
+    # Also frees the slot when the response is closed before the stream starts
+    response.call_on_close(lambda: events.get_broker().unsubscribe(stream[0]))
+    return response
+
+def validate_workflow_request(data):
+    """400 response when a farmer-workflow body lacks required fields, else None"""
+    required_fields = ['temperature', 'humidity', 'ph', 'rainfall', 
+                      'farm_area', 'fertilizer_used', 'pesticide_used', 
+                      'water_usage']
+    if not validate_input_data(data, required_fields):
+        return create_response('error', 'Missing required fields for farmer workflow', status_code=400)
+    return None
+
+def workflow_fields(engine, data):
+    """Sections, stage targets and extras for ?fields=a,b.extra (or "fields" in the body)"""
+    fields = request.args.get('fields', data.get('fields'))
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    sections, targets, extras = select_fields(fields)
+    engine.resolve_extras(extras)
+    return sections, targets, extras
+
+def load_farm(farm_id, db=None):
+    """Farm row joined with its owner, or None"""
+    db = db or DatabaseManager()
+    conn = connect(db.db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT f.*, u.name as owner_name, u.email as owner_email
+            FROM farms f
+            JOIN users u ON f.user_id = u.id
+            WHERE f.id = ?
+        ''', (farm_id,))
+        return cursor.fetchone()
+    finally:
+        conn.close()
+
+def load_dashboard(farm_id):
+    """Farm row, recent predictions and price trends for the dashboard"""
+    db = DatabaseManager()
+    farm = load_farm(farm_id, db)
+    if not farm:
+        return None, [], []
     
-    # Resource optimization suggestions
-    water_eff = efficiency.get('water_efficiency', 0)
-    if water_eff < 0.5:
-        insights.append("Water usage efficiency is low - consider irrigation optimization")
+    recent_predictions = db.get_farm_predictions(farm_id, limit=10)
     
-    fertilizer_eff = efficiency.get('fertilizer_efficiency', 0)
-    if fertilizer_eff < 0.5:
-        insights.append("Fertilizer efficiency can be improved - consider soil testing")
+    conn = connect(db.db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT crop, price_per_ton, date
+            FROM market_prices
+            ORDER BY date DESC
+            LIMIT 12
+        ''')
+        price_data = cursor.fetchall()
+    finally:
+        conn.close()
     
-    return insights
+    return farm, recent_predictions, price_data
+
+def load_dashboard_cached(farm_id):
+    """load_dashboard through the cache, keyed by the farm's and the prices' data versions"""
+    versions = get_data_versions([f'farm:{farm_id}', 'prices'])
+    key = f"{farm_id}:{versions[f'farm:{farm_id}'][0]}:{versions['prices'][0]}"
+    return get_cache().get_or_set('dashboard', key, lambda: load_dashboard(farm_id))
+
+def save_analysis(farm_id, analysis_data):
+    """Persist an analysis synchronously"""
+    return DatabaseManager().save_analysis(farm_id, analysis_data)
 
 def validate_input_data(data, required_fields):
     """Validate that all required fields are present in input data"""
@@ -563,22 +564,6 @@ def validate_input_data(data, required_fields):
     
     return True
 
-def create_response(status, message, data=None, status_code=200):
-    """Create standardized API response"""
-    response = {
-        'status': status,
-        'message': message
-    }
-    
-    if data is not None:
-        response['data'] = data
-    
-    return jsonify(response), status_code
-
-def handle_errors(error):
-    """Handle and format errors consistently"""
-    print(f"API Error: {str(error)}")
-    return create_response('error', f'Internal server error: {str(error)}', 500)
-
 if __name__ == '__main__':
+    start_warmup()
     app.run(debug=True, host='0.0.0.0', port=5000)
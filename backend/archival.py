@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Archival and compaction for farm analysis history
+
+Analyses older than ARCHIVE_MAX_AGE_DAYS are moved out of the hot database
+into one SQLite file per year under ARCHIVE_PATH. Years that can no longer
+receive rows are vacuumed and gzip-compressed. Archives are attached only
+when something asks for archived history. Rollups are never touched by
+archival, and rebuild_rollups() folds the archives back in so a rebuild
+does not lose archived buckets.
+
+Compressed years are read from copies extracted once per process (see
+ArchiveExtracts) and reused until the .gz file changes. Request handlers
+share one archiver from get_archiver().
+"""
+
+import atexit
+import logging
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from config import get_config
+from database import DatabaseManager, ANALYSIS_COLUMNS, connect
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single worker assumed
+    fcntl = None
+
+
+class ArchiveExtracts:
+    """
+    Decompressed copies of .gz archives, shared by every archiver in the process
+
+    Each copy is keyed by the compressed file's path and mtime, so it is
+    extracted once and extracted again only after the archive is rewritten.
+    The directory is removed when the process exits. A forked worker starts
+    its own directory instead of using its parent's.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dir = None
+        self._pid = None
+        self._paths = {}  # compressed path -> (mtime_ns, extracted path)
+
+    def get(self, compressed):
+        """Extracted copy of a compressed archive"""
+        mtime = os.stat(compressed).st_mtime_ns
+        with self._lock:
+            if self._pid != os.getpid():
+                self._dir = tempfile.mkdtemp(prefix='analysis-archive-')
+                self._pid = os.getpid()
+                self._paths = {}
+                atexit.register(self.remove)
+            cached = self._paths.get(compressed)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+            name = os.path.basename(compressed)[:-len('.gz')]
+            extracted = os.path.join(self._dir, f'{mtime}-{name}')
+            with gzip.open(compressed, 'rb') as source, open(extracted + '.tmp', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.replace(extracted + '.tmp', extracted)
+            if cached is not None:
+                # Readers that still have it open keep their handle
+                os.remove(cached[1])
+            self._paths[compressed] = (mtime, extracted)
+            return extracted
+
+    def remove(self):
+        """Delete this process's extracted copies"""
+        with self._lock:
+            if self._dir is not None and self._pid == os.getpid():
+                shutil.rmtree(self._dir, ignore_errors=True)
+                self._dir = None
+                self._pid = None
+                self._paths = {}
+
+
+_extracts = ArchiveExtracts()
+
+
+class AnalysisArchiver:
+    def __init__(self, db_manager=None, archive_dir=None, max_age_days=None, vacuum_mode=None):
+        config = get_config()
+        self.db = db_manager or DatabaseManager()
+        self.archive_dir = archive_dir or config.ARCHIVE_PATH
+        self.max_age_days = max_age_days if max_age_days is not None else config.ARCHIVE_MAX_AGE_DAYS
+        self.vacuum_mode = vacuum_mode or config.ARCHIVE_VACUUM_MODE
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------ paths
+
+    def archive_path(self, year):
+        """Uncompressed archive file for a year"""
+        return os.path.join(self.archive_dir, f'farm_analyses_{year}.db')
+
+    def archived_years(self):
+        """Years that have an archive, compressed or not"""
+        years = set()
+        for name in os.listdir(self.archive_dir):
+            if name.startswith('farm_analyses_') and (name.endswith('.db') or name.endswith('.db.gz')):
+                year = name[len('farm_analyses_'):].split('.')[0]
+                if year.isdigit():
+                    years.add(int(year))
+        return sorted(years)
+
+    def _readable_path(self, year):
+        """Path of a year's archive that SQLite can open, extracting it if compressed"""
+        path = self.archive_path(year)
+        if os.path.exists(path):
+            return path
+
+        compressed = path + '.gz'
+        if not os.path.exists(compressed):
+            return None
+        return _extracts.get(compressed)
+
+    def _writable_path(self, year):
+        """Path of a year's archive for writing, decompressing it in place if needed"""
+        path = self.archive_path(year)
+        compressed = path + '.gz'
+        if not os.path.exists(path) and os.path.exists(compressed):
+            with gzip.open(compressed, 'rb') as source, open(path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(compressed)
+        return path
+
+    # --------------------------------------------------------------- archival
+
+    def run(self):
+        """
+        Archive old analyses, compress closed years and compact the hot database
+
+        Returns:
+            Dictionary with the number of analyses moved per year
+        """
+        with self._exclusive() as acquired:
+            if not acquired:
+                logger.info("Archival already running in another process")
+                return {'skipped': True}
+
+            cutoff = (datetime.utcnow() - timedelta(days=self.max_age_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+            conn = connect(self.db.db_path)
+            years = [int(row[0]) for row in conn.execute('''
+                SELECT DISTINCT strftime('%Y', created_at) FROM farm_analyses
+                WHERE created_at < ? AND created_at IS NOT NULL
+            ''', (cutoff,)) if row[0]]
+            conn.close()
+
+            moved = {}
+            for year in years:
+                moved[year] = self._archive_year(year, cutoff)
+
+            # A year before the cutoff's year can never receive new rows
+            cutoff_year = int(cutoff[:4])
+            for year in self.archived_years():
+                if year < cutoff_year:
+                    self._compress(year)
+
+            if moved:
+                self.compact()
+
+            total = sum(moved.values())
+            logger.info("Archived %d analyses older than %s", total, cutoff)
+            return {'cutoff': cutoff, 'moved': moved, 'total': total}
+
+    def _archive_year(self, year, cutoff):
+        """Move one year's old analyses and their recommendations in a single transaction"""
+        conn = connect(self.db.db_path)
+        cursor = conn.cursor()
+        condition = "created_at < ? AND strftime('%Y', created_at) = ?"
+        params = (cutoff, str(year))
+
+        try:
+            cursor.execute('ATTACH DATABASE ? AS archive', (self._writable_path(year),))
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS archive.farm_analyses AS
+                SELECT * FROM main.farm_analyses WHERE 0
+            ''')
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_archived_analyses_id
+                ON farm_analyses (id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS archive.idx_archived_analyses_farm
+                ON farm_analyses (farm_id, created_at)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS archive.analysis_recommendations AS
+                SELECT * FROM main.analysis_recommendations WHERE 0
+            ''')
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_archived_recommendations
+                ON analysis_recommendations (analysis_id, rank)
+            ''')
+            conn.commit()
+
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO archive.farm_analyses
+                SELECT * FROM main.farm_analyses WHERE {condition}
+            ''', params)
+            moved = cursor.rowcount
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO archive.analysis_recommendations
+                SELECT * FROM main.analysis_recommendations
+                WHERE analysis_id IN (SELECT id FROM main.farm_analyses WHERE {condition})
+            ''', params)
+            cursor.execute(f'''
+                DELETE FROM main.analysis_recommendations
+                WHERE analysis_id IN (SELECT id FROM main.farm_analyses WHERE {condition})
+            ''', params)
+            cursor.execute(f'DELETE FROM main.farm_analyses WHERE {condition}', params)
+            conn.commit()
+        finally:
+            conn.close()
+
+        return moved
+
+    def _compress(self, year):
+        """Vacuum a closed year's archive and gzip it"""
+        path = self.archive_path(year)
+        if not os.path.exists(path):
+            return
+
+        conn = connect(path)
+        conn.execute('VACUUM')
+        conn.close()
+
+        with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.remove(path)
+
+    def compact(self):
+        """Return freed pages from the hot database to the filesystem"""
+        conn = connect(self.db.db_path, isolation_level=None)
+        try:
+            auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+            if self.vacuum_mode == 'incremental':
+                if auto_vacuum != 2:
+                    # One full VACUUM is needed to switch the file to incremental mode
+                    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                    conn.execute('VACUUM')
+                else:
+                    conn.execute('PRAGMA incremental_vacuum')
+            else:
+                conn.execute('VACUUM')
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _exclusive(self):
+        """Cross-process lock so only one worker archives at a time"""
+        if fcntl is None:
+            yield True
+            return
+
+        with open(os.path.join(self.archive_dir, '.archive.lock'), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ------------------------------------------------------------------ reads
+
+    def get_archived_predictions(self, farm_id, years=None):
+        """Archived analyses for a farm, newest first, attaching year files on demand"""
+        predictions = []
+        for year in sorted(years or self.archived_years(), reverse=True):
+            path = self._readable_path(year)
+            if path is None:
+                continue
+
+            conn = connect(path)
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f'''
+                    SELECT {', '.join(ANALYSIS_COLUMNS)} FROM farm_analyses
+                    WHERE farm_id = ?
+                    ORDER BY created_at DESC
+                ''', (farm_id,))
+                predictions.extend(self.db._with_recommendations(cursor, cursor.fetchall()))
+            finally:
+                conn.close()
+
+        return predictions
+
+    def rebuild_rollups(self):
+        """Rebuild rollups from the hot table plus every archived year"""
+        archived_rows = []
+        for year in self.archived_years():
+            conn = connect(self._readable_path(year))
+            try:
+                for select in self.db.rollup_selects():
+                    archived_rows.extend(conn.execute(select).fetchall())
+            finally:
+                conn.close()
+
+        self.db.rebuild_rollups(extra_rows=archived_rows)
+
+
+_archiver = None
+_archiver_lock = threading.Lock()
+
+
+def get_archiver() -> AnalysisArchiver:
+    """The process's archiver for the default database, built on first use"""
+    global _archiver
+    if _archiver is None:
+        with _archiver_lock:
+            if _archiver is None:
+                _archiver = AnalysisArchiver()
+    return _archiver
+
+
+class ArchiveScheduler:
+    """Runs the archiver periodically on a daemon thread"""
+
+    def __init__(self, archiver, interval_hours):
+        self.archiver = archiver
+        self.interval = interval_hours * 3600
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='analysis-archiver', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.archiver.run()
+            except Exception as e:
+                logger.error("Scheduled archival failed: %s", e, exc_info=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old farm analyses and compact the database')
+    parser.add_argument('--db', default='agricultural_platform.db', help='Hot database path')
+    parser.add_argument('--max-age-days', type=int, help='Archive analyses older than this')
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help='Rebuild rollups from the hot table and all archives')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    archiver = AnalysisArchiver(DatabaseManager(args.db), max_age_days=args.max_age_days)
+    if args.rebuild_rollups:
+        archiver.rebuild_rollups()
+        print("✅ Rollups rebuilt")
+    else:
+        print(archiver.run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+ASGI entry point for AI Agricultural Platform Backend
+
+    SERVER_MODE=asgi python run.py
+    PROMETHEUS_MULTIPROC_DIR=$(mktemp -d) uvicorn asgi:application --workers 4
+
+run.py sets up PROMETHEUS_MULTIPROC_DIR itself. uvicorn's own --workers
+spawns fresh processes that share nothing, so it must be set (to an empty
+directory) before uvicorn starts, or /metrics only reports whichever worker
+answers the scrape. The Flask app is wrapped with asgiref,
+and each request runs its WSGI call on a thread of the request pool
+(ASGI_REQUEST_THREADS). Flask calls an async view through asgiref's
+async_to_sync, which schedules the coroutine on the server's event loop,
+but the pool thread stays blocked until the view returns. Async views
+therefore give no more concurrency than ASGI_REQUEST_THREADS. What they
+buy is overlapping the inference and database calls of one request on the
+pools in executors.py. Only GET /events is served on the loop without a
+pool thread.
+
+The pool is swapped in by overriding WsgiToAsgiInstance.run_wsgi_app, which
+is not public API; requirements.txt pins the asgiref version this was
+written against.
+"""
+
+import logging
+import multiprocessing
+import os
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+import events
+from app import app, start_warmup
+from executors import request_executor
+
+logger = logging.getLogger(__name__)
+
+if multiprocessing.parent_process() is not None and not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    # Spawned by uvicorn --workers: every worker would report only its own samples
+    logger.warning("PROMETHEUS_MULTIPROC_DIR is not set; /metrics covers only the worker that answers. "
+                   "Set it to an empty directory before starting uvicorn, or use SERVER_MODE=asgi python run.py")
+
+
+# The undecorated WSGI runner behind asgiref's sync_to_async wrapper
+try:
+    _run_wsgi_app = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+except (KeyError, AttributeError):
+    raise ImportError('This asgiref version does not wrap WsgiToAsgiInstance.run_wsgi_app '
+                      'with sync_to_async; install the version pinned in requirements.txt')
+
+
+class _PooledInstance(WsgiToAsgiInstance):
+    async def run_wsgi_app(self, body):
+        # asgiref runs every WSGI call on one shared thread by default, which
+        # would serialize all requests; run them on a bounded pool instead
+        run = sync_to_async(_run_wsgi_app, thread_sensitive=False,
+                            executor=request_executor())
+        return await run(self, body)
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == '/events' and scope['method'] == 'GET':
+            # Long-lived and mostly idle: answered on the loop rather than holding a pool thread
+            await events.serve_asgi(scope, receive, send)
+            return
+        await _PooledInstance(self.wsgi_application)(scope, receive, send)
+
+
+application = PooledWsgiToAsgi(app)
+
+# No-op when run.py already warmed up before forking; `uvicorn asgi:application` warms up here
+start_warmup()
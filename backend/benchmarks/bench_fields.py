@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Field selection benchmark for POST /api/farmer-workflow
+
+Sends the same farm input through the app with different `fields`
+selections - the full response, the handful of numbers most callers read,
+and the summary plus SHAP explanations - and reports latency percentiles
+and body size for each. Requests go through the Flask test client, so the
+figures include routing, the workflow and serialization but no network.
+The services are warmed up first so model loading is not counted.
+
+    python benchmarks/bench_fields.py --iterations 200
+    python benchmarks/bench_fields.py --fields full=  --fields mine=insights,revenue_prediction
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# One client in a loop: keep the rate limiter, the startup warmup thread and
+# per-request log lines out of the measurement
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+os.environ.setdefault('WARMUP_ENABLED', 'false')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from bench_predict import PREDICT_BODY
+
+SELECTIONS = {
+    'full': None,
+    'summary': 'recommended_crop,yield_prediction,revenue_prediction,efficiency_metrics',
+    'summary+explanations': 'recommended_crop,yield_prediction.feature_explanations,'
+                            'revenue_prediction,efficiency_metrics',
+    'insights': 'insights'
+}
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def measure(client, fields, iterations):
+    """Latencies in milliseconds and the body size for one selection"""
+    url = '/api/farmer-workflow' + (f'?fields={fields}' if fields else '')
+    latencies = []
+    size = 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = client.post(url, data=PREDICT_BODY, content_type='application/json')
+        body = response.get_data()
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}: {body[:200]!r}")
+        size = len(body)
+    return latencies, size
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /api/farmer-workflow with and without field selection')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--fields', action='append', default=[], metavar='NAME=FIELDS',
+                        help='Extra selection to measure (empty FIELDS for the full response)')
+    args = parser.parse_args()
+
+    selections = dict(SELECTIONS)
+    for option in args.fields:
+        name, _, fields = option.partition('=')
+        selections[name] = fields or None
+
+    from app import app, warmup
+    warmup.run()
+    client = app.test_client()
+
+    report = {'iterations': args.iterations, 'warmup': warmup.status()['services'], 'selections': {}}
+    for name, fields in selections.items():
+        measure(client, fields, max(1, args.iterations // 10))
+        latencies, size = measure(client, fields, args.iterations)
+        row = {
+            'fields': fields,
+            'bytes': size,
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3)
+        }
+        report['selections'][name] = row
+
+    full = report['selections'].get('full')
+    for name, row in report['selections'].items():
+        if full and name != 'full':
+            row['p50_vs_full'] = round(row['p50_ms'] / full['p50_ms'], 3)
+        print(f"{name:>22}: p50 {row['p50_ms']:8.3f} ms  p95 {row['p95_ms']:8.3f} ms  "
+              f"{row['bytes']:>7} B" + (f"  ({row['p50_vs_full']:.2f}x full)" if 'p50_vs_full' in row else ''))
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for POST /predict
+
+Starts run.py in the requested server mode on a free port, drives it with
+concurrent keep-alive clients for a fixed duration and reports requests per
+second and latency percentiles. With --read-clients, extra clients poll the
+cheap GET /api/market-price alongside the /predict load, to show whether
+reads stay fast while inference is busy.
+
+    python benchmarks/bench_predict.py --mode development
+    python benchmarks/bench_predict.py --mode production --concurrency 16
+    python benchmarks/bench_predict.py --mode asgi --read-clients 2
+"""
+
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PREDICT_BODY = json.dumps({
+    'temperature': 25.5,
+    'humidity': 65,
+    'ph': 6.8,
+    'rainfall': 120,
+    'farm_area': 50,
+    'fertilizer_used': 5,
+    'pesticide_used': 2,
+    'water_usage': 50000
+})
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(mode, port, extra_env):
+    # The benchmark is one client hammering the server, which the rate limiter would reject
+    env = dict(os.environ, SERVER_MODE=mode, PORT=str(port), HOST='127.0.0.1',
+               RATE_LIMIT_ENABLED='false', **extra_env)
+    if mode == 'development':
+        env.setdefault('FLASK_ENV', 'development')
+    process = subprocess.Popen(
+        [sys.executable, 'run.py'],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.25)
+    
+    stop_server(process)
+    raise RuntimeError(f"{mode} server did not start on port {port}")
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+PREDICT_REQUEST = ('POST', '/predict', PREDICT_BODY)
+READ_REQUEST = ('GET', '/api/market-price?crop=Wheat', None)
+
+def drive(port, concurrency, duration, warmup, target=PREDICT_REQUEST):
+    latencies = []
+    errors = [0]
+    reconnects = [0]
+    lock = threading.Lock()
+    start_at = time.time() + warmup
+    stop_at = start_at + duration
+    
+    method, path, body = target
+    headers = {'Content-Type': 'application/json'} if body else {}
+    
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        local_errors = 0
+        local_reconnects = 0
+        fresh = True
+        while True:
+            began = time.perf_counter()
+            now = time.time()
+            if now >= stop_at:
+                break
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+                fresh = False
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                if not fresh:
+                    # Server closed an idle keep-alive connection (e.g. worker recycled)
+                    local_reconnects += 1
+                    fresh = True
+                    continue
+                ok = False
+            if now >= start_at:
+                if ok:
+                    local.append(time.perf_counter() - began)
+                else:
+                    local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+            reconnects[0] += local_reconnects
+    
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else None
+    
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'reconnects': reconnects[0],
+        'requests_per_second': len(latencies) / duration,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark POST /predict throughput')
+    parser.add_argument('--mode', choices=['development', 'production', 'asgi'], action='append',
+                        help='Server mode(s) to benchmark (default: both)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Unmeasured seconds first')
+    parser.add_argument('--read-clients', type=int, default=0,
+                        help='Clients polling GET /api/market-price during the /predict load')
+    args = parser.parse_args()
+    
+    results = {}
+    for mode in args.mode or ['development', 'production']:
+        port = free_port()
+        process = start_server(mode, port, {})
+        reads = {}
+        reader = None
+        if args.read_clients:
+            def run_reads():
+                reads.update(drive(port, args.read_clients, args.duration, args.warmup, READ_REQUEST))
+            reader = threading.Thread(target=run_reads)
+            reader.start()
+        try:
+            results[mode] = drive(port, args.concurrency, args.duration, args.warmup)
+            if reader is not None:
+                reader.join()
+                results[mode]['market_price_reads'] = reads
+        finally:
+            stop_server(process)
+        print(f"{mode:>12}: {results[mode]['requests_per_second']:8.1f} req/s  "
+              f"p50 {results[mode]['p50_ms']:.1f} ms  p95 {results[mode]['p95_ms']:.1f} ms  "
+              f"errors {results[mode]['errors']}")
+        if reads:
+            print(f"{'reads':>12}: {reads['requests_per_second']:8.1f} req/s  "
+                  f"p50 {reads['p50_ms']:.1f} ms  p95 {reads['p95_ms']:.1f} ms  "
+                  f"errors {reads['errors']}")
+    
+    print(json.dumps({'cpu_count': os.cpu_count(), 'concurrency': args.concurrency,
+                      'duration_s': args.duration, 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
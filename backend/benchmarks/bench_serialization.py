@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark for the largest API responses
+
+Compares Flask's stock jsonify with utils.responses on the all-crops market
+price listing, the full farmer-workflow payload and a 200-row predictions
+list. Reports body bytes (raw, gzip, brotli) and CPU time per response.
+
+    python benchmarks/bench_serialization.py --iterations 500
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from flask import Flask, jsonify
+
+from database import DatabaseManager
+from services.crop_recommendation import CropRecommendationService
+from services.farm_efficiency import FarmEfficiencyService
+from services.market_price import MarketPriceService
+from services.workflow import WorkflowEngine
+from services.yield_prediction import YieldPredictionService
+from utils import responses
+
+WORKFLOW_INPUT = {
+    'temperature': 25.5,
+    'humidity': 65,
+    'ph': 6.8,
+    'rainfall': 120,
+    'farm_area': 50,
+    'fertilizer_used': 5,
+    'pesticide_used': 2,
+    'water_usage': 50000
+}
+
+def build_payloads():
+    """Representative response envelopes, built by the real services"""
+    price_service = MarketPriceService()
+    engine = WorkflowEngine(CropRecommendationService(), YieldPredictionService(),
+                            price_service, FarmEfficiencyService())
+    workflow = engine.run_sync(WORKFLOW_INPUT)
+    results = workflow['results']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        analysis = dict(WORKFLOW_INPUT, analysis_type='ml_prediction', nitrogen=50, phosphorus=50,
+                        potassium=50, predicted_yield=4.2, predicted_revenue=126000.0,
+                        efficiency_score=0.61, recommendations=['wheat'], season='Winter',
+                        region='Delta')
+        db.save_analyses([(None, 1, analysis) for _ in range(200)])
+        predictions = db.get_farm_predictions(1)
+
+    def envelope(data):
+        return {'status': 'success', 'message': 'ok', 'data': data}
+
+    return {
+        'market_price_all': envelope(price_service.get_market_price(None)),
+        'farmer_workflow': envelope({
+            'recommended_crop': results['crop'],
+            'yield_prediction': results['yield'],
+            'revenue_prediction': results['revenue'],
+            'efficiency_metrics': results['efficiency'],
+            'market_prices': results['prices'],
+            'insights': results['insights'],
+            'stage_timings_ms': workflow['timings']
+        }),
+        'farm_predictions_200': envelope(predictions)
+    }
+
+def cpu_per_call(func, iterations):
+    """Mean CPU microseconds per call"""
+    started = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - started) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark response serialization and compression')
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    payloads = build_payloads()
+    report = {'encoder': 'orjson' if responses.orjson is not None else 'json',
+              'brotli': responses.brotli is not None, 'payloads': {}}
+
+    with app.app_context():
+        for name, payload in payloads.items():
+            before = jsonify(payload).get_data()
+            after = responses.dumps(payload)
+            assert json.loads(before) == json.loads(after)
+
+            row = {
+                'jsonify_bytes': len(before),
+                'jsonify_us': cpu_per_call(lambda: jsonify(payload).get_data(), args.iterations),
+                'dumps_bytes': len(after),
+                'dumps_us': cpu_per_call(lambda: responses.dumps(payload), args.iterations),
+                'gzip_bytes': len(responses.compress(after, 'gzip')),
+                'gzip_us': cpu_per_call(lambda: responses.compress(after, 'gzip'), args.iterations)
+            }
+            if responses.brotli is not None:
+                row['br_bytes'] = len(responses.compress(after, 'br'))
+                row['br_us'] = cpu_per_call(lambda: responses.compress(after, 'br'), args.iterations)
+            report['payloads'][name] = row
+
+            print(f"{name:>22}: jsonify {row['jsonify_bytes']:>7} B {row['jsonify_us']:8.1f} us | "
+                  f"dumps {row['dumps_bytes']:>7} B {row['dumps_us']:7.1f} us | "
+                  f"gzip {row['gzip_bytes']:>6} B {row['gzip_us']:7.1f} us"
+                  + (f" | br {row['br_bytes']:>6} B {row['br_us']:7.1f} us" if 'br_bytes' in row else ''))
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark
+
+Reports how long `import app` takes, broken down by module from
+`python -X importtime`, and the time from launching run.py until the first
+successful POST /predict (which includes building the services it needs).
+Each figure is the median of --runs fresh processes and is checked against a
+budget; the exit status is 1 when a budget is exceeded, so CI can track it.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --mode production --budget-first-predict 15
+"""
+
+import argparse
+import http.client
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from bench_predict import PREDICT_BODY, free_port, stop_server
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('pandas', 'numpy', 'sklearn', 'xgboost', 'shap', 'joblib', 'scipy')
+
+_IMPORTTIME = re.compile(r'^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)\s*$')
+
+def import_breakdown():
+    """
+    Import `app` in a fresh interpreter under -X importtime
+
+    Returns:
+        (total_seconds, {module: cumulative_seconds}) for modules imported
+        directly by app and for the heavy libraries wherever they appear
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-W', 'ignore', '-c', 'import app'],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    # Children are listed before their parent, so collect until the top-level line
+    pending = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        seconds = int(cumulative) / 1e6
+        depth = (len(indent) - 1) // 2
+        if depth == 0:
+            if name == 'app':
+                return seconds, pending
+            pending = {}  # interpreter startup imports
+        elif depth == 1 or name in HEAVY_MODULES:
+            # Count a module once, where it is first imported
+            pending.setdefault(name, seconds)
+    raise RuntimeError('app import not found in -X importtime output')
+
+def first_predict(mode):
+    """Seconds from launching run.py to the first 200 from /predict, and to the first 200 from /"""
+    port = free_port()
+    env = dict(os.environ, SERVER_MODE=mode, PORT=str(port), HOST='127.0.0.1', RATE_LIMIT_ENABLED='false')
+    if mode == 'development':
+        env.setdefault('FLASK_ENV', 'development')
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, 'run.py'],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    listening = None
+    try:
+        deadline = time.time() + 180
+        while time.time() < deadline:
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                if listening is None:
+                    connection.request('GET', '/')
+                    if connection.getresponse().status == 200:
+                        listening = time.perf_counter() - started
+                    continue
+                connection.request('POST', '/predict', body=PREDICT_BODY,
+                                   headers={'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                if response.status == 200:
+                    return time.perf_counter() - started, listening
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError(f"{mode} server did not answer /predict")
+    finally:
+        stop_server(process)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark app import and time to first /predict')
+    parser.add_argument('--mode', choices=['development', 'production', 'asgi'], default='development')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15, help='Slowest modules to list')
+    parser.add_argument('--budget-import', type=float, default=1.0, help='Seconds allowed for import app')
+    parser.add_argument('--budget-first-predict', type=float, default=10.0,
+                        help='Seconds allowed from launch to the first successful /predict')
+    args = parser.parse_args()
+
+    imports = [import_breakdown() for _ in range(args.runs)]
+    import_total = statistics.median(total for total, _ in imports)
+    per_module = {}
+    for _, modules in imports:
+        for name, seconds in modules.items():
+            per_module.setdefault(name, []).append(seconds)
+    per_module = {name: statistics.median(values) for name, values in per_module.items()}
+    slowest = sorted(per_module.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    print(f"import app: {import_total * 1000:.0f} ms (budget {args.budget_import * 1000:.0f} ms)")
+    for name, seconds in slowest:
+        print(f"  {name:<40} {seconds * 1000:8.1f} ms")
+    heavy = sorted(name for name in HEAVY_MODULES if name in per_module)
+    print(f"heavy libraries imported by app: {', '.join(heavy) or 'none'}")
+
+    runs = [first_predict(args.mode) for _ in range(args.runs)]
+    predict_total = statistics.median(total for total, _ in runs)
+    listening = statistics.median(ready for _, ready in runs)
+    print(f"{args.mode}: serving after {listening:.2f} s, first /predict after {predict_total:.2f} s "
+          f"(budget {args.budget_first_predict:.2f} s)")
+
+    report = {
+        'mode': args.mode,
+        'runs': args.runs,
+        'import_seconds': round(import_total, 4),
+        'import_modules_ms': {name: round(seconds * 1000, 1) for name, seconds in slowest},
+        'heavy_modules_at_import': heavy,
+        'serving_seconds': round(listening, 3),
+        'first_predict_seconds': round(predict_total, 3),
+        'budget': {'import_seconds': args.budget_import, 'first_predict_seconds': args.budget_first_predict}
+    }
+    over = [name for name, value, budget in (
+        ('import', import_total, args.budget_import),
+        ('first_predict', predict_total, args.budget_first_predict)) if value > budget]
+    report['over_budget'] = over
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if over else 0)
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ Configuration settings for AI Agricultural Platform Backend
 """
 
 import os
+import tempfile
 from datetime import timedelta
 
 class Config:
@@ -22,24 +23,104 @@ class Config:
     # Data files
     MARKET_PRICE_DATA = os.path.join(DATA_PATH, 'egypt_local_crop_prices_2023_2025.csv')
     EFFICIENCY_DATA = os.path.join(DATA_PATH, 'farm_efficiency_scores.csv')
+    YIELD_TRAINING_DATA = os.path.join(DATA_PATH, 'crop-yield.csv')
     
     # API settings
     API_VERSION = 'v1'
-    RATE_LIMIT = os.environ.get('RATE_LIMIT') or '100 per hour'
+    RATE_LIMIT = os.environ.get('RATE_LIMIT') or '100 per hour'  # per client, on inference routes
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_KEY_HEADER = os.environ.get('RATE_LIMIT_KEY_HEADER')  # must be set behind a proxy, e.g. X-Real-IP for nginx
+    RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 10000))  # buckets kept in memory
     
-    # Cache settings
-    CACHE_TYPE = 'simple'
-    CACHE_DEFAULT_TIMEOUT = 300  # 5 minutes
+    # Load shedding for inference routes (per worker process)
+    INFERENCE_MAX_CONCURRENT = int(os.environ.get('INFERENCE_MAX_CONCURRENT', 0)) or 2 * (os.cpu_count() or 1)
+    INFERENCE_MAX_QUEUE = int(os.environ.get('INFERENCE_MAX_QUEUE', 32))
+    INFERENCE_QUEUE_TIMEOUT = float(os.environ.get('INFERENCE_QUEUE_TIMEOUT', 10.0))  # seconds
+    
+    # Production server (gunicorn, see run.py)
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 0)) or os.cpu_count() or 1
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))
+    SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE', 5))  # seconds
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 60))  # seconds
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))  # seconds
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 5000))  # recycle workers after N requests
+    SERVER_MAX_REQUESTS_JITTER = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER', 500))
+    
+    # Executors for async handlers (see executors.py)
+    INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 0)) or os.cpu_count() or 1
+    IO_WORKERS = int(os.environ.get('IO_WORKERS', 8))
+    ASGI_REQUEST_THREADS = int(os.environ.get('ASGI_REQUEST_THREADS', 32))
+    BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 8))  # sub-requests of /api/batch run at once
+    BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))  # sub-requests per batch
+    
+    # Analysis persistence (write-behind queue for /predict)
+    ANALYSIS_WRITE_BEHIND = os.environ.get('ANALYSIS_WRITE_BEHIND', 'false').lower() == 'true'
+    ANALYSIS_QUEUE_SIZE = int(os.environ.get('ANALYSIS_QUEUE_SIZE', 1000))
+    ANALYSIS_BATCH_SIZE = int(os.environ.get('ANALYSIS_BATCH_SIZE', 100))
+    ANALYSIS_FLUSH_INTERVAL = float(os.environ.get('ANALYSIS_FLUSH_INTERVAL', 0.5))  # seconds
+    ANALYSIS_ENQUEUE_TIMEOUT = float(os.environ.get('ANALYSIS_ENQUEUE_TIMEOUT', 2.0))  # seconds
+    ANALYSIS_ID_BLOCK_SIZE = int(os.environ.get('ANALYSIS_ID_BLOCK_SIZE', 100))
+    
+    # Analysis archival
+    ARCHIVE_ENABLED = os.environ.get('ARCHIVE_ENABLED', 'false').lower() == 'true'
+    ARCHIVE_PATH = os.environ.get('ARCHIVE_PATH') or os.path.join(os.path.dirname(__file__), 'archive')
+    ARCHIVE_MAX_AGE_DAYS = int(os.environ.get('ARCHIVE_MAX_AGE_DAYS', 365))
+    ARCHIVE_INTERVAL_HOURS = float(os.environ.get('ARCHIVE_INTERVAL_HOURS', 24))
+    ARCHIVE_VACUUM_MODE = os.environ.get('ARCHIVE_VACUUM_MODE', 'incremental')  # or 'full'
+    
+    # Incremental yield retraining from harvest outcomes (see retraining.py)
+    RETRAIN_MAX_SECONDS = float(os.environ.get('RETRAIN_MAX_SECONDS', 60))  # boosting stops after this
+    RETRAIN_ROUNDS = int(os.environ.get('RETRAIN_ROUNDS', 50))  # boosting rounds added per run, at most
+    RETRAIN_MIN_ROWS = int(os.environ.get('RETRAIN_MIN_ROWS', 20))  # new labelled rows needed to train
+    RETRAIN_HOLDOUT_EVERY = int(os.environ.get('RETRAIN_HOLDOUT_EVERY', 5))  # every Nth outcome is held out
+    RETRAIN_REFERENCE_ROWS = int(os.environ.get('RETRAIN_REFERENCE_ROWS', 2000))  # YIELD_TRAINING_DATA sample
+    RETRAIN_TOLERANCE = float(os.environ.get('RETRAIN_TOLERANCE', 0.0))  # allowed relative holdout RMSE increase
+    # Same for the reference sample; unset, its RMSE is only reported (it rises when yields really drift)
+    RETRAIN_REFERENCE_TOLERANCE = (float(os.environ['RETRAIN_REFERENCE_TOLERANCE'])
+                                   if os.environ.get('RETRAIN_REFERENCE_TOLERANCE') else None)
+    
+    # Warmup before /health/ready reports ready
+    WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_ROUNDS = int(os.environ.get('WARMUP_ROUNDS', 2))  # passes over the synthetic inputs
+    
+    # Cache settings (see utils/cache.py)
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')  # 'simple' (in-process LRU), 'sqlite' (shared by workers) or 'null'
+    CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))  # 5 minutes
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))  # pickled value bytes
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH') or os.path.join(tempfile.gettempdir(), 'agri-cache.db')
+    
+    # Live update events (GET /events, see events.py)
+    EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 0.5))  # seconds between event log reads
+    EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT', 15))  # seconds of silence before a keep-alive comment
+    EVENTS_RETENTION = int(os.environ.get('EVENTS_RETENTION', 10000))  # newest events kept for Last-Event-ID resume
+    EVENTS_MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 10000))  # per worker
+    # Under WSGI each stream holds a request thread for as long as it is open; the rest are left for requests
+    EVENTS_MAX_WSGI_STREAMS = int(os.environ.get('EVENTS_MAX_WSGI_STREAMS', 0)) or max(1, SERVER_THREADS // 2)
+    EVENTS_FALLBACK_POLL = int(os.environ.get('EVENTS_FALLBACK_POLL', 30))  # seconds; polling interval for rejected streams
+    EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))  # undelivered events before a slow client is dropped
     
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
-    LOG_FILE = os.environ.get('LOG_FILE') or 'agricultural_platform.log'
+    LOG_FILE = os.environ.get('LOG_FILE')  # stdout only unless set
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # or 'text'
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # records; more are dropped
+    LOG_ERROR_BURST = int(os.environ.get('LOG_ERROR_BURST', 5))  # per distinct error and window; 0 disables sampling
+    LOG_ERROR_WINDOW = float(os.environ.get('LOG_ERROR_WINDOW', 60))  # seconds
+    
+    # On-demand request profiling (X-Profile-Token header or ?profile=<token>)
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')  # profiling stays off without one
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(os.path.dirname(__file__), 'profiles')
+    PROFILING_SAMPLE_INTERVAL = float(os.environ.get('PROFILING_SAMPLE_INTERVAL', 0.001))  # seconds
     
     # Security
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
     
     # Performance
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max request size
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # bytes; smaller bodies go out as-is
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
     
     # Business logic settings
     DEFAULT_FARM_AREA = 1.0  # hectares
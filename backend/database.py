@@ -2,25 +2,243 @@
 Database setup and management for AI Agricultural Platform
 """
 
+import contextvars
+import logging
 import sqlite3
 import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import json
 from flask import Blueprint, request
 
+from utils.responses import create_response, handle_errors
+from utils.conditional import conditional
+from utils.metrics import STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
 # Create Flask blueprint
 db_api = Blueprint('database', __name__)
 
+# Stored in PRAGMA user_version once init_database has set a database up;
+# bump it whenever init_database creates or migrates something new
+SCHEMA_VERSION = 1
+
+# Absolute paths of the databases this process has already set up
+_initialized = set()
+_init_lock = threading.Lock()
+
+# Rollup bucket start for each granularity, as SQLite date expressions
+ROLLUP_BUCKETS = {
+    'daily': "date({ts})",
+    'weekly': "date({ts}, 'weekday 0', '-6 days')",  # Monday of the week
+    'monthly': "date({ts}, 'start of month')"
+}
+
+# Rollup dimensions and the key each analysis is grouped under
+ROLLUP_SCOPES = {
+    'farm': "CAST({farm_id} AS TEXT)",
+    'region': "COALESCE({region}, 'Unknown')"
+}
+
+# farm_analyses columns returned by the read paths; recommendations live in
+# the analysis_recommendations child table
+ANALYSIS_COLUMNS = [
+    'id', 'farm_id', 'analysis_type', 'temperature', 'humidity', 'ph', 'rainfall',
+    'nitrogen', 'phosphorus', 'potassium', 'organic_carbon', 'sunlight_hours',
+    'wind_speed', 'altitude', 'fertilizer_used', 'pesticide_used', 'season',
+    'region', 'predicted_yield', 'predicted_revenue', 'efficiency_score', 'created_at'
+]
+
+# Bumps the version of the data_versions scopes selected by {scope} {source}
+DATA_VERSION_BUMP = '''
+    INSERT INTO data_versions (scope, version, updated_at)
+    SELECT {scope}, 1, CAST(strftime('%s', 'now') AS INTEGER) {source}
+    ON CONFLICT (scope) DO UPDATE SET
+        version = version + 1,
+        updated_at = excluded.updated_at;
+'''
+
+# Tables whose writes change what readers see, and the scopes each write bumps
+DATA_VERSION_TRIGGERS = {
+    'farms': {
+        'INSERT': ["'farms'", "'farm:' || NEW.id"],
+        'UPDATE': ["'farms'", "'farm:' || NEW.id"],
+        'DELETE': ["'farms'", "'farm:' || OLD.id"]
+    },
+    'farm_analyses': {
+        'INSERT': ["'farm:' || NEW.farm_id"],
+        'UPDATE': ["'farm:' || NEW.farm_id"],
+        'DELETE': ["'farm:' || OLD.farm_id"]
+    },
+    'market_prices': {
+        'INSERT': ["'prices'"],
+        'UPDATE': ["'prices'"],
+        'DELETE': ["'prices'"]
+    }
+}
+
+# Live update log read by events.py; written in the same transaction as the change
+EVENT_INSERT = '''
+    INSERT INTO events (topic, type, data, created_at)
+    VALUES (?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+'''
+
+ROLLUP_UPSERT = '''
+    ON CONFLICT (granularity, scope, scope_key, bucket_start) DO UPDATE SET
+        analysis_count = analysis_count + excluded.analysis_count,
+        yield_count = yield_count + excluded.yield_count,
+        yield_sum = yield_sum + excluded.yield_sum,
+        revenue_count = revenue_count + excluded.revenue_count,
+        revenue_sum = revenue_sum + excluded.revenue_sum,
+        efficiency_count = efficiency_count + excluded.efficiency_count,
+        efficiency_sum = efficiency_sum + excluded.efficiency_sum
+'''
+
+class _TimedCursor(sqlite3.Cursor):
+    """Cursor recording every statement as a 'db' stage, labelled by SQL verb"""
+    
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _observe_query(sql, started)
+    
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _observe_query(sql, started)
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class _SharedConnection(_TimedConnection):
+    """Connection lent out by shared_connections; close() hands it back instead"""
+    
+    users = 0  # connect() calls not yet closed, in case a caller nests them
+    
+    def close(self):
+        self.users -= 1
+        if self.users <= 0:
+            # What a real close would discard, and per-caller settings
+            self.users = 0
+            self.rollback()
+            self.row_factory = None
+    
+    def release(self):
+        super().close()
+
+def _observe_query(sql, started):
+    verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+    STAGE_DURATION.labels('db', verb).observe(time.perf_counter() - started)
+
+# (thread id, db path) -> connection, while a shared_connections block is active
+_shared = contextvars.ContextVar('shared_connections', default=None)
+_shared_lock = threading.Lock()
+
+def connect(db_path, **kwargs):
+    """Open a SQLite connection whose queries are timed for /metrics"""
+    pool = _shared.get()
+    if pool is None or kwargs:
+        return sqlite3.connect(db_path, factory=_TimedConnection, **kwargs)
+    
+    key = (threading.get_ident(), db_path)
+    with _shared_lock:
+        conn = pool.get(key)
+        if conn is None:
+            # Only this thread uses it; the block's owner closes it from its own thread
+            conn = pool[key] = sqlite3.connect(db_path, factory=_SharedConnection, check_same_thread=False)
+    conn.users += 1
+    return conn
+
+@contextmanager
+def shared_connections():
+    """
+    Reuse connections for everything run inside the block
+    
+    Each thread gets one connection per database for the whole block, so a
+    batch of small reads (including those handed to executors, which carry
+    the caller's context) opens a handful of connections instead of one per
+    query. Calls that pass connection options still get their own.
+    """
+    pool = {}
+    token = _shared.set(pool)
+    try:
+        yield
+    finally:
+        _shared.reset(token)
+        with _shared_lock:
+            connections = list(pool.values())
+            pool.clear()
+        for conn in connections:
+            conn.release()
+
+def get_data_versions(scopes, db_path='agricultural_platform.db'):
+    """
+    Current (version, updated_at) of each scope, (0, None) if never written
+    
+    A single indexed read that skips DatabaseManager's schema setup, so
+    conditional GETs can be answered before any real work.
+    """
+    scopes = list(scopes)
+    conn = connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT scope, version, updated_at FROM data_versions
+            WHERE scope IN ({', '.join('?' * len(scopes))})
+        ''', scopes)
+        found = {scope: (version, updated_at) for scope, version, updated_at in cursor.fetchall()}
+    except sqlite3.OperationalError:
+        # Table not created yet
+        found = {}
+    finally:
+        conn.close()
+    
+    return {scope: found.get(scope, (0, None)) for scope in scopes}
+
 class DatabaseManager:
     def __init__(self, db_path='agricultural_platform.db'):
         self.db_path = db_path
-        self.init_database()
+        self.ensure_schema()
+    
+    def ensure_schema(self):
+        """Run init_database once per database and process, not on every construction"""
+        key = os.path.abspath(self.db_path)
+        if key in _initialized:
+            return
+        with _init_lock:
+            if key not in _initialized:
+                self.init_database()
+                _initialized.add(key)
     
     def init_database(self):
-        """Initialize all database tables"""
-        conn = sqlite3.connect(self.db_path)
+        """
+        Initialize all database tables
+        
+        A database already at SCHEMA_VERSION is left alone, so other worker
+        processes only pay for one PRAGMA read.
+        """
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
+        cursor.execute('PRAGMA user_version')
+        if cursor.fetchone()[0] >= SCHEMA_VERSION:
+            conn.close()
+            return
+        
         # Users table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -107,13 +325,267 @@ class DatabaseManager:
             )
         ''')
         
+        # Recommended crops per analysis, best first
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_recommendations (
+                analysis_id INTEGER NOT NULL,
+                rank INTEGER NOT NULL,
+                crop TEXT NOT NULL COLLATE NOCASE,
+                PRIMARY KEY (analysis_id, rank),
+                FOREIGN KEY (analysis_id) REFERENCES farm_analyses (id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_analysis_recommendations_crop
+            ON analysis_recommendations (crop)
+        ''')
+        
+        # Analysis rollups (daily/weekly/monthly by farm and by region)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_rollups (
+                granularity TEXT NOT NULL,
+                scope TEXT NOT NULL,
+                scope_key TEXT NOT NULL,
+                bucket_start DATE NOT NULL,
+                analysis_count INTEGER NOT NULL DEFAULT 0,
+                yield_count INTEGER NOT NULL DEFAULT 0,
+                yield_sum REAL NOT NULL DEFAULT 0,
+                revenue_count INTEGER NOT NULL DEFAULT 0,
+                revenue_sum REAL NOT NULL DEFAULT 0,
+                efficiency_count INTEGER NOT NULL DEFAULT 0,
+                efficiency_sum REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (granularity, scope, scope_key, bucket_start)
+            )
+        ''')
+        
+        # Keep rollups current on every insert, whoever does the insert
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS farm_analyses_rollup
+            AFTER INSERT ON farm_analyses
+            BEGIN
+                {self._rollup_trigger_body()}
+            END
+        ''')
+        
+        # Data versions: bumped on every write so readers can answer conditional GETs
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_versions (
+                scope TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+        ''')
+        for table, events in DATA_VERSION_TRIGGERS.items():
+            for event, scopes in events.items():
+                body = ''.join(DATA_VERSION_BUMP.format(scope=scope, source='WHERE true')
+                               for scope in scopes)
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version
+                    AFTER {event} ON {table}
+                    BEGIN
+                        {body}
+                    END
+                ''')
+        # Live update events; AUTOINCREMENT so pruned ids are never reused
+        # and a client's Last-Event-ID stays meaningful
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at INTEGER NOT NULL
+            )
+        ''')
+        
+        # Measured yield of an analysed farm, the label for retraining the
+        # yield model. Recording an analysis again replaces its row under a
+        # new id, so retraining (which reads ids past its last run) sees
+        # corrections too
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS harvest_outcomes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                analysis_id INTEGER NOT NULL UNIQUE,
+                crop_type TEXT,
+                actual_yield REAL NOT NULL,
+                harvested_at DATE,
+                recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (analysis_id) REFERENCES farm_analyses (id)
+            )
+        ''')
+        
+        # One row per retraining attempt, published or not (see retraining.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS model_training_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                model TEXT NOT NULL,
+                started_at TIMESTAMP NOT NULL,
+                finished_at TIMESTAMP NOT NULL,
+                last_outcome_id INTEGER,
+                train_rows INTEGER NOT NULL DEFAULT 0,
+                rounds INTEGER NOT NULL DEFAULT 0,
+                published INTEGER NOT NULL DEFAULT 0,
+                details TEXT
+            )
+        ''')
+        
+        # Owner details are part of every farm response
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS users_update_version
+            AFTER UPDATE ON users
+            BEGIN
+                {DATA_VERSION_BUMP.format(scope="'farms'", source='WHERE true')}
+                {DATA_VERSION_BUMP.format(scope="'farm:' || id", source='FROM farms WHERE user_id = NEW.id')}
+            END
+        ''')
+        
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM analysis_rollups)')
+        has_rollups = cursor.fetchone()[0]
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM farm_analyses)')
+        has_analyses = cursor.fetchone()[0]
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM farm_analyses WHERE recommendations IS NOT NULL)')
+        has_legacy_recommendations = cursor.fetchone()[0]
+        
         conn.commit()
         conn.close()
-        print("✅ Database initialized successfully")
+        
+        if has_analyses and not has_rollups:
+            self.rebuild_rollups()
+        if has_legacy_recommendations:
+            self.backfill_recommendations()
+        
+        # Only once everything above has succeeded; PRAGMA does not take parameters
+        conn = connect(self.db_path)
+        try:
+            conn.execute(f'PRAGMA user_version = {int(SCHEMA_VERSION)}')
+        finally:
+            conn.close()
+        
+        logger.info("Database initialized (schema version %d)", SCHEMA_VERSION)
+    
+    def _rollup_trigger_body(self):
+        """Upserts adding NEW to every rollup bucket it belongs to"""
+        statements = []
+        for granularity, bucket in ROLLUP_BUCKETS.items():
+            for scope, key in ROLLUP_SCOPES.items():
+                statements.append(f'''
+                INSERT INTO analysis_rollups (
+                    granularity, scope, scope_key, bucket_start, analysis_count,
+                    yield_count, yield_sum, revenue_count, revenue_sum,
+                    efficiency_count, efficiency_sum
+                )
+                SELECT '{granularity}', '{scope}',
+                    {key.format(farm_id='NEW.farm_id', region='NEW.region')},
+                    {bucket.format(ts='COALESCE(NEW.created_at, CURRENT_TIMESTAMP)')},
+                    1,
+                    NEW.predicted_yield IS NOT NULL, COALESCE(NEW.predicted_yield, 0),
+                    NEW.predicted_revenue IS NOT NULL, COALESCE(NEW.predicted_revenue, 0),
+                    NEW.efficiency_score IS NOT NULL, COALESCE(NEW.efficiency_score, 0)
+                WHERE true
+                {ROLLUP_UPSERT};''')
+        return ''.join(statements)
+    
+    def rollup_selects(self, source='farm_analyses'):
+        """Grouped SELECTs that turn an analyses table into rollup rows"""
+        for granularity, bucket in ROLLUP_BUCKETS.items():
+            for scope, key in ROLLUP_SCOPES.items():
+                yield f'''
+                    SELECT '{granularity}', '{scope}',
+                        {key.format(farm_id='farm_id', region='region')} AS rollup_key,
+                        {bucket.format(ts='created_at')} AS rollup_bucket,
+                        COUNT(*),
+                        COUNT(predicted_yield), TOTAL(predicted_yield),
+                        COUNT(predicted_revenue), TOTAL(predicted_revenue),
+                        COUNT(efficiency_score), TOTAL(efficiency_score)
+                    FROM {source}
+                    WHERE created_at IS NOT NULL
+                    GROUP BY rollup_key, rollup_bucket
+                '''
+    
+    def _aggregate_into_rollups(self, cursor, source='farm_analyses'):
+        """Add the aggregated rows of an analyses table to the rollups"""
+        for select in self.rollup_selects(source):
+            cursor.execute(f'''
+                INSERT INTO analysis_rollups (
+                    granularity, scope, scope_key, bucket_start, analysis_count,
+                    yield_count, yield_sum, revenue_count, revenue_sum,
+                    efficiency_count, efficiency_sum
+                )
+                {select}
+                {ROLLUP_UPSERT}
+            ''')
+    
+    def rebuild_rollups(self, extra_rows=()):
+        """
+        Recompute all rollups from farm_analyses in one transaction
+        
+        Args:
+            extra_rows: Rollup rows aggregated elsewhere (e.g. from archived
+                analyses) that are added on top of the hot table
+        """
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('DELETE FROM analysis_rollups')
+            self._aggregate_into_rollups(cursor)
+            cursor.executemany(f'''
+                INSERT INTO analysis_rollups (
+                    granularity, scope, scope_key, bucket_start, analysis_count,
+                    yield_count, yield_sum, revenue_count, revenue_sum,
+                    efficiency_count, efficiency_sum
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                {ROLLUP_UPSERT}
+            ''', extra_rows)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def get_rollups(self, granularity, scope, scope_key=None, start=None, end=None):
+        """
+        Read rollup buckets with their averages
+        
+        Args:
+            granularity: 'daily', 'weekly' or 'monthly'
+            scope: 'farm' or 'region'
+            scope_key: Farm id or region name; all keys when omitted
+            start, end: Optional inclusive bucket_start bounds (YYYY-MM-DD)
+        """
+        conditions = ['granularity = ?', 'scope = ?']
+        params = [granularity, scope]
+        if scope_key is not None:
+            conditions.append('scope_key = ?')
+            params.append(str(scope_key))
+        if start:
+            conditions.append('bucket_start >= ?')
+            params.append(start)
+        if end:
+            conditions.append('bucket_start <= ?')
+            params.append(end)
+        
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute(f'''
+            SELECT scope_key, bucket_start, analysis_count,
+                   yield_sum / NULLIF(yield_count, 0),
+                   revenue_sum / NULLIF(revenue_count, 0),
+                   efficiency_sum / NULLIF(efficiency_count, 0)
+            FROM analysis_rollups
+            WHERE {' AND '.join(conditions)}
+            ORDER BY scope_key, bucket_start
+        ''', params)
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        columns = ['key', 'bucket_start', 'analysis_count', 'avg_predicted_yield',
+                   'avg_predicted_revenue', 'avg_efficiency_score']
+        return [dict(zip(columns, row)) for row in rows]
     
     def create_default_user(self):
         """Create a default user for testing"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -126,7 +598,7 @@ class DatabaseManager:
     
     def add_farm(self, user_id, farm_data):
         """Add a new farm"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -148,9 +620,64 @@ class DatabaseManager:
         conn.close()
         return farm_id
     
+    def add_farms(self, farms, initial_analyses=None):
+        """
+        Add many farms in a single transaction
+        
+        Args:
+            farms: List of farm dictionaries, each including user_id
+            initial_analyses: Optional list aligned with farms; each entry is an
+                analysis dictionary to store for that farm, or None
+            
+        Returns:
+            List of new farm ids, in input order
+        """
+        if not farms:
+            return []
+        
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+                INSERT INTO farms (user_id, name, location, area_hectares, crop_type, soil_type, irrigation_type, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [
+                (
+                    farm_data['user_id'],
+                    farm_data['name'],
+                    farm_data['location'],
+                    farm_data['area_hectares'],
+                    farm_data.get('crop_type'),
+                    farm_data.get('soil_type'),
+                    farm_data.get('irrigation_type'),
+                    farm_data.get('status', 'active')
+                )
+                for farm_data in farms
+            ])
+            
+            # The write lock is held for the whole transaction, so the
+            # AUTOINCREMENT ids handed out above are contiguous
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'farms'")
+            last_id = cursor.fetchone()[0]
+            farm_ids = list(range(last_id - len(farms) + 1, last_id + 1))
+            
+            if initial_analyses:
+                self._insert_analyses(cursor, [
+                    (None, farm_id, analysis_data)
+                    for farm_id, analysis_data in zip(farm_ids, initial_analyses)
+                    if analysis_data is not None
+                ])
+            
+            conn.commit()
+        finally:
+            conn.close()
+        
+        return farm_ids
+    
     def get_user_farms(self, user_id):
         """Get all farms for a user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -161,19 +688,9 @@ class DatabaseManager:
         conn.close()
         return farms
     
-    def save_analysis(self, farm_id, analysis_data):
-        """Save farm analysis results"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO farm_analyses (
-                farm_id, analysis_type, temperature, humidity, ph, rainfall,
-                nitrogen, phosphorus, potassium, organic_carbon, sunlight_hours,
-                wind_speed, altitude, fertilizer_used, pesticide_used, season,
-                region, predicted_yield, predicted_revenue, efficiency_score, recommendations
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+    def _analysis_values(self, farm_id, analysis_data):
+        """Build the farm_analyses column values for one analysis"""
+        return (
             farm_id,
             analysis_data['analysis_type'],
             analysis_data.get('temperature'),
@@ -193,18 +710,241 @@ class DatabaseManager:
             analysis_data.get('region'),
             analysis_data.get('predicted_yield'),
             analysis_data.get('predicted_revenue'),
-            analysis_data.get('efficiency_score'),
-            json.dumps(analysis_data.get('recommendations', []))
-        ))
+            analysis_data.get('efficiency_score')
+        )
+    
+    def save_analysis(self, farm_id, analysis_data):
+        """Save farm analysis results"""
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
         
-        analysis_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        try:
+            analysis_id = self._insert_analyses(cursor, [(None, farm_id, analysis_data)])[0]
+            conn.commit()
+        finally:
+            conn.close()
         return analysis_id
     
+    def save_analyses(self, analyses):
+        """
+        Save a batch of analyses with pre-allocated ids in one transaction
+        
+        Args:
+            analyses: List of (analysis_id, farm_id, analysis_data) tuples
+        """
+        if not analyses:
+            return
+        
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            self._insert_analyses(cursor, analyses)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _insert_analyses(self, cursor, analyses):
+        """
+        Insert (analysis_id, farm_id, analysis_data) rows and their recommended crops
+        
+        Rows with a None id get one reserved inside the same transaction.
+        
+        Returns:
+            List of analysis ids, in input order
+        """
+        missing = sum(1 for analysis_id, _, _ in analyses if analysis_id is None)
+        next_id = self._reserve_analysis_ids(cursor, missing) if missing else None
+        
+        rows = []
+        for analysis_id, farm_id, analysis_data in analyses:
+            if analysis_id is None:
+                analysis_id = next_id
+                next_id += 1
+            rows.append((analysis_id, farm_id, analysis_data))
+        
+        cursor.executemany('''
+            INSERT INTO farm_analyses (
+                id, farm_id, analysis_type, temperature, humidity, ph, rainfall,
+                nitrogen, phosphorus, potassium, organic_carbon, sunlight_hours,
+                wind_speed, altitude, fertilizer_used, pesticide_used, season,
+                region, predicted_yield, predicted_revenue, efficiency_score
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (analysis_id,) + self._analysis_values(farm_id, analysis_data)
+            for analysis_id, farm_id, analysis_data in rows
+        ])
+        
+        cursor.executemany('''
+            INSERT INTO analysis_recommendations (analysis_id, rank, crop)
+            VALUES (?, ?, ?)
+        ''', [
+            (analysis_id, rank, str(crop))
+            for analysis_id, _, analysis_data in rows
+            for rank, crop in enumerate(analysis_data.get('recommendations') or [])
+        ])
+        
+        cursor.executemany(EVENT_INSERT, [
+            (f'farm:{farm_id}', 'analysis', json.dumps({
+                'analysis_id': analysis_id,
+                'farm_id': farm_id,
+                'analysis_type': analysis_data['analysis_type'],
+                'predicted_yield': analysis_data.get('predicted_yield'),
+                'predicted_revenue': analysis_data.get('predicted_revenue'),
+                'efficiency_score': analysis_data.get('efficiency_score'),
+                'recommendations': [str(crop) for crop in analysis_data.get('recommendations') or []]
+            }, default=str))
+            for analysis_id, farm_id, analysis_data in rows
+        ])
+        
+        return [analysis_id for analysis_id, _, _ in rows]
+    
+    def _reserve_analysis_ids(self, cursor, count):
+        """Advance the farm_analyses sequence by count and return the first id of the block"""
+        # Writing first takes the database write lock before the sequence is read
+        cursor.execute('''
+            UPDATE sqlite_sequence
+            SET seq = MAX(seq, (SELECT COALESCE(MAX(id), 0) FROM farm_analyses)) + ?
+            WHERE name = 'farm_analyses'
+        ''', (count,))
+        if cursor.rowcount == 0:
+            cursor.execute('''
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT 'farm_analyses', COALESCE(MAX(id), 0) + ? FROM farm_analyses
+            ''', (count,))
+        
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'farm_analyses'")
+        return cursor.fetchone()[0] - count + 1
+    
+    def reserve_analysis_ids(self, count):
+        """
+        Reserve a contiguous block of farm_analyses ids
+        
+        The AUTOINCREMENT sequence is advanced past the block, so rows
+        inserted later without an explicit id never collide with it.
+        
+        Returns:
+            First id of the reserved block
+        """
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            first_id = self._reserve_analysis_ids(cursor, count)
+            conn.commit()
+        finally:
+            conn.close()
+        
+        return first_id
+    
+    def backfill_recommendations(self):
+        """
+        Move legacy JSON recommendations into analysis_recommendations
+        
+        Rows written before the child table existed keep their crops as JSON
+        text; each is decoded once here and the text column is cleared.
+        """
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                SELECT id, recommendations FROM farm_analyses
+                WHERE recommendations IS NOT NULL
+            ''')
+            legacy = cursor.fetchall()
+            if not legacy:
+                return 0
+            
+            rows = []
+            for analysis_id, text in legacy:
+                try:
+                    crops = json.loads(text)
+                except ValueError:
+                    crops = []
+                if not isinstance(crops, list):
+                    crops = []
+                rows.extend((analysis_id, rank, str(crop)) for rank, crop in enumerate(crops))
+            
+            cursor.executemany('''
+                INSERT OR IGNORE INTO analysis_recommendations (analysis_id, rank, crop)
+                VALUES (?, ?, ?)
+            ''', rows)
+            cursor.execute('UPDATE farm_analyses SET recommendations = NULL WHERE recommendations IS NOT NULL')
+            conn.commit()
+        finally:
+            conn.close()
+        
+        logger.info("Migrated recommendations for %d analyses", len(legacy))
+        return len(legacy)
+    
+    def _get_recommendations(self, cursor, analysis_ids):
+        """Map each analysis id to its recommended crops, best first"""
+        recommendations = {analysis_id: [] for analysis_id in analysis_ids}
+        if not recommendations:
+            return recommendations
+        
+        placeholders = ', '.join('?' * len(recommendations))
+        cursor.execute(f'''
+            SELECT analysis_id, crop FROM analysis_recommendations
+            WHERE analysis_id IN ({placeholders})
+            ORDER BY analysis_id, rank
+        ''', list(recommendations))
+        
+        for analysis_id, crop in cursor.fetchall():
+            recommendations[analysis_id].append(crop)
+        return recommendations
+    
+    def get_farm_predictions(self, farm_id, limit=None):
+        """Get analyses for a farm as dictionaries, newest first, with recommended crops"""
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f'''
+                SELECT {', '.join(ANALYSIS_COLUMNS)} FROM farm_analyses
+                WHERE farm_id = ?
+                ORDER BY created_at DESC
+                {'LIMIT ?' if limit else ''}
+            ''', (farm_id, limit) if limit else (farm_id,))
+            return self._with_recommendations(cursor, cursor.fetchall())
+        finally:
+            conn.close()
+    
+    def get_analyses_by_recommended_crop(self, crop, farm_id=None):
+        """Get analyses that recommended a crop (case-insensitive), newest first"""
+        conditions = ['r.crop = ?']
+        params = [crop]
+        if farm_id is not None:
+            conditions.append('a.farm_id = ?')
+            params.append(farm_id)
+        
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f'''
+                SELECT {', '.join('a.' + column for column in ANALYSIS_COLUMNS)}
+                FROM analysis_recommendations r
+                JOIN farm_analyses a ON a.id = r.analysis_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY a.created_at DESC
+            ''', params)
+            return self._with_recommendations(cursor, cursor.fetchall())
+        finally:
+            conn.close()
+    
+    def _with_recommendations(self, cursor, rows):
+        """Turn analysis rows into dictionaries carrying their recommendations list"""
+        analyses = [dict(zip(ANALYSIS_COLUMNS, row)) for row in rows]
+        recommendations = self._get_recommendations(cursor, [analysis['id'] for analysis in analyses])
+        for analysis in analyses:
+            analysis['recommendations'] = recommendations[analysis['id']]
+        return analyses
+    
     def add_insight(self, farm_id, insight_data):
         """Add a new insight"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -226,7 +966,7 @@ class DatabaseManager:
     
     def get_farm_analyses(self, farm_id):
         """Get all analyses for a farm"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -239,7 +979,7 @@ class DatabaseManager:
     
     def get_farm_insights(self, farm_id):
         """Get all insights for a farm"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -252,7 +992,7 @@ class DatabaseManager:
     
     def update_farm(self, farm_id, farm_data):
         """Update farm information"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -276,7 +1016,7 @@ class DatabaseManager:
     
     def delete_farm(self, farm_id):
         """Delete a farm"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         cursor.execute('DELETE FROM farms WHERE id = ?', (farm_id,))
@@ -285,7 +1025,7 @@ class DatabaseManager:
     
     def get_market_prices(self, crop=None):
         """Get market prices"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         if crop:
@@ -303,7 +1043,7 @@ class DatabaseManager:
     
     def import_market_prices(self, prices_data):
         """Import market prices from CSV"""
-        conn = sqlite3.connect(self.db_path)
+        conn = connect(self.db_path)
         cursor = conn.cursor()
         
         for price in prices_data:
@@ -314,14 +1054,103 @@ class DatabaseManager:
         
         conn.commit()
         conn.close()
+    
+    def record_harvest(self, analysis_id, actual_yield, crop_type=None, harvested_at=None):
+        """
+        Record the measured yield (tons per hectare) for an analysis
+        
+        Returns:
+            The outcome id, or None if the analysis does not exist
+        """
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM farm_analyses WHERE id = ?)', (analysis_id,))
+            if not cursor.fetchone()[0]:
+                return None
+            cursor.execute('''
+                INSERT OR REPLACE INTO harvest_outcomes (analysis_id, crop_type, actual_yield, harvested_at)
+                VALUES (?, ?, ?, ?)
+            ''', (analysis_id, crop_type, actual_yield, harvested_at))
+            outcome_id = cursor.lastrowid
+            conn.commit()
+            return outcome_id
+        finally:
+            conn.close()
+    
+    def get_labelled_analyses(self, after_id=0):
+        """
+        Harvest outcomes joined to their analysis and farm, oldest first
+        
+        Each dictionary has the analysis columns, the farm's soil and
+        irrigation type, crop_type (as harvested, else the farm's) and
+        outcome_id / actual_yield. Outcomes whose analysis was archived are
+        left out.
+        """
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f'''
+                SELECT {', '.join('a.' + column for column in ANALYSIS_COLUMNS)},
+                       f.soil_type, f.irrigation_type, COALESCE(h.crop_type, f.crop_type),
+                       h.id, h.actual_yield
+                FROM harvest_outcomes h
+                JOIN farm_analyses a ON a.id = h.analysis_id
+                LEFT JOIN farms f ON f.id = a.farm_id
+                WHERE h.id > ?
+                ORDER BY h.id
+            ''', (after_id,))
+            columns = ANALYSIS_COLUMNS + ['soil_type', 'irrigation_type', 'crop_type', 'outcome_id', 'actual_yield']
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+    
+    def get_last_training_run(self, model, published=True):
+        """Newest training run of a model (only published ones by default), or None"""
+        columns = ['id', 'model', 'started_at', 'finished_at', 'last_outcome_id',
+                   'train_rows', 'rounds', 'published', 'details']
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f'''
+                SELECT {', '.join(columns)} FROM model_training_runs
+                WHERE model = ? {'AND published = 1' if published else ''}
+                ORDER BY id DESC LIMIT 1
+            ''', (model,))
+            row = cursor.fetchone()
+            return dict(zip(columns, row)) if row else None
+        finally:
+            conn.close()
+    
+    def add_training_run(self, model, started_at, last_outcome_id, train_rows, rounds, published, details):
+        """Record a training run; details is stored as JSON"""
+        conn = connect(self.db_path)
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                INSERT INTO model_training_runs
+                    (model, started_at, finished_at, last_outcome_id, train_rows, rounds, published, details)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (model, started_at, datetime.now().isoformat(), last_outcome_id, train_rows, rounds,
+                  int(published), json.dumps(details, default=str)))
+            run_id = cursor.lastrowid
+            conn.commit()
+            return run_id
+        finally:
+            conn.close()
 
 # API Routes for database blueprint
 @db_api.route('/farms', methods=['GET'])
+@conditional(lambda: get_data_versions(['farms']))
 def get_farms():
     """Get all farms"""
     try:
         db = DatabaseManager()
-        conn = sqlite3.connect(db.db_path)
+        conn = connect(db.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -347,14 +1176,15 @@ def get_farms():
         return create_response('success', 'Farms retrieved successfully', farms_list)
     
     except Exception as e:
-        return handle_errors(e)
+        return handle_errors(e, 'Database error')
 
 @db_api.route('/farms/<int:farm_id>', methods=['GET'])
+@conditional(lambda farm_id: get_data_versions([f'farm:{farm_id}']))
 def get_farm_by_id(farm_id):
     """Get farm details by ID"""
     try:
         db = DatabaseManager()
-        conn = sqlite3.connect(db.db_path)
+        conn = connect(db.db_path)
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -368,7 +1198,7 @@ def get_farm_by_id(farm_id):
         conn.close()
         
         if not farm:
-            return create_response('error', 'Farm not found', 404)
+            return create_response('error', 'Farm not found', status_code=404)
         
         # Convert to dictionary
         farm_columns = ['id', 'user_id', 'name', 'location', 'area_hectares', 
@@ -380,39 +1210,66 @@ def get_farm_by_id(farm_id):
         return create_response('success', 'Farm retrieved successfully', farm_dict)
     
     except Exception as e:
-        return handle_errors(e)
+        return handle_errors(e, 'Database error')
 
 @db_api.route('/farms/<int:farm_id>/predictions', methods=['GET'])
+@conditional(lambda farm_id: get_data_versions([f'farm:{farm_id}']))
 def get_farm_predictions_api(farm_id):
     """Get prediction history for a farm"""
     try:
         db = DatabaseManager()
-        analyses = db.get_farm_analyses(farm_id)
+        predictions = db.get_farm_predictions(farm_id)
         
-        # Convert to list of dictionaries
-        prediction_columns = ['id', 'farm_id', 'analysis_type', 'temperature', 
-                              'humidity', 'ph', 'rainfall', 'nitrogen', 'phosphorus', 
-                              'potassium', 'organic_carbon', 'sunlight_hours', 
-                              'wind_speed', 'altitude', 'fertilizer_used', 
-                              'pesticide_used', 'season', 'region', 'predicted_yield', 
-                              'predicted_revenue', 'efficiency_score', 'recommendations', 
-                              'created_at']
-        
-        predictions = []
-        for analysis in analyses:
-            pred_dict = dict(zip(prediction_columns, analysis))
-            # Parse JSON recommendations
-            if pred_dict['recommendations']:
-                try:
-                    pred_dict['recommendations'] = json.loads(pred_dict['recommendations'])
-                except:
-                    pred_dict['recommendations'] = []
-            predictions.append(pred_dict)
+        if request.args.get('include_archived', 'false').lower() == 'true':
+            from archival import get_archiver
+            predictions += get_archiver().get_archived_predictions(farm_id)
         
         return create_response('success', 'Predictions retrieved successfully', predictions)
     
     except Exception as e:
-        return handle_errors(e)
+        return handle_errors(e, 'Database error')
+
+@db_api.route('/analyses', methods=['GET'])
+def get_analyses_by_crop():
+    """Get analyses that recommended a given crop"""
+    try:
+        crop = request.args.get('recommended_crop')
+        if not crop:
+            return create_response('error', 'recommended_crop query parameter is required', status_code=400)
+        
+        db = DatabaseManager()
+        analyses = db.get_analyses_by_recommended_crop(crop, request.args.get('farm_id', type=int))
+        
+        return create_response('success', 'Analyses retrieved successfully', analyses)
+    
+    except Exception as e:
+        return handle_errors(e, 'Database error')
+
+@db_api.route('/analyses/<int:analysis_id>/harvest', methods=['POST'])
+def record_harvest(analysis_id):
+    """Record the measured yield of an analysed farm (a label for retraining)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        actual_yield = data.get('actual_yield')
+        if isinstance(actual_yield, bool) or not isinstance(actual_yield, (int, float)) or actual_yield < 0:
+            return create_response('error', 'actual_yield (tons per hectare, >= 0) is required', status_code=400)
+        harvested_at = data.get('harvested_at')
+        if harvested_at is not None:
+            try:
+                harvested_at = datetime.fromisoformat(str(harvested_at)).date().isoformat()
+            except ValueError:
+                return create_response('error', 'harvested_at must be an ISO date', status_code=400)
+        
+        db = DatabaseManager()
+        outcome_id = db.record_harvest(analysis_id, float(actual_yield), data.get('crop_type'), harvested_at)
+        if outcome_id is None:
+            return create_response('error', 'Analysis not found', status_code=404)
+        
+        return create_response('success', 'Harvest recorded successfully', {'outcome_id': outcome_id})
+    
+    except Exception as e:
+        return handle_errors(e, 'Database error')
 
 @db_api.route('/farms', methods=['POST'])
 def create_farm():
@@ -423,7 +1280,7 @@ def create_farm():
         # Validate required fields
         required_fields = ['name', 'location', 'area_hectares', 'user_id']
         if not all(field in data for field in required_fields):
-            return create_response('error', 'Missing required fields', 400)
+            return create_response('error', 'Missing required fields', status_code=400)
         
         db = DatabaseManager()
         farm_id = db.add_farm(data['user_id'], data)
@@ -431,27 +1288,150 @@ def create_farm():
         return create_response('success', 'Farm created successfully', {'farm_id': farm_id})
     
     except Exception as e:
-        return handle_errors(e)
-
-# Helper functions for database blueprint
-def create_response(status, message, data=None, status_code=200):
-    """Create standardized API response"""
-    from flask import jsonify
-    response = {
-        'status': status,
-        'message': message
-    }
+        return handle_errors(e, 'Database error')
+
+@db_api.route('/analytics/rollups', methods=['GET'])
+def get_analysis_rollups():
+    """Average predicted yield, revenue and efficiency per time bucket"""
+    try:
+        granularity = request.args.get('granularity', 'monthly')
+        scope = request.args.get('scope', 'farm')
+        
+        if granularity not in ROLLUP_BUCKETS:
+            return create_response('error', f"granularity must be one of {list(ROLLUP_BUCKETS)}", status_code=400)
+        if scope not in ROLLUP_SCOPES:
+            return create_response('error', f"scope must be one of {list(ROLLUP_SCOPES)}", status_code=400)
+        
+        db = DatabaseManager()
+        rollups = db.get_rollups(
+            granularity,
+            scope,
+            scope_key=request.args.get('key'),
+            start=request.args.get('start'),
+            end=request.args.get('end')
+        )
+        
+        return create_response('success', 'Rollups retrieved successfully', {
+            'granularity': granularity,
+            'scope': scope,
+            'buckets': rollups
+        })
+    
+    except Exception as e:
+        return handle_errors(e, 'Database error')
+
+@db_api.route('/farms/bulk', methods=['POST'])
+def bulk_create_farms():
+    """
+    Create many farms in one transaction
+    
+    Accepts either a JSON array of farms (or {"farms": [...], "user_id": ...,
+    "location": ..., "compute_efficiency": true}) or a multipart upload with a
+    'file' field in the agriculture_dataset.csv column layout. Invalid rows are
+    reported individually and do not stop the rest of the batch.
+    """
+    import pandas as pd
+    from utils.validators import validate_farm_records
     
-    if data is not None:
-        response['data'] = data
+    try:
+        if 'file' in request.files:
+            try:
+                records = pd.read_csv(request.files['file'])
+            except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+                return create_response('error', f'Could not read the uploaded CSV: {e}', status_code=400)
+            options = request.form
+        else:
+            payload = request.get_json(silent=True)
+            if payload is None:
+                return create_response(
+                    'error',
+                    "Expected a JSON body (a list of farms or {\"farms\": [...]}) "
+                    "or a multipart upload with a 'file' field",
+                    status_code=400
+                )
+            options = payload if isinstance(payload, dict) else request.args
+            farms = payload.get('farms') if isinstance(payload, dict) else payload
+            if not isinstance(farms, list) or not farms:
+                return create_response('error', 'Expected a non-empty list of farms', status_code=400)
+            records = pd.DataFrame(farms)
+        
+        defaults = {
+            'user_id': options.get('user_id'),
+            'location': options.get('location')
+        }
+        compute_efficiency = str(options.get('compute_efficiency', 'false')).lower() in ('true', '1')
+        
+        valid, errors = validate_farm_records(records, defaults)
+        if valid.empty:
+            return create_response('error', 'No valid farms to import', {'errors': errors}, 400)
+        
+        valid = valid.astype(object).where(valid.notna(), None)
+        farms = valid.to_dict('records')
+        for farm in farms:
+            farm['user_id'] = int(farm['user_id'])
+            farm['status'] = farm.get('status') or 'active'
+        
+        scores = [None] * len(farms)
+        initial_analyses = None
+        if compute_efficiency:
+            scores, initial_analyses = _initial_efficiency(farms)
+        
+        db = DatabaseManager()
+        farm_ids = db.add_farms(farms, initial_analyses)
+        
+        created = [
+            {'index': int(index), 'farm_id': farm_id, 'efficiency_score': score}
+            for index, farm_id, score in zip(valid.index, farm_ids, scores)
+        ]
+        
+        status = 'warning' if errors else 'success'
+        message = f"Imported {len(created)} farms" + (f", {len(errors)} rows rejected" if errors else '')
+        return create_response(status, message, {
+            'created': len(created),
+            'failed': len(errors),
+            'farms': created,
+            'errors': errors
+        })
     
-    return jsonify(response), status_code
+    except Exception as e:
+        return handle_errors(e, 'Database error')
 
-def handle_errors(error):
-    """Handle and format errors consistently"""
-    from flask import jsonify
-    print(f"Database API Error: {str(error)}")
-    return jsonify({
-        'status': 'error',
-        'message': f'Database error: {str(error)}'
-    }), 500
+_efficiency_service = None
+
+def _initial_efficiency(farms):
+    """Score every farm that has complete input data in one vectorized call"""
+    import pandas as pd
+    
+    global _efficiency_service
+    if _efficiency_service is None:
+        from services.farm_efficiency import FarmEfficiencyService
+        _efficiency_service = FarmEfficiencyService()
+    
+    inputs = ['farm_area', 'fertilizer_used', 'pesticide_used', 'water_usage', 'yield']
+    frame = pd.DataFrame(farms, columns=inputs).astype(float)
+    complete = frame.notna().all(axis=1)
+    
+    scores = [None] * len(farms)
+    analyses = [None] * len(farms)
+    if not complete.any():
+        return scores, analyses
+    
+    subset = frame[complete]
+    computed = _efficiency_service.calculate_efficiency_scores(
+        subset['farm_area'], subset['fertilizer_used'], subset['pesticide_used'],
+        subset['water_usage'], subset['yield']
+    )
+    
+    for position, score in zip(subset.index, computed):
+        farm = farms[position]
+        scores[position] = float(score)
+        analyses[position] = {
+            'analysis_type': 'initial_efficiency',
+            'fertilizer_used': farm.get('fertilizer_used'),
+            'pesticide_used': farm.get('pesticide_used'),
+            'season': farm.get('season'),
+            'region': farm.get('location'),
+            'efficiency_score': float(score)
+        }
+    
+    return scores, analyses
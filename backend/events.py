@@ -0,0 +1,461 @@
+"""
+Live updates over server-sent events (GET /events)
+
+Writers record events in the `events` table in the same transaction as the
+change itself: one per saved analysis, on topic `farm:<id>`. Prices are
+read from the CSV when a process starts and never change while it runs,
+so there is no prices topic. Each process runs a single poller thread that
+reads new rows every EVENTS_POLL_INTERVAL seconds and fans them out to that
+process's subscribers, so an event reaches every worker whichever one
+wrote it, and idle subscribers cost no queries at all.
+
+Event ids are the table's AUTOINCREMENT ids, so they are global across
+workers. A client that reconnects with Last-Event-ID (EventSource does
+this by itself) is replayed what it missed from the table. When the events
+it missed have already been pruned (EVENTS_RETENTION) it is sent a `reset`
+event first, meaning "refetch your state". A comment line is sent after
+EVENTS_HEARTBEAT seconds of silence so proxies keep the connection open.
+
+Under ASGI, /events is answered on the event loop by serve_asgi, so an idle
+subscriber is a coroutine and a small queue rather than a thread; that is
+the mode to use for thousands of open connections. Under WSGI servers the
+Flask route streams from a thread per connection, so each worker keeps at
+most EVENTS_MAX_WSGI_STREAMS of them open (by default half of its
+SERVER_THREADS) and leaves the other threads to requests. Streams beyond
+that are answered 503 with Retry-After, and the client polls instead.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from typing import Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from prometheus_client.core import CounterMetricFamily
+
+from config import get_config
+from database import DatabaseManager, connect
+from executors import run_io
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+Event = namedtuple('Event', ['id', 'topic', 'type', 'data'])  # data: JSON text as stored
+
+MAX_TOPICS = 50
+
+RETRY_MS = 3000  # EventSource reconnect delay
+HEARTBEAT = b': ping\n\n'
+RESET = b'event: reset\ndata: {}\n\n'
+
+STREAM_HEADERS = {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'  # nginx: pass events through as they are written
+}
+
+
+def parse_topics(value: Optional[str]) -> List[str]:
+    """'farm:1,farm:2' -> ['farm:1', 'farm:2']"""
+    topics = []
+    for topic in (value or '').split(','):
+        topic = topic.strip()
+        if not topic:
+            continue
+        kind, _, key = topic.partition(':')
+        if not (kind == 'farm' and key.isdigit()):
+            raise ValueError(f"Unknown topic: {topic} (expected 'farm:<id>')")
+        if topic not in topics:
+            topics.append(topic)
+    if not topics:
+        raise ValueError('No topics requested (?topics=farm:<id>)')
+    if len(topics) > MAX_TOPICS:
+        raise ValueError(f'At most {MAX_TOPICS} topics per stream')
+    return topics
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    if not value.isdigit():
+        raise ValueError('Last-Event-ID must be an event id')
+    return int(value)
+
+
+def format_event(event: Event) -> bytes:
+    return f'id: {event.id}\nevent: {event.type}\ndata: {event.data}\n\n'.encode('utf-8')
+
+
+class Subscription:
+    """One client's topics and undelivered events"""
+
+    def __init__(self, topics: Iterable[str], loop=None, maxsize: int = 100):
+        self.topics = frozenset(topics)
+        self.loop = loop  # asyncio subscribers are fed on their own loop
+        self.queue = asyncio.Queue(maxsize) if loop is not None else queue.Queue(maxsize)
+        self.closed = False
+
+    def put(self, event: Event) -> bool:
+        """Queue an event from the subscriber's own thread or loop; False when it is too far behind"""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except (queue.Full, asyncio.QueueFull):
+            # The client catches up from the event log when it reconnects
+            self.closed = True
+            return False
+
+
+class EventBroker:
+    def __init__(self, db_path: Optional[str] = None, poll_interval: float = 0.5, retention: int = 10000,
+                 max_subscribers: int = 10000, max_threaded: Optional[int] = None, queue_size: int = 100):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.max_subscribers = max_subscribers
+        self.max_threaded = max_subscribers if max_threaded is None else max_threaded
+        self.queue_size = queue_size
+
+        self._subscribers = {}  # topic -> set of Subscription
+        self._count = 0
+        self._threaded = 0  # subscribers without a loop, each holding a request thread
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._last_id = 0
+        self.published = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    # ------------------------------------------------------------ subscribers
+
+    def subscribe(self, topics: Iterable[str], loop=None) -> Optional[Subscription]:
+        """
+        Register a subscriber; None when this worker is at EVENTS_MAX_SUBSCRIBERS,
+        or at EVENTS_MAX_WSGI_STREAMS for a threaded (loop-less) subscriber
+        """
+        self._ensure_started()
+        subscription = Subscription(topics, loop, self.queue_size)
+        with self._lock:
+            if self._count >= self.max_subscribers or (loop is None and self._threaded >= self.max_threaded):
+                self.rejected += 1
+                return None
+            self._count += 1
+            if loop is None:
+                self._threaded += 1
+            for topic in subscription.topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.closed = True
+        with self._lock:
+            removed = False
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None and subscription in subscribers:
+                    subscribers.discard(subscription)
+                    removed = True
+                    if not subscribers:
+                        del self._subscribers[topic]
+            if removed:
+                self._count -= 1
+                if subscription.loop is None:
+                    self._threaded -= 1
+
+    def publish(self, events: List[Event]):
+        """Fan events out to this process's subscribers"""
+        deliveries = []
+        with self._lock:
+            for event in events:
+                for subscription in self._subscribers.get(event.topic, ()):
+                    deliveries.append((subscription, event))
+            self.published += len(events)
+
+        # One wake-up per event loop rather than one per subscriber
+        by_loop = {}
+        for subscription, event in deliveries:
+            if subscription.loop is None:
+                self._deliver([(subscription, event)])
+            else:
+                by_loop.setdefault(subscription.loop, []).append((subscription, event))
+        for loop, batch in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(self._deliver, batch)
+            except RuntimeError:
+                pass  # loop closed; its subscribers are gone
+
+    def _deliver(self, deliveries):
+        for subscription, event in deliveries:
+            if not subscription.closed and not subscription.put(event):
+                self.dropped += 1
+                logger.warning("Dropping slow event subscriber", extra={'topics': sorted(subscription.topics)})
+
+    # ------------------------------------------------------------- event log
+
+    def replay(self, topics: Iterable[str], after_id: int) -> Tuple[List[Event], bool]:
+        """
+        Events after after_id on the topics, from the event log
+
+        Returns:
+            Tuple of (events, complete); complete is False when events after
+            after_id have been pruned and the client should refetch its state
+        """
+        topics = list(topics)
+        conn = connect(self._path())
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT MIN(id) FROM events')
+            oldest = cursor.fetchone()[0]
+            cursor.execute(f'''
+                SELECT id, topic, type, data FROM events
+                WHERE id > ? AND topic IN ({', '.join('?' * len(topics))})
+                ORDER BY id LIMIT ?
+            ''', [after_id] + topics + [self.retention])
+            events = [Event(*row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+        return events, oldest is None or oldest <= after_id + 1
+
+    def _path(self):
+        if self.db_path is None:
+            # Also creates the events table on a fresh database
+            self.db_path = DatabaseManager().db_path
+        return self.db_path
+
+    def _latest_id(self, cursor) -> int:
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def _ensure_started(self):
+        """Start the poller in this process (again after a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            conn = connect(self._path())
+            try:
+                self._last_id = self._latest_id(conn.cursor())
+            finally:
+                conn.close()
+            # Subscribers inherited from the parent belong to its connections
+            with self._lock:
+                self._subscribers.clear()
+                self._count = 0
+                self._threaded = 0
+            self._thread = threading.Thread(target=self._run, name='events', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        conn = connect(self.db_path)
+        prune_every = max(1, int(60 / self.poll_interval))
+        polls = 0
+        try:
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    self._poll(conn)
+                    polls += 1
+                    if polls % prune_every == 0:
+                        self._prune(conn)
+                except sqlite3.Error as e:
+                    logger.warning("Event poll failed: %s", e)
+        finally:
+            conn.close()
+
+    def _poll(self, conn):
+        cursor = conn.cursor()
+        while True:
+            cursor.execute('''
+                SELECT id, topic, type, data FROM events
+                WHERE id > ? ORDER BY id LIMIT 1000
+            ''', (self._last_id,))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            self._last_id = rows[-1][0]
+            if self._count:
+                self.publish([Event(*row) for row in rows])
+
+    def _prune(self, conn):
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM events WHERE id <= ?', (self._latest_id(cursor) - self.retention,))
+        conn.commit()
+
+    def stats(self):
+        return {
+            'subscribers': self._count,
+            'threaded_subscribers': self._threaded,
+            'topics': len(self._subscribers),
+            'published': self.published,
+            'dropped_slow': self.dropped,
+            'rejected': self.rejected,
+            'last_event_id': self._last_id
+        }
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> EventBroker:
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = get_config()
+                _broker = EventBroker(
+                    poll_interval=config.EVENTS_POLL_INTERVAL,
+                    retention=config.EVENTS_RETENTION,
+                    max_subscribers=config.EVENTS_MAX_SUBSCRIBERS,
+                    max_threaded=config.EVENTS_MAX_WSGI_STREAMS,
+                    queue_size=config.EVENTS_QUEUE_SIZE
+                )
+    return _broker
+
+
+def _event_metrics():
+    if _broker is None:
+        return
+    stats = _broker.stats()
+    yield metrics.gauge('agri_event_subscribers', 'Open /events streams in this worker',
+                        samples=[([], stats['subscribers'])])
+    published = CounterMetricFamily('agri_events_published', 'Events read from the event log and fanned out')
+    published.add_metric([], stats['published'])
+    yield published
+    dropped = CounterMetricFamily('agri_event_subscribers_dropped', 'Event streams closed by the server',
+                                  labels=['reason'])
+    dropped.add_metric(['slow'], stats['dropped_slow'])
+    dropped.add_metric(['limit'], stats['rejected'])
+    yield dropped
+
+
+metrics.add_gauge_callback(_event_metrics)
+
+
+# ---------------------------------------------------------------- streaming
+
+def open_stream(topics_param: Optional[str], last_event_id: Optional[str]):
+    """
+    Subscribe and collect what a reconnecting client missed
+
+    Returns:
+        (subscription, backlog bytes, last delivered id), or None when this
+        worker has no room for another threaded subscriber
+
+    Raises:
+        ValueError: For unknown topics or a malformed Last-Event-ID
+    """
+    topics = parse_topics(topics_param)
+    after_id = parse_last_event_id(last_event_id)
+    broker = get_broker()
+    subscription = broker.subscribe(topics)
+    if subscription is None:
+        return None
+    return (subscription,) + _backlog(broker, topics, after_id)
+
+
+def _backlog(broker, topics, after_id):
+    retry = f'retry: {RETRY_MS}\n\n'.encode()
+    if after_id is None:
+        return retry, broker._last_id
+    events, complete = broker.replay(topics, after_id)
+    chunks = [retry] + ([] if complete else [RESET]) + [format_event(event) for event in events]
+    return b''.join(chunks), events[-1].id if events else after_id
+
+
+def wsgi_stream(subscription: Subscription, backlog: bytes, last_id: int):
+    """Generator body for the Flask /events route: one thread per open stream"""
+    broker = get_broker()
+    heartbeat = get_config().EVENTS_HEARTBEAT
+    try:
+        yield backlog
+        while not subscription.closed:
+            try:
+                event = subscription.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield HEARTBEAT
+                continue
+            if event.id > last_id:
+                last_id = event.id
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _disconnected(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def serve_asgi(scope, receive, send):
+    """GET /events as a native ASGI handler: idle streams wait on the event loop, not on threads"""
+    params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    try:
+        topics = parse_topics(params.get('topics', [None])[-1])
+        after_id = parse_last_event_id(headers.get('last-event-id'))
+    except ValueError as e:
+        await _send_json(send, 400, {'status': 'error', 'message': str(e)})
+        return
+
+    broker = get_broker()
+    await run_io(broker._ensure_started)
+    subscription = broker.subscribe(topics, loop=asyncio.get_running_loop())
+    if subscription is None:
+        await _send_json(send, 503, {'status': 'error', 'message': 'Too many open event streams'})
+        return
+
+    heartbeat = get_config().EVENTS_HEARTBEAT
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    try:
+        backlog, last_id = await run_io(_backlog, broker, topics, after_id)
+        response_headers = [(name.lower().encode(), value.encode()) for name, value in STREAM_HEADERS.items()]
+        # Flask-CORS answers every other route with this too
+        response_headers.append((b'access-control-allow-origin', b'*'))
+        await send({'type': 'http.response.start', 'status': 200, 'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': backlog, 'more_body': True})
+
+        while not subscription.closed and not disconnected.done():
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=heartbeat,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                if not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': HEARTBEAT, 'more_body': True})
+                continue
+
+            # Send whatever else is already queued in the same write
+            events = [getter.result()]
+            while not subscription.queue.empty():
+                events.append(subscription.queue.get_nowait())
+            chunks = []
+            for event in events:
+                if event.id > last_id:
+                    last_id = event.id
+                    chunks.append(format_event(event))
+            if chunks:
+                await send({'type': 'http.response.body', 'body': b''.join(chunks), 'more_body': True})
+    finally:
+        disconnected.cancel()
+        broker.unsubscribe(subscription)
@@ -0,0 +1,102 @@
+"""
+Bounded executors for async request handlers
+
+Model inference is CPU-bound, so it runs on a pool sized to the cores:
+extra heavy requests queue for a slot instead of oversubscribing the CPU.
+Blocking I/O (SQLite) runs on its own pool so a slow write never takes an
+inference slot, and cheap in-memory reads never wait behind either.
+Sub-requests of /api/batch get a pool of their own: they wait on the other
+pools, so sharing one with them could deadlock.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import get_config
+from utils.profiling import profiled
+
+_executors = {}
+_pid = None
+_lock = threading.Lock()
+
+
+def _executor(name):
+    """Get a named executor, recreating the pools in forked worker processes"""
+    global _pid
+
+    if _pid != os.getpid():
+        with _lock:
+            if _pid != os.getpid():
+                # Pool threads do not survive a fork
+                _executors.clear()
+                _pid = os.getpid()
+
+    executor = _executors.get(name)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(name)
+            if executor is None:
+                config = get_config()
+                sizes = {
+                    'inference': config.INFERENCE_WORKERS,
+                    'io': config.IO_WORKERS,
+                    'request': config.ASGI_REQUEST_THREADS,
+                    'batch': config.BATCH_WORKERS
+                }
+                executor = ThreadPoolExecutor(max_workers=sizes[name], thread_name_prefix=name)
+                _executors[name] = executor
+    return executor
+
+
+def inference_executor():
+    """Pool for model inference"""
+    return _executor('inference')
+
+
+def io_executor():
+    """Pool for database calls"""
+    return _executor('io')
+
+
+def request_executor():
+    """Pool that runs WSGI requests under the ASGI server"""
+    return _executor('request')
+
+
+def batch_executor():
+    """Pool that dispatches the sub-requests of /api/batch"""
+    return _executor('batch')
+
+
+async def _run_in(executor, func, *args, **kwargs):
+    """Run func on an executor, carrying the caller's context variables along"""
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, profiled(func), *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+async def run_inference(func, *args, **kwargs):
+    """Await a model call on the inference pool"""
+    return await _run_in(inference_executor(), func, *args, **kwargs)
+
+
+async def run_io(func, *args, **kwargs):
+    """Await a blocking database call on the I/O pool"""
+    return await _run_in(io_executor(), func, *args, **kwargs)
+
+
+async def run_subrequest(func, *args, **kwargs):
+    """Await a batched sub-request on the batch pool"""
+    return await _run_in(batch_executor(), func, *args, **kwargs)
+
+
+def shutdown():
+    """Stop all pools, waiting for running work to finish"""
+    with _lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=True)
+        _executors.clear()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Incremental retraining of the yield model from harvest outcomes
+
+Instead of refitting yield_prediction_pipeline.pkl on all of crop-yield.csv,
+a run continues boosting the current XGBoost booster with only the harvest
+outcomes recorded since the last published run (harvest_outcomes joined to
+farm_analyses). The fitted preprocessor is kept as is. Boosting stops after
+RETRAIN_ROUNDS rounds or RETRAIN_MAX_SECONDS, whichever comes first.
+
+Every RETRAIN_HOLDOUT_EVERY-th outcome is never trained on. The updated
+model is published only if its RMSE on those held-out outcomes does not
+regress (beyond RETRAIN_TOLERANCE). The RMSE on a sample of the original
+training data is reported too, to show how far the model moved from what
+it learned before; it only blocks publishing when
+RETRAIN_REFERENCE_TOLERANCE is set, since real drift in yields raises it.
+Every run is recorded in model_training_runs; the published file replaces
+the old one atomically, and the old one is kept as .prev. Serving
+processes pick the new model up when they restart.
+
+    python retraining.py               # train on outcomes since the last published run
+    python retraining.py --dry-run     # evaluate without publishing
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import Pipeline
+from xgboost import XGBRegressor
+from xgboost.callback import TrainingCallback
+
+from config import get_config
+from database import DatabaseManager
+from services.yield_prediction import FEATURE_COLUMNS, FEATURE_DEFAULTS
+from utils.features import CATEGORICAL_YIELD_COLUMNS, add_yield_features
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'yield'
+TARGET_COLUMN = 'Crop_Yield_ton_per_hectare'
+
+# Pipeline input <- column of get_labelled_analyses(); Soil_Moisture is not
+# recorded, so it takes its default
+ANALYSIS_FEATURES = {
+    'N': 'nitrogen', 'P': 'phosphorus', 'K': 'potassium', 'Soil_pH': 'ph',
+    'Soil_Type': 'soil_type', 'Organic_Carbon': 'organic_carbon',
+    'Temperature': 'temperature', 'Humidity': 'humidity', 'Rainfall': 'rainfall',
+    'Sunlight_Hours': 'sunlight_hours', 'Wind_Speed': 'wind_speed', 'Region': 'region',
+    'Altitude': 'altitude', 'Season': 'season', 'Crop_Type': 'crop_type',
+    'Irrigation_Type': 'irrigation_type', 'Fertilizer_Used': 'fertilizer_used',
+    'Pesticide_Used': 'pesticide_used'
+}
+
+
+def analysis_features(rows):
+    """Pipeline input frame for labelled analyses, missing values filled like the service does"""
+    features = pd.DataFrame(
+        [{column: row.get(source) for column, source in ANALYSIS_FEATURES.items()} for row in rows],
+        columns=FEATURE_COLUMNS
+    )
+    for column in FEATURE_COLUMNS:
+        if column in CATEGORICAL_YIELD_COLUMNS:
+            features[column] = features[column].fillna(FEATURE_DEFAULTS.get(column, 'Unknown')).astype(str)
+        else:
+            features[column] = pd.to_numeric(features[column]).fillna(FEATURE_DEFAULTS.get(column, 0))
+    return add_yield_features(features)
+
+
+def rmse(model, X, y):
+    return float(np.sqrt(np.mean((model.predict(X) - y) ** 2)))
+
+
+class _Deadline(TrainingCallback):
+    """Stops boosting once the time budget is spent"""
+
+    def __init__(self, seconds):
+        super().__init__()
+        self.deadline = time.monotonic() + seconds
+        self.reached = False
+
+    def after_iteration(self, model, epoch, evals_log):
+        self.reached = time.monotonic() >= self.deadline
+        return self.reached
+
+
+class YieldRetrainer:
+    def __init__(self, db_manager=None, model_path=None, reference_path=None, max_seconds=None,
+                 rounds=None, min_rows=None, holdout_every=None, reference_rows=None, tolerance=None,
+                 reference_tolerance=None):
+        config = get_config()
+        self.db = db_manager or DatabaseManager()
+        self.model_path = model_path or config.YIELD_PREDICTION_MODEL
+        self.reference_path = reference_path or config.YIELD_TRAINING_DATA
+        self.max_seconds = max_seconds if max_seconds is not None else config.RETRAIN_MAX_SECONDS
+        self.rounds = rounds or config.RETRAIN_ROUNDS
+        self.min_rows = min_rows if min_rows is not None else config.RETRAIN_MIN_ROWS
+        self.holdout_every = holdout_every or config.RETRAIN_HOLDOUT_EVERY
+        self.reference_rows = reference_rows if reference_rows is not None else config.RETRAIN_REFERENCE_ROWS
+        self.tolerance = tolerance if tolerance is not None else config.RETRAIN_TOLERANCE
+        self.reference_tolerance = (reference_tolerance if reference_tolerance is not None
+                                    else config.RETRAIN_REFERENCE_TOLERANCE)
+
+    def is_holdout(self, outcome):
+        return outcome['outcome_id'] % self.holdout_every == 0
+
+    def _reference_sample(self):
+        """(X, y) sampled from the original training data, or None if it is not available"""
+        if not self.reference_rows or not os.path.exists(self.reference_path):
+            logger.warning("No reference data at %s; validating on harvest outcomes only", self.reference_path)
+            return None
+        reference = pd.read_csv(self.reference_path)
+        reference = reference.sample(min(self.reference_rows, len(reference)), random_state=42)
+        return add_yield_features(reference.drop(TARGET_COLUMN, axis=1)), reference[TARGET_COLUMN].to_numpy()
+
+    def run(self, since=None, dry_run=False):
+        """
+        Train on the outcomes recorded after `since` (default: the last
+        published run) and publish the result if it does not regress
+
+        Returns:
+            Summary of the run
+        """
+        started_at = datetime.now().isoformat()
+        started = time.perf_counter()
+        if since is None:
+            last_run = self.db.get_last_training_run(MODEL_NAME)
+            since = (last_run['last_outcome_id'] or 0) if last_run else 0
+
+        outcomes = self.db.get_labelled_analyses(since)
+        train = [outcome for outcome in outcomes if not self.is_holdout(outcome)]
+        summary = {'model': MODEL_NAME, 'since_outcome_id': since, 'new_outcomes': len(outcomes),
+                   'train_rows': len(train), 'published': False}
+        if len(train) < self.min_rows:
+            summary['reason'] = f'{len(train)} new training rows, {self.min_rows} needed'
+            return summary
+
+        # Every held-out outcome so far, not just the new ones
+        holdout = [outcome for outcome in self.db.get_labelled_analyses() if self.is_holdout(outcome)]
+        if not holdout:
+            summary['reason'] = 'no held-out harvest outcomes to validate against'
+            return summary
+
+        pipeline = joblib.load(self.model_path)
+        preprocessor = pipeline.named_steps['preprocessor']
+        baseline = pipeline.named_steps['model']
+        base_rounds = baseline.get_booster().num_boosted_rounds()
+
+        validation = {'harvest_holdout': (analysis_features(holdout),
+                                          np.array([outcome['actual_yield'] for outcome in holdout]))}
+        reference = self._reference_sample()
+        if reference is not None:
+            validation['reference'] = reference
+        evaluation = {name: {'rows': len(y), 'rmse_before': rmse(pipeline, X, y)}
+                      for name, (X, y) in validation.items()}
+
+        # Continue boosting from the current booster; the preprocessor stays fitted as is
+        deadline = _Deadline(self.max_seconds)
+        candidate = XGBRegressor(**{**baseline.get_params(), 'n_estimators': self.rounds, 'callbacks': [deadline]})
+        fit_started = time.perf_counter()
+        candidate.fit(preprocessor.transform(analysis_features(train)),
+                      np.array([outcome['actual_yield'] for outcome in train]),
+                      xgb_model=baseline.get_booster())
+        fit_seconds = time.perf_counter() - fit_started
+        total_rounds = candidate.get_booster().num_boosted_rounds()
+        candidate.set_params(n_estimators=total_rounds, callbacks=None)
+        updated = Pipeline(steps=[('preprocessor', preprocessor), ('model', candidate)])
+
+        for name, (X, y) in validation.items():
+            evaluation[name]['rmse_after'] = rmse(updated, X, y)
+        tolerances = {'harvest_holdout': self.tolerance, 'reference': self.reference_tolerance}
+        regressed = [name for name, scores in evaluation.items() if tolerances[name] is not None
+                     and scores['rmse_after'] > scores['rmse_before'] * (1 + tolerances[name])]
+
+        summary.update({
+            'holdout_rows': len(holdout),
+            'rounds_added': total_rounds - base_rounds,
+            'stopped_by_time_budget': deadline.reached,
+            'fit_seconds': round(fit_seconds, 3),
+            'evaluation': evaluation,
+            'regressed': regressed
+        })
+        if regressed:
+            summary['reason'] = f"holdout RMSE regressed on {', '.join(regressed)}"
+        elif dry_run:
+            summary['reason'] = 'dry run'
+        else:
+            self._publish(updated)
+            summary['published'] = True
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+
+        if not dry_run:
+            summary['run_id'] = self.db.add_training_run(
+                MODEL_NAME, started_at, max(outcome['outcome_id'] for outcome in outcomes),
+                len(train), summary['rounds_added'], summary['published'], summary)
+        logger.info("Yield retraining %s: %s", 'published' if summary['published'] else 'not published',
+                    summary.get('reason', f"{summary['rounds_added']} rounds on {len(train)} rows"))
+        return summary
+
+    def _publish(self, pipeline):
+        """Replace the model file atomically, keeping the previous one as .prev"""
+        temporary = f'{self.model_path}.tmp'
+        joblib.dump(pipeline, temporary)
+        if os.path.exists(self.model_path):
+            shutil.copy2(self.model_path, f'{self.model_path}.prev')
+        os.replace(temporary, self.model_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Continue training the yield model on new harvest outcomes')
+    parser.add_argument('--db', default='agricultural_platform.db', help='Database path')
+    parser.add_argument('--model', help='Yield pipeline to update (default: YIELD_PREDICTION_MODEL)')
+    parser.add_argument('--since', type=int, help='Train on outcomes after this id (default: last published run)')
+    parser.add_argument('--max-seconds', type=float, help='Time budget for boosting')
+    parser.add_argument('--rounds', type=int, help='Boosting rounds to add, at most')
+    parser.add_argument('--dry-run', action='store_true', help='Evaluate without publishing or recording the run')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    retrainer = YieldRetrainer(DatabaseManager(args.db), model_path=args.model,
+                               max_seconds=args.max_seconds, rounds=args.rounds)
+    print(json.dumps(retrainer.run(since=args.since, dry_run=args.dry_run), indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
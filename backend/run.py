@@ -1,24 +1,95 @@
 """
 Runner script for AI Agricultural Platform Backend
+
+SERVER_MODE=development (the default outside FLASK_ENV=production) starts
+Flask's built-in server. SERVER_MODE=production serves the app with
+gunicorn: the app and its models are loaded once in the master process
+before the workers fork, so workers share the model memory.
+SERVER_MODE=asgi does the same with uvicorn workers serving asgi.py: requests
+run on a bounded thread pool, and /events streams wait on the event loop
+without holding a thread (see asgi.py).
 """
 
 import os
 import sys
-from app import app
+import tempfile
 
-if __name__ == '__main__':
-    # Get configuration from environment
-    env = os.environ.get('FLASK_ENV', 'development')
+ENV = os.environ.get('FLASK_ENV', 'development')
+MODE = os.environ.get('SERVER_MODE', 'production' if ENV == 'production' else 'development')
+
+if MODE in ('production', 'asgi') and not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    # Workers share metric files so /metrics aggregates all of them; must be set before the app imports
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='agri-metrics-')
+
+from app import app, services, start_warmup
+from config import get_config
+
+def worker_exit_metrics(server, worker):
+    """Drop a dead worker's live gauges from the shared metric files"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+def production_options(host, port, asgi=False):
+    """Gunicorn settings derived from config and the CPU count"""
+    config = get_config()
+    return {
+        'bind': f'{host}:{port}',
+        # Inference is CPU-bound: one process per core, threads to overlap DB and network waits
+        'workers': config.SERVER_WORKERS,
+        'worker_class': 'uvicorn.workers.UvicornWorker' if asgi else 'gthread',
+        'threads': config.SERVER_THREADS,
+        'preload_app': True,
+        'keepalive': config.SERVER_KEEPALIVE,
+        'timeout': config.SERVER_TIMEOUT,
+        'graceful_timeout': config.SERVER_GRACEFUL_TIMEOUT,
+        'max_requests': config.SERVER_MAX_REQUESTS,
+        'max_requests_jitter': config.SERVER_MAX_REQUESTS_JITTER,
+        'accesslog': '-',
+        'child_exit': worker_exit_metrics
+    }
+
+def run_production(host, port, asgi=False):
+    """Serve the already-imported app with gunicorn"""
+    from gunicorn.app.base import BaseApplication
+    
+    class ProductionServer(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+        
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+        
+        def load(self):
+            return self.application
+    
+    if asgi:
+        from asgi import application
+    else:
+        application = app
     
+    # Services are otherwise built on first use; build and warm them here so forked workers share them
+    start_warmup(background=False)
+    services.load_all()
+    ProductionServer(application, production_options(host, port, asgi)).run()
+
+if __name__ == '__main__':
     # Set host and port
     host = os.environ.get('HOST', '0.0.0.0')
     port = int(os.environ.get('PORT', 5000))
-    debug = env == 'development'
+    debug = ENV == 'development' and MODE == 'development'
     
     print(f"🌾 AI Agricultural Platform Backend")
-    print(f"📍 Environment: {env}")
+    print(f"📍 Environment: {ENV}")
+    print(f"🖥️ Server mode: {MODE}")
     print(f"🌐 Server: http://{host}:{port}")
     print(f"📚 API Documentation: http://{host}:{port}/")
     print(f"🚀 Starting server...")
     
-    app.run(host=host, port=port, debug=debug)
+    if MODE in ('production', 'asgi'):
+        run_production(host, port, asgi=MODE == 'asgi')
+    else:
+        start_warmup()
+        app.run(host=host, port=port, debug=debug)
@@ -6,4 +6,6 @@ This package contains all the core services for the agricultural platform:
 - YieldPredictionService: Predicts crop yields using ML models
 - FarmEfficiencyService: Calculates farm efficiency metrics
 - MarketPriceService: Provides market prices and revenue predictions
+- WorkflowEngine: Runs the prediction pipeline as a graph of concurrent stages
+- ServiceRegistry: Builds the services above on first use
 """
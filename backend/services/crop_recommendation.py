@@ -1,13 +1,20 @@
+import logging
 import pandas as pd
 import numpy as np
 import joblib
 import os
 from typing import Dict, List, Tuple
 from config import get_config
+from utils.helpers import file_version
+from utils.cache import memoize
+from utils.metrics import fallback, timed
+
+logger = logging.getLogger(__name__)
 
 class CropRecommendationService:
     def __init__(self):
         self.model = None
+        self.model_version = None
         self.crop_mapping = {
             0: 'rice', 1: 'maize', 2: 'chickpea', 3: 'kidneybeans', 4: 'pigeonpeas',
             5: 'mothbeans', 6: 'mungbean', 7: 'blackgram', 8: 'lentil', 9: 'pomegranate',
@@ -24,17 +31,20 @@ class CropRecommendationService:
             config = get_config()
             model_path = config.CROP_RECOMMENDATION_MODEL
             self.model = joblib.load(model_path)
-            print("✅ Crop recommendation model loaded successfully")
+            self.model_version = file_version(model_path)
+            logger.info("Crop recommendation model loaded")
         except Exception as e:
-            print(f"⚠️ Could not load crop recommendation model: {e}")
+            logger.warning("Could not load crop recommendation model: %s", e)
             self.model = None
     
-    def recommend_crop(self, input_data: Dict) -> Dict:
+    @timed('inference', 'recommend_crop')
+    def recommend_crop(self, input_data: Dict, feature_importance: bool = True) -> Dict:
         """
         Recommend the best crop based on environmental conditions
         
         Args:
             input_data: Dictionary containing temperature, humidity, ph, rainfall
+            feature_importance: Include the model's feature importances
             
         Returns:
             Dictionary with recommended crop and confidence scores
@@ -64,19 +74,21 @@ class CropRecommendationService:
                     'confidence': confidence
                 })
             
-            # Get feature importance
-            feature_importance = self._get_feature_importance(features)
-            
-            return {
+            result = {
                 'recommended_crop': recommended_crop,
                 'confidence': float(probabilities[prediction]),
                 'top_recommendations': top_crops,
-                'feature_importance': feature_importance,
                 'input_conditions': input_data
             }
             
+            # Get feature importance
+            if feature_importance:
+                result['feature_importance'] = self._get_feature_importance(features)
+            
+            return result
+            
         except Exception as e:
-            print(f"Error in crop recommendation: {e}")
+            logger.error("Error in crop recommendation: %s", e, exc_info=True)
             return self._fallback_recommendation(input_data)
     
     def _prepare_input(self, input_data: Dict) -> np.ndarray:
@@ -104,6 +116,7 @@ class CropRecommendationService:
         except:
             return {}
     
+    @fallback('crop')
     def _fallback_recommendation(self, input_data: Dict) -> Dict:
         """Fallback recommendation when model is not available"""
         # Simple rule-based recommendation
@@ -139,6 +152,7 @@ class CropRecommendationService:
             'note': 'Using fallback recommendation (model not available)'
         }
     
+    @memoize('crop_requirements', timeout=0)
     def get_crop_requirements(self, crop_name: str) -> Dict:
         """Get typical requirements for a specific crop"""
         crop_requirements = {
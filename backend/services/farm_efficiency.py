@@ -1,12 +1,15 @@
+import logging
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Any
-from sklearn.preprocessing import MinMaxScaler
 import os
+from utils.cache import memoize
+from utils.metrics import fallback
+
+logger = logging.getLogger(__name__)
 
 class FarmEfficiencyService:
     def __init__(self):
-        self.scaler = MinMaxScaler()
         self.efficiency_benchmarks = self._load_benchmarks()
     
     def _load_benchmarks(self) -> Dict:
@@ -35,12 +38,15 @@ class FarmEfficiencyService:
             'avg_input_efficiency': 0.0001  # yield per total input
         }
     
-    def calculate_efficiency(self, input_data: Dict) -> Dict:
+    def calculate_efficiency(self, input_data: Dict, recommendations: bool = True,
+                             benchmarks: bool = True) -> Dict:
         """
         Calculate comprehensive farm efficiency metrics
         
         Args:
             input_data: Dictionary containing farm data
+            recommendations: Include improvement recommendations
+            benchmarks: Include the reference benchmarks the scores are measured against
             
         Returns:
             Dictionary with efficiency metrics and scores
@@ -64,25 +70,76 @@ class FarmEfficiencyService:
             # Calculate final efficiency score
             final_score = self._calculate_final_efficiency_score(normalized_scores)
             
-            # Generate recommendations
-            recommendations = self._generate_recommendations(efficiency_metrics, normalized_scores)
-            
             # Performance rating
             performance_rating = self._get_performance_rating(final_score)
             
-            return {
+            result = {
                 'efficiency_metrics': efficiency_metrics,
                 'normalized_scores': normalized_scores,
                 'final_efficiency_score': final_score,
-                'performance_rating': performance_rating,
-                'recommendations': recommendations,
-                'benchmarks': self.efficiency_benchmarks
+                'performance_rating': performance_rating
             }
             
+            # Generate recommendations
+            if recommendations:
+                result['recommendations'] = self._generate_recommendations(efficiency_metrics, normalized_scores)
+            if benchmarks:
+                result['benchmarks'] = self.efficiency_benchmarks
+            
+            return result
+            
         except Exception as e:
-            print(f"Error calculating efficiency: {e}")
+            logger.error("Error calculating efficiency: %s", e, exc_info=True)
             return self._fallback_efficiency(input_data)
     
+    def calculate_efficiency_scores(self, farm_area, fertilizer_used, pesticide_used,
+                                    water_usage, yield_tons) -> np.ndarray:
+        """
+        Vectorized final efficiency score for many farms at once
+        
+        Mirrors calculate_efficiency()['final_efficiency_score'] for each
+        element of the input arrays.
+        """
+        farm_area = np.asarray(farm_area, dtype=float)
+        fertilizer = np.asarray(fertilizer_used, dtype=float)
+        pesticide = np.asarray(pesticide_used, dtype=float)
+        water = np.asarray(water_usage, dtype=float)
+        yield_tons = np.asarray(yield_tons, dtype=float)
+        
+        def ratio(numerator, denominator):
+            return np.divide(numerator, denominator,
+                             out=np.zeros_like(numerator), where=denominator > 0)
+        
+        metrics = {
+            'yield_per_acre': ratio(yield_tons, farm_area),
+            'water_efficiency': ratio(yield_tons, water),
+            'fertilizer_efficiency': ratio(yield_tons, fertilizer),
+            'pesticide_efficiency': ratio(yield_tons, pesticide),
+            'input_efficiency': ratio(yield_tons, fertilizer + (pesticide / 1000) + (water / 10000))
+        }
+        
+        weights = {
+            'yield_per_acre': 0.25,
+            'water_efficiency': 0.20,
+            'fertilizer_efficiency': 0.20,
+            'pesticide_efficiency': 0.15,
+            'input_efficiency': 0.20
+        }
+        
+        # Same normalization rules as _normalize_efficiency_scores
+        weighted_sum = np.zeros_like(yield_tons)
+        for metric, values in metrics.items():
+            if metric in self.efficiency_benchmarks:
+                benchmark = self.efficiency_benchmarks[metric]
+                score = np.minimum(1.0, values / benchmark) if benchmark > 0 else np.zeros_like(values)
+            elif 'per_acre' in metric:
+                score = np.minimum(1.0, values / 10)
+            else:
+                score = np.minimum(1.0, values)
+            weighted_sum += score * weights[metric]
+        
+        return np.round(weighted_sum / sum(weights.values()), 3)
+    
     def _calculate_individual_efficiencies(self, farm_area: float, fertilizer: float, 
                                          pesticide: float, water: float, yield_tons: float) -> Dict:
         """Calculate individual efficiency metrics"""
@@ -229,6 +286,7 @@ class FarmEfficiencyService:
         else:
             return "Very Poor"
     
+    @fallback('efficiency')
     def _fallback_efficiency(self, input_data: Dict) -> Dict:
         """Fallback efficiency calculation when errors occur"""
         return {
@@ -241,6 +299,7 @@ class FarmEfficiencyService:
             'error': 'Fallback calculation used'
         }
     
+    @memoize('benchmarks')
     def compare_with_benchmarks(self, farm_metrics: Dict) -> Dict:
         """Compare farm metrics with industry benchmarks"""
         comparison = {}
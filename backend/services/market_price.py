@@ -1,16 +1,25 @@
+import logging
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Any, Optional
 import os
+import time
+import uuid
 from datetime import datetime, timedelta
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import StandardScaler
 from config import get_config
+from utils.helpers import file_version
+from utils.cache import memoize
+from utils.metrics import fallback, timed
+
+logger = logging.getLogger(__name__)
 
 class MarketPriceService:
     def __init__(self):
         self.price_data = None
         self.price_features = None
+        # Identifies the loaded dataset for ETags; changes whenever it is (re)loaded from a different source
+        self.data_version = None
+        self.data_updated_at = None
         self.crop_mapping = self._create_crop_mapping()
         self.load_price_data()
     
@@ -37,11 +46,18 @@ class MarketPriceService:
             data_path = config.MARKET_PRICE_DATA
             self.price_data = pd.read_csv(data_path)
             self.price_data['Date'] = pd.to_datetime(self.price_data['Date'])
-            print("✅ Market price data loaded successfully")
+            self.data_version = file_version(data_path)
+            self.data_updated_at = int(os.path.getmtime(data_path))
+            logger.info("Market price data loaded")
         except Exception as e:
-            print(f"⚠️ Could not load market price data: {e}")
-            # Create fallback data
+            logger.warning("Could not load market price data: %s", e)
+            # Create fallback data (random, so unique to this process)
             self.price_data = self._create_sample_data()
+            self.data_version = f"sample-{uuid.uuid4().hex}"
+            self.data_updated_at = int(time.time())
+        
+        # Per-crop statistics for get_market_price, computed once per load
+        self._calculate_price_features()
     
     def _create_sample_data(self):
         """Create sample price data when real data is not available"""
@@ -62,9 +78,8 @@ class MarketPriceService:
                     'Price_per_Ton_EGP': max(price, 1000)  # Minimum price
                 })
         
-        self.price_data = pd.DataFrame(data)
-        self._calculate_price_features()
-        print("✅ Sample market price data created")
+        logger.info("Sample market price data created")
+        return pd.DataFrame(data)
     
     def _calculate_price_features(self):
         """Calculate price features for analysis"""
@@ -87,6 +102,9 @@ class MarketPriceService:
         # Add price volatility
         self.price_features['Price_Volatility'] = self.price_features['Price_Std'] / self.price_features['Avg_Price']
     
+    # Keyed by dataset version, so a reload never serves stale prices
+    @memoize('market', key=lambda self, crop_name=None: f"{self.data_version}:{(crop_name or '').lower()}")
+    @timed('price_lookup', 'get_market_price')
     def get_market_price(self, crop_name: Optional[str] = None) -> Dict:
         """
         Get current market prices for crops
@@ -155,7 +173,7 @@ class MarketPriceService:
                 }
                 
         except Exception as e:
-            print(f"Error getting market price: {e}")
+            logger.error("Error getting market price: %s", e, exc_info=True)
             return self._fallback_price_data(crop_name)
     
     def _calculate_price_trend(self, crop_data: pd.DataFrame) -> Dict:
@@ -171,6 +189,7 @@ class MarketPriceService:
             y = recent_data['Price_per_Ton_EGP'].values
             
             # Simple linear regression for trend
+            from sklearn.linear_model import LinearRegression
             model = LinearRegression()
             model.fit(X, y)
             
@@ -201,7 +220,7 @@ class MarketPriceService:
             }
             
         except Exception as e:
-            print(f"Error calculating trend: {e}")
+            logger.error("Error calculating trend: %s", e, exc_info=True)
             return {'trend': 'error', 'direction': 'unknown'}
     
     def _get_recent_prices(self, crop_data: pd.DataFrame, days: int) -> List[Dict]:
@@ -235,15 +254,21 @@ class MarketPriceService:
             return summary
             
         except Exception as e:
-            print(f"Error creating market summary: {e}")
+            logger.error("Error creating market summary: %s", e, exc_info=True)
             return {}
     
-    def predict_revenue(self, input_data: Dict) -> Dict:
+    def predict_revenue(self, input_data: Dict, price_data: Optional[Dict] = None,
+                        risk_analysis: bool = True, scenarios: bool = True,
+                        recommendations: bool = True) -> Dict:
         """
         Predict revenue based on yield and market prices
         
         Args:
             input_data: Dictionary with crop_type, predicted_yield, farm_area
+            price_data: Result of get_market_price for the crop, if already looked up
+            risk_analysis: Include the price risk analysis
+            scenarios: Include pessimistic/realistic/optimistic revenue scenarios
+            recommendations: Include revenue recommendations (these use the risk analysis)
             
         Returns:
             Dictionary with revenue prediction and analysis
@@ -254,7 +279,8 @@ class MarketPriceService:
             farm_area = float(input_data.get('farm_area', 1))
             
             # Get market price for the crop
-            price_data = self.get_market_price(crop_type)
+            if price_data is None:
+                price_data = self.get_market_price(crop_type)
             
             if 'error' in price_data:
                 return self._fallback_revenue_prediction(input_data)
@@ -273,15 +299,7 @@ class MarketPriceService:
             net_revenue = gross_revenue - total_cost
             profit_margin = (net_revenue / gross_revenue) * 100 if gross_revenue > 0 else 0
             
-            # Price risk analysis
-            price_risk = self._analyze_price_risk(price_data)
-            
-            # Revenue scenarios
-            scenarios = self._calculate_revenue_scenarios(
-                total_yield, current_price, cost_per_ton, price_data
-            )
-            
-            return {
+            result = {
                 'crop_type': crop_type,
                 'predicted_yield_per_hectare': predicted_yield,
                 'farm_area': farm_area,
@@ -292,16 +310,29 @@ class MarketPriceService:
                 'net_revenue_egp': net_revenue,
                 'profit_margin_percentage': profit_margin,
                 'revenue_per_hectare': gross_revenue / farm_area if farm_area > 0 else 0,
-                'net_revenue_per_hectare': net_revenue / farm_area if farm_area > 0 else 0,
-                'price_risk_analysis': price_risk,
-                'revenue_scenarios': scenarios,
-                'recommendations': self._generate_revenue_recommendations(
-                    net_revenue, profit_margin, price_risk
-                )
+                'net_revenue_per_hectare': net_revenue / farm_area if farm_area > 0 else 0
             }
             
+            # Price risk analysis
+            if risk_analysis or recommendations:
+                price_risk = self._analyze_price_risk(price_data)
+                if risk_analysis:
+                    result['price_risk_analysis'] = price_risk
+                if recommendations:
+                    result['recommendations'] = self._generate_revenue_recommendations(
+                        net_revenue, profit_margin, price_risk
+                    )
+            
+            # Revenue scenarios
+            if scenarios:
+                result['revenue_scenarios'] = self._calculate_revenue_scenarios(
+                    total_yield, current_price, cost_per_ton, price_data
+                )
+            
+            return result
+            
         except Exception as e:
-            print(f"Error predicting revenue: {e}")
+            logger.error("Error predicting revenue: %s", e, exc_info=True)
             return self._fallback_revenue_prediction(input_data)
     
     def _estimate_production_cost(self, crop_type: str) -> float:
@@ -409,6 +440,7 @@ class MarketPriceService:
         
         return recommendations
     
+    @fallback('price')
     def _fallback_price_data(self, crop_name: Optional[str] = None) -> Dict:
         """Fallback price data when real data is not available"""
         sample_prices = {
@@ -440,6 +472,7 @@ class MarketPriceService:
                 'note': 'Using sample price data'
             }
     
+    @fallback('revenue')
     def _fallback_revenue_prediction(self, input_data: Dict) -> Dict:
         """Fallback revenue prediction"""
         crop_type = input_data.get('crop_type', 'unknown')
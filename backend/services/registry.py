@@ -0,0 +1,85 @@
+"""
+Lazy service registry
+
+Services are registered as 'module:Class' paths (or factories) and built on
+first use, so importing the app does not import pandas, scikit-learn,
+XGBoost or SHAP, or load any model. The first request needing a service pays
+for its construction once; load_all() builds everything up front, which the
+production server does before forking its workers.
+"""
+
+import importlib
+import logging
+import threading
+import time
+from typing import Callable, Dict, Union
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve(path: str):
+    module_name, _, attribute = path.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._lock = threading.RLock()
+        # Seconds each service took to build, imports included
+        self.load_times = {}
+
+    def register(self, name: str, factory: Union[str, Callable]):
+        """
+        Register a service
+
+        Args:
+            name: Service name used with get()
+            factory: 'module:Class' path, or a callable taking the registry
+        """
+        self._factories[name] = factory
+
+    def get(self, name: str):
+        """Service instance, built on first call"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                factory = self._factories[name]
+                started = time.perf_counter()
+                if isinstance(factory, str):
+                    instance = _resolve(factory)()
+                else:
+                    instance = factory(self)
+                self.load_times[name] = time.perf_counter() - started
+                self._instances[name] = instance
+                logger.info("Loaded service %s", name, extra={'load_ms': round(self.load_times[name] * 1000, 1)})
+        return instance
+
+    def loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def names(self):
+        return list(self._factories)
+
+    def load_all(self) -> Dict[str, float]:
+        """Build every registered service; returns load seconds per service"""
+        for name in self._factories:
+            self.get(name)
+        return dict(self.load_times)
+
+
+def create_registry() -> ServiceRegistry:
+    """Registry with the platform's services"""
+    registry = ServiceRegistry()
+    registry.register('crop', 'services.crop_recommendation:CropRecommendationService')
+    registry.register('yield', 'services.yield_prediction:YieldPredictionService')
+    registry.register('efficiency', 'services.farm_efficiency:FarmEfficiencyService')
+    registry.register('price', 'services.market_price:MarketPriceService')
+    registry.register('workflow', lambda services: _resolve('services.workflow:WorkflowEngine')(
+        services.get('crop'), services.get('yield'), services.get('price'), services.get('efficiency')))
+    return registry
@@ -0,0 +1,154 @@
+"""
+Warmup before the server reports ready
+
+Builds every service and runs a few rounds of synthetic inputs through crop
+recommendation, yield prediction (with explanations), revenue and efficiency,
+so first-request costs are paid before traffic arrives: lazy allocations in
+scikit-learn and XGBoost, the SHAP import, pandas code paths and the price
+lookups. The results are discarded; what is kept is how long it took and
+whether each service answered from its model or from its fallback rules,
+which /health/ready reports.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict
+
+from utils.metrics import trace_fallbacks
+
+logger = logging.getLogger(__name__)
+
+# Warmup task -> registry service it exercises
+TASKS = {'crop': 'crop', 'yield': 'yield', 'revenue': 'price', 'efficiency': 'efficiency'}
+
+CLIMATES = [
+    {'temperature': 25.5, 'humidity': 65, 'ph': 6.8, 'rainfall': 120},
+    {'temperature': 32.0, 'humidity': 80, 'ph': 6.2, 'rainfall': 240},
+    {'temperature': 18.0, 'humidity': 45, 'ph': 7.4, 'rainfall': 60},
+    {'temperature': 28.0, 'humidity': 55, 'ph': 5.8, 'rainfall': 90}
+]
+
+CROPS = ['wheat', 'rice', 'maize', 'cotton', 'potato', 'tomato']
+
+FARMS = [
+    {'farm_area': 50, 'fertilizer_used': 5, 'pesticide_used': 2, 'water_usage': 50000, 'yield': 4.2},
+    {'farm_area': 5, 'fertilizer_used': 0.8, 'pesticide_used': 0.3, 'water_usage': 4000, 'yield': 0.6},
+    {'farm_area': 200, 'fertilizer_used': 30, 'pesticide_used': 9, 'water_usage': 260000, 'yield': 22.0}
+]
+
+
+def _yield_inputs():
+    return [{
+        'N': 50, 'P': 40, 'K': 45, 'Soil_pH': climate['ph'], 'Temperature': climate['temperature'],
+        'Humidity': climate['humidity'], 'Rainfall': climate['rainfall'], 'Crop_Type': crop,
+        'Irrigation_Type': 'Canal', 'Fertilizer_Used': 100, 'Pesticide_Used': 2.5
+    } for climate, crop in zip(CLIMATES, CROPS)]
+
+
+def _revenue_inputs():
+    return [{'crop_type': crop, 'predicted_yield': 4.0, 'farm_area': farm['farm_area']}
+            for crop, farm in zip(CROPS, FARMS * 2)]
+
+
+class Warmup:
+    """Runs the warmup once and keeps its outcome for the readiness probe"""
+
+    def __init__(self, services, rounds: int = 2):
+        self.services = services
+        self.rounds = rounds
+        self.state = 'pending'  # running, ready, failed, skipped
+        self.started_at = None
+        self.duration = None
+        self.error = None
+        self.results = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _batches(self):
+        """Callable running one batch per warmup task"""
+        crop = self.services.get('crop')
+        yield_service = self.services.get('yield')
+        price = self.services.get('price')
+        efficiency = self.services.get('efficiency')
+        return {
+            'crop': lambda: [crop.recommend_crop(data) for data in CLIMATES],
+            'yield': lambda: [yield_service.predict_yield(data) for data in _yield_inputs()],
+            'revenue': lambda: [price.predict_revenue(data) for data in _revenue_inputs()],
+            'efficiency': lambda: [efficiency.calculate_efficiency(data) for data in FARMS]
+        }
+
+    def _run_task(self, service_name, batch) -> Dict:
+        service = self.services.get(service_name)
+        started = time.perf_counter()
+        with trace_fallbacks() as fallbacks:
+            for _ in range(self.rounds):
+                batch()
+        result = {
+            'path': 'fallback' if fallbacks else 'model',
+            'warmup_ms': round((time.perf_counter() - started) * 1000, 1),
+            'load_ms': round(self.services.load_times.get(service_name, 0) * 1000, 1)
+        }
+        if fallbacks:
+            result['fallbacks'] = sorted(fallbacks)
+        if hasattr(service, 'model_version'):
+            result['model_version'] = service.model_version
+        if hasattr(service, 'data_version'):
+            result['data_version'] = service.data_version
+        return result
+
+    def run(self):
+        """Warm up in the calling thread; no-op once it has run"""
+        with self._lock:
+            if self.state not in ('pending', 'failed'):
+                return
+            self.state = 'running'
+            self.started_at = time.time()
+
+        started = time.perf_counter()
+        try:
+            self.services.load_all()
+            for name, batch in self._batches().items():
+                self.results[name] = self._run_task(TASKS[name], batch)
+            state = 'ready'
+        except Exception as e:
+            logger.error("Warmup failed: %s", e, exc_info=True)
+            self.error = str(e)
+            state = 'failed'
+
+        self.duration = time.perf_counter() - started
+        self.state = state
+        logger.info("Warmup %s", state, extra={'warmup_ms': round(self.duration * 1000, 1),
+                                                'services': self.results})
+
+    def start(self):
+        """Warm up on a background thread so liveness answers meanwhile"""
+        with self._lock:
+            if self.state != 'pending' or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+            self._thread.start()
+
+    def skip(self):
+        """Report ready without warming up; services then load on first use"""
+        with self._lock:
+            if self.state == 'pending':
+                self.state = 'skipped'
+
+    @property
+    def ready(self) -> bool:
+        return self.state in ('ready', 'skipped')
+
+    def status(self) -> Dict:
+        services = {}
+        for name, service_name in TASKS.items():
+            services[name] = dict(self.results.get(name, {}), service=service_name,
+                                  loaded=self.services.loaded(service_name))
+        return {
+            'ready': self.ready,
+            'state': self.state,
+            'warmup_ms': round(self.duration * 1000, 1) if self.duration is not None else None,
+            'rounds': self.rounds,
+            'error': self.error,
+            'services': services
+        }
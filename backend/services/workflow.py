@@ -0,0 +1,345 @@
+"""
+Workflow engine for the farmer prediction pipeline
+
+The pipeline is modelled as a graph of stages. Each stage starts as soon as
+the stages it depends on have finished, so independent work overlaps: the
+market-price lookup for the candidate crops runs while yield is being
+predicted. Each stage's result is computed once and reused by every stage
+that needs it. Per-stage timings are recorded for each run, and stream()
+hands out each stage's result as soon as it is ready.
+
+    crop -> yield -> efficiency
+         -> prices
+    yield + prices -> revenue
+    crop + yield + revenue + efficiency -> insights
+
+Stages also have optional extras - feature importances, SHAP explanations,
+revenue scenarios and the like - that are only computed when asked for.
+select_fields turns the sections a caller wants from /api/farmer-workflow
+into the stages and extras to run, so unrequested work never happens.
+"""
+
+import asyncio
+import logging
+import time
+from collections import namedtuple
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from executors import run_inference, run_io
+
+logger = logging.getLogger(__name__)
+
+# offload: 'inference' for model calls, 'io' for lookups, None to run on the event loop
+# extras: optional parts of the result, computed only when requested
+Stage = namedtuple('Stage', ['name', 'requires', 'run', 'offload', 'extras'])
+
+# /api/farmer-workflow response section -> stage producing it
+SECTIONS = {
+    'recommended_crop': 'crop',
+    'yield_prediction': 'yield',
+    'revenue_prediction': 'revenue',
+    'efficiency_metrics': 'efficiency',
+    'market_prices': 'prices',
+    'insights': 'insights',
+    'stage_timings_ms': None
+}
+
+
+class WorkflowEngine:
+    def __init__(self, crop_service, yield_service, price_service, efficiency_service):
+        self.crop_service = crop_service
+        self.yield_service = yield_service
+        self.price_service = price_service
+        self.efficiency_service = efficiency_service
+
+        # Listed in dependency order
+        self.stages = {stage.name: stage for stage in [
+            Stage('crop', (), self._crop, 'inference', ('feature_importance',)),
+            Stage('yield', ('crop',), self._yield, 'inference', ('feature_explanations',)),
+            Stage('prices', ('crop',), self._prices, 'io', ('candidates',)),
+            Stage('revenue', ('yield', 'prices'), self._revenue, None,
+                  ('price_risk_analysis', 'revenue_scenarios', 'recommendations')),
+            Stage('efficiency', ('yield',), self._efficiency, None, ('recommendations', 'benchmarks')),
+            Stage('insights', ('crop', 'yield', 'revenue', 'efficiency'), self._insights, None, ()),
+        ]}
+
+    # ----------------------------------------------------------------- stages
+
+    def _crop(self, data, results, extras):
+        crop_data = {
+            'temperature': data['temperature'],
+            'humidity': data['humidity'],
+            'ph': data['ph'],
+            'rainfall': data['rainfall']
+        }
+        return self.crop_service.recommend_crop(
+            crop_data, feature_importance='feature_importance' in extras)
+
+    def _yield(self, data, results, extras):
+        yield_data = {
+            'N': data.get('N', 50),
+            'P': data.get('P', 50),
+            'K': data.get('K', 50),
+            'Soil_pH': data['ph'],
+            'Temperature': data['temperature'],
+            'Humidity': data['humidity'],
+            'Rainfall': data['rainfall'],
+            'Crop_Type': results['crop']['recommended_crop'],
+            'Irrigation_Type': data.get('irrigation_type', 'Canal'),
+            'Fertilizer_Used': data['fertilizer_used'],
+            'Pesticide_Used': data['pesticide_used']
+        }
+        return self.yield_service.predict_yield(
+            yield_data, explain='feature_explanations' in extras)
+
+    def _prices(self, data, results, extras):
+        """Market prices for the recommended crop and, with 'candidates', the other candidates"""
+        crop_recommendation = results['crop']
+        candidates = [crop_recommendation['recommended_crop']]
+        if 'candidates' in extras:
+            candidates += [c['crop'] for c in crop_recommendation.get('top_recommendations', [])]
+
+        prices = {}
+        for crop in candidates:
+            crop = str(crop).lower()
+            if crop not in prices:
+                prices[crop] = self.price_service.get_market_price(crop)
+        return prices
+
+    def _revenue(self, data, results, extras):
+        recommended_crop = results['crop']['recommended_crop']
+        revenue_data = {
+            'crop_type': recommended_crop,
+            'predicted_yield': results['yield']['predicted_yield'],
+            'farm_area': data['farm_area']
+        }
+        price_data = results['prices'].get(str(recommended_crop).lower())
+        return self.price_service.predict_revenue(
+            revenue_data, price_data=price_data,
+            risk_analysis='price_risk_analysis' in extras,
+            scenarios='revenue_scenarios' in extras,
+            recommendations='recommendations' in extras)
+
+    def _efficiency(self, data, results, extras):
+        efficiency_data = {
+            'farm_area': data['farm_area'],
+            'fertilizer_used': data['fertilizer_used'],
+            'pesticide_used': data['pesticide_used'],
+            'water_usage': data['water_usage'],
+            'yield': results['yield']['predicted_yield']
+        }
+        return self.efficiency_service.calculate_efficiency(
+            efficiency_data, recommendations='recommendations' in extras,
+            benchmarks='benchmarks' in extras)
+
+    def _insights(self, data, results, extras):
+        return generate_insights(results['crop'], results['yield'],
+                                 results['revenue'], results['efficiency'])
+
+    # -------------------------------------------------------------- execution
+
+    def plan(self, targets: Optional[Iterable[str]] = None) -> List[str]:
+        """Stages needed for the targets (all stages by default), in dependency order"""
+        if targets is None:
+            return list(self.stages)
+
+        needed = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown workflow stage: {name}")
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].requires)
+
+        return [name for name in self.stages if name in needed]
+
+    def resolve_extras(self, extras: Optional[Dict[str, Iterable[str]]] = None) -> Dict[str, frozenset]:
+        """Extras to compute per stage: all of them by default, otherwise only those listed ('*' for all)"""
+        resolved = {}
+        for name, stage in self.stages.items():
+            wanted = set(stage.extras if extras is None else extras.get(name, ()))
+            if '*' in wanted:
+                wanted = set(stage.extras)
+            unknown = wanted - set(stage.extras)
+            if unknown:
+                raise ValueError(f"Unknown {name} extra: {', '.join(sorted(unknown))}")
+            resolved[name] = frozenset(wanted)
+        return resolved
+
+    async def stream(self, data: Dict, targets: Optional[Iterable[str]] = None,
+                     extras: Optional[Dict[str, Iterable[str]]] = None) -> AsyncIterator[Tuple[str, Any, Dict]]:
+        """
+        Run the workflow for one input, yielding each stage as it finishes
+
+        Args:
+            data: Farm input (the /api/farmer-workflow fields)
+            targets: Stages whose results are wanted; their dependencies run too
+            extras: Stage -> optional parts to compute; None computes every extra
+
+        Yields:
+            (stage name, result, timing) in completion order; timing has
+            start_ms and duration_ms relative to the start of the run
+        """
+        started = time.perf_counter()
+        stage_extras = self.resolve_extras(extras)
+        results = {}
+        tasks = {}
+
+        async def execute(stage):
+            await asyncio.gather(*(tasks[name] for name in stage.requires))
+
+            enabled = stage_extras[stage.name]
+            stage_started = time.perf_counter()
+            if stage.offload == 'inference':
+                result = await run_inference(stage.run, data, results, enabled)
+            elif stage.offload == 'io':
+                result = await run_io(stage.run, data, results, enabled)
+            else:
+                result = stage.run(data, results, enabled)
+
+            # Fallback results may carry extras that were not asked for
+            skipped = set(stage.extras) - enabled
+            if skipped and isinstance(result, dict):
+                result = {key: value for key, value in result.items() if key not in skipped}
+
+            results[stage.name] = result
+            return stage.name, result, {
+                'start_ms': round((stage_started - started) * 1000, 3),
+                'duration_ms': round((time.perf_counter() - stage_started) * 1000, 3)
+            }
+
+        for name in self.plan(targets):
+            tasks[name] = asyncio.ensure_future(execute(self.stages[name]))
+
+        try:
+            for finished in asyncio.as_completed(list(tasks.values())):
+                yield await finished
+        finally:
+            # A failed stage, or a consumer that stopped listening
+            for task in tasks.values():
+                task.cancel()
+
+    async def run(self, data: Dict, targets: Optional[Iterable[str]] = None,
+                  extras: Optional[Dict[str, Iterable[str]]] = None) -> Dict:
+        """
+        Run the workflow for one input
+
+        Args:
+            data: Farm input (the /api/farmer-workflow fields)
+            targets: Stages whose results are wanted; their dependencies run too
+            extras: Stage -> optional parts to compute; None computes every extra
+
+        Returns:
+            Dictionary with 'results' per stage and 'timings' in milliseconds
+        """
+        started = time.perf_counter()
+        results = {}
+        timings = {}
+        async for name, result, timing in self.stream(data, targets, extras):
+            results[name] = result
+            timings[name] = timing
+
+        timings['total_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        logger.info("Workflow completed", extra={'stages': list(results), 'stage_timings_ms': timings})
+        return {'results': results, 'timings': timings}
+
+    async def run_many(self, inputs: Iterable[Dict], targets: Optional[Iterable[str]] = None,
+                       extras: Optional[Dict[str, Iterable[str]]] = None) -> List[Dict]:
+        """Run the workflow for several inputs concurrently"""
+        targets = list(targets) if targets is not None else None
+        return await asyncio.gather(*(self.run(data, targets, extras) for data in inputs))
+
+    def run_sync(self, data: Dict, targets: Optional[Iterable[str]] = None,
+                 extras: Optional[Dict[str, Iterable[str]]] = None) -> Dict:
+        """Run the workflow from synchronous code"""
+        return asyncio.run(self.run(data, targets, extras))
+
+
+def select_fields(fields: Optional[Iterable[str]]) -> Tuple[List[str], Optional[List[str]], Optional[Dict[str, set]]]:
+    """
+    Resolve requested /api/farmer-workflow fields
+
+    A field is a response section ('revenue_prediction') or a section extra
+    ('revenue_prediction.revenue_scenarios', or 'revenue_prediction.*' for all
+    of them). A bare section is returned without its extras.
+
+    Args:
+        fields: Requested fields, or None for the full response
+
+    Returns:
+        Tuple of (sections, stage targets, stage extras); targets and extras
+        are None for the full response, as WorkflowEngine.run expects
+    """
+    if fields is None:
+        return list(SECTIONS), None, None
+
+    sections = []
+    extras = {}
+    for field in fields:
+        if not isinstance(field, str):
+            raise ValueError(f"Fields must be strings, got {field!r}")
+        field = field.strip()
+        if not field:
+            continue
+        section, _, extra = field.partition('.')
+        if section not in SECTIONS:
+            raise ValueError(f"Unknown field: {section}")
+        if section not in sections:
+            sections.append(section)
+        stage = SECTIONS[section]
+        if extra:
+            if stage is None:
+                raise ValueError(f"{section} has no extras")
+            extras.setdefault(stage, set()).add(extra)
+
+    if not sections:
+        raise ValueError('No fields requested')
+    sections.sort(key=list(SECTIONS).index)
+    targets = [SECTIONS[section] for section in sections if SECTIONS[section]]
+    return sections, targets, extras
+
+
+def generate_insights(crop_rec, yield_pred, revenue_pred, efficiency):
+    """Generate actionable insights for farmer"""
+    insights = []
+
+    # Crop insights
+    confidence = crop_rec.get('confidence', 0)
+    if confidence > 0.9:
+        insights.append(f"High confidence ({confidence:.1%}) in {crop_rec['recommended_crop']} recommendation")
+
+    # Yield insights
+    predicted_yield = yield_pred.get('predicted_yield', 0)
+    if predicted_yield > 20:
+        insights.append("Excellent yield potential predicted")
+    elif predicted_yield > 10:
+        insights.append("Good yield potential predicted")
+    else:
+        insights.append("Consider optimizing inputs for better yield")
+
+    # Revenue insights
+    revenue = revenue_pred.get('predicted_revenue', 0)
+    if revenue > 100000:
+        insights.append(f"High revenue potential: {revenue:,.0f} EGP")
+
+    # Efficiency insights
+    efficiency_score = efficiency.get('final_efficiency_score', 0)
+    if efficiency_score > 0.7:
+        insights.append("Excellent farm efficiency score")
+    elif efficiency_score > 0.5:
+        insights.append("Good farm efficiency, room for improvement")
+    else:
+        insights.append("Consider optimizing resource usage")
+
+    # Resource optimization suggestions
+    water_eff = efficiency.get('water_efficiency', 0)
+    if water_eff < 0.5:
+        insights.append("Water usage efficiency is low - consider irrigation optimization")
+
+    fertilizer_eff = efficiency.get('fertilizer_efficiency', 0)
+    if fertilizer_eff < 0.5:
+        insights.append("Fertilizer efficiency can be improved - consider soil testing")
+
+    return insights
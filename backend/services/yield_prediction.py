@@ -1,32 +1,51 @@
+import logging
 import pandas as pd
 import numpy as np
 import joblib
 import os
 from typing import Dict, List, Any
-import shap
 from config import get_config
+from utils.features import CATEGORICAL_YIELD_COLUMNS, add_yield_features
+from utils.helpers import file_version
+from utils.metrics import fallback, timed
+
+logger = logging.getLogger(__name__)
+
+# Raw inputs of the yield pipeline (crop-yield.csv), and the values used for
+# those a caller leaves out
+FEATURE_COLUMNS = [
+    'N', 'P', 'K', 'Soil_pH', 'Soil_Moisture', 'Soil_Type',
+    'Organic_Carbon', 'Temperature', 'Humidity', 'Rainfall',
+    'Sunlight_Hours', 'Wind_Speed', 'Region', 'Altitude', 'Season',
+    'Crop_Type', 'Irrigation_Type', 'Fertilizer_Used', 'Pesticide_Used'
+]
+FEATURE_DEFAULTS = {
+    'N': 50, 'P': 50, 'K': 50, 'Soil_Moisture': 50, 'Soil_Type': 'Loamy',
+    'Organic_Carbon': 1.0, 'Sunlight_Hours': 8, 'Wind_Speed': 5, 'Region': 'Nile Delta',
+    'Altitude': 50, 'Season': 'Summer'
+}
 
 class YieldPredictionService:
     def __init__(self):
         self.pipeline = None
         self.model = None
         self.preprocessor = None
-        self.feature_columns = [
-            'N', 'P', 'K', 'Soil_pH', 'Soil_Moisture', 'Soil_Type',
-            'Organic_Carbon', 'Temperature', 'Humidity', 'Rainfall',
-            'Sunlight_Hours', 'Wind_Speed', 'Region', 'Altitude', 'Season',
-            'Crop_Type', 'Irrigation_Type', 'Fertilizer_Used', 'Pesticide_Used'
-        ]
+        self.model_version = None
+        self.feature_columns = FEATURE_COLUMNS
         self.load_model()
     
     def load_model(self):
         """Load the trained yield prediction pipeline"""
+        # Built for the loaded model on first use (see _explainer)
+        self._shap_explainer = None
+        self._shap_unavailable = False
         try:
             config = get_config()
             model_path = config.YIELD_PREDICTION_MODEL
             
             # Try to load with joblib
             self.pipeline = joblib.load(model_path)
+            self.model_version = file_version(model_path)
             
             # Handle different sklearn versions safely
             try:
@@ -37,27 +56,29 @@ class YieldPredictionService:
                     # For newer sklearn versions or different pipeline formats
                     self.model = self.pipeline
                     self.preprocessor = None
-                print("✅ Yield prediction model loaded successfully")
+                logger.info("Yield prediction model loaded")
             except AttributeError as ae:
-                print(f"⚠️ Pipeline structure changed: {ae}")
+                logger.warning("Pipeline structure changed: %s", ae)
                 # Use the pipeline as a whole if we can't extract components
                 self.model = self.pipeline
                 self.preprocessor = None
-                print("✅ Using pipeline as whole model")
+                logger.info("Using pipeline as whole model")
                 
         except Exception as e:
-            print(f"⚠️ Could not load yield prediction model: {e}")
-            print("🔄 Using fallback prediction method")
+            logger.warning("Could not load yield prediction model, using fallback prediction method: %s", e)
             self.pipeline = None
             self.model = None
             self.preprocessor = None
+            self.model_version = None
     
-    def predict_yield(self, input_data: Dict) -> Dict:
+    @timed('inference', 'predict_yield')
+    def predict_yield(self, input_data: Dict, explain: bool = True) -> Dict:
         """
         Predict crop yield based on farm conditions and inputs
         
         Args:
             input_data: Dictionary containing all required features
+            explain: Include SHAP feature explanations (SHAP is imported on first use)
             
         Returns:
             Dictionary with predicted yield and additional insights
@@ -76,7 +97,7 @@ class YieldPredictionService:
             prediction_interval = self._calculate_prediction_interval(predicted_yield)
             
             # Get feature explanations
-            feature_explanations = self._get_feature_explanations(features_df)
+            feature_explanations = self._get_feature_explanations(features_df) if explain else {}
             
             # Calculate yield efficiency metrics
             efficiency_metrics = self._calculate_yield_efficiency(input_data, predicted_yield)
@@ -91,7 +112,7 @@ class YieldPredictionService:
             }
             
         except Exception as e:
-            print(f"Error in yield prediction: {e}")
+            logger.error("Error in yield prediction: %s", e, exc_info=True)
             return self._fallback_prediction(input_data)
     
     def _prepare_input(self, input_data: Dict) -> pd.DataFrame:
@@ -99,23 +120,19 @@ class YieldPredictionService:
         # Create a DataFrame with all required columns
         features = {}
         
-        # Set default values for missing features
-        default_values = {
-            'N': 50, 'P': 50, 'K': 50, 'Soil_Moisture': 50, 'Soil_Type': 'Loamy',
-            'Organic_Carbon': 1.0, 'Sunlight_Hours': 8, 'Wind_Speed': 5, 'Region': 'Nile Delta',
-            'Altitude': 50, 'Season': 'Summer'
-        }
-        
         # Fill with provided data or defaults
         for col in self.feature_columns:
             if col in input_data:
                 features[col] = input_data[col]
-            elif col in default_values:
-                features[col] = default_values[col]
+            elif col in FEATURE_DEFAULTS:
+                features[col] = FEATURE_DEFAULTS[col]
+            elif col in CATEGORICAL_YIELD_COLUMNS:
+                features[col] = 'Unknown'  # A number here would break the one-hot encoder
             else:
                 features[col] = 0  # Default fallback
         
-        return pd.DataFrame([features])
+        # The pipeline was trained with the engineered columns too
+        return add_yield_features(pd.DataFrame([features]))
     
     def _calculate_prediction_interval(self, prediction: float) -> Dict:
         """Calculate prediction interval (simplified approach)"""
@@ -127,6 +144,7 @@ class YieldPredictionService:
             'confidence_level': 0.95
         }
     
+    @timed('shap', 'yield_explanations')
     def _get_feature_explanations(self, features_df: pd.DataFrame) -> Dict:
         """Get feature explanations using SHAP values"""
         if self.model is None or self.preprocessor is None:
@@ -136,8 +154,9 @@ class YieldPredictionService:
             # Transform features
             features_transformed = self.preprocessor.transform(features_df)
             
-            # Calculate SHAP values
-            explainer = shap.TreeExplainer(self.model)
+            explainer = self._explainer()
+            if explainer is None:
+                return {}
             shap_values = explainer.shap_values(features_transformed)
             
             # Get feature names
@@ -159,9 +178,21 @@ class YieldPredictionService:
             }
             
         except Exception as e:
-            print(f"Error calculating SHAP values: {e}")
+            logger.error("Error calculating SHAP values: %s", e, exc_info=True)
             return {}
     
+    def _explainer(self):
+        """SHAP explainer for the loaded model, built once; None if SHAP cannot read the model"""
+        if self._shap_explainer is None and not self._shap_unavailable:
+            try:
+                # shap takes over a second to import
+                import shap
+                self._shap_explainer = shap.TreeExplainer(self.model)
+            except Exception as e:
+                self._shap_unavailable = True
+                logger.warning("SHAP explanations disabled, the yield model cannot be read by shap: %s", e)
+        return self._shap_explainer
+    
     def _calculate_yield_efficiency(self, input_data: Dict, predicted_yield: float) -> Dict:
         """Calculate yield efficiency metrics"""
         efficiency_metrics = {}
@@ -186,6 +217,7 @@ class YieldPredictionService:
         
         return efficiency_metrics
     
+    @fallback('yield')
     def _fallback_prediction(self, input_data: Dict) -> Dict:
         """Fallback prediction when model is not available"""
         # Simple rule-based prediction
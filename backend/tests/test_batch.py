@@ -0,0 +1,65 @@
+"""
+POST /api/batch must never wait on a streaming sub-request
+
+Runs against a small app with the same kinds of routes, so the tests do not
+load models or touch agricultural_platform.db.
+"""
+
+import pytest
+from flask import Flask, Response
+
+from utils.batch import SubRequest, dispatch, parse_requests
+from utils.responses import create_response
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.closed = []
+
+    @app.route('/api/batch', methods=['POST'])
+    def batch():
+        return ''
+
+    @app.route('/endless')
+    def endless():
+        def body():
+            while True:
+                yield b': ping\n\n'
+        response = Response(body(), mimetype='text/event-stream')
+        response.call_on_close(lambda: app.closed.append('/endless'))
+        return response
+
+    @app.route('/farms')
+    def farms():
+        return create_response('success', 'Farms retrieved successfully', [])
+
+    return app
+
+
+def subrequest(path):
+    return SubRequest('GET', path, None, {})
+
+
+@pytest.mark.parametrize('path', ['/events', '/events?topics=farm:1', '/api/farmer-workflow/stream'])
+def test_streaming_paths_are_rejected(app, path):
+    with app.test_request_context('/api/batch', method='POST'):
+        with pytest.raises(ValueError, match='cannot be batched'):
+            parse_requests({'requests': [{'path': '/farms'}, {'path': path}]}, 20)
+
+
+def test_streamed_sub_response_is_closed_unread(app):
+    with app.test_request_context('/api/batch', method='POST'):
+        result = dispatch(app, subrequest('/endless'), {}, {}, 'batch-0')
+
+    assert result['status'] == 400
+    assert 'cannot be batched' in result['body']['message']
+    assert app.closed == ['/endless']
+
+
+def test_plain_sub_response_is_returned(app):
+    with app.test_request_context('/api/batch', method='POST'):
+        result = dispatch(app, subrequest('/farms'), {}, {}, 'batch-0')
+
+    assert result['status'] == 200
+    assert result['body']['data'] == []
@@ -0,0 +1,351 @@
+"""
+Admission control for the inference routes
+
+Two layers protect the CPU-bound endpoints:
+
+- a per-client token bucket driven by config.RATE_LIMIT ("100 per hour"),
+  answering 429 with Retry-After once a client's bucket is empty;
+- a concurrency limiter with a bounded FIFO wait queue. Requests beyond
+  INFERENCE_MAX_CONCURRENT wait for a slot; once INFERENCE_MAX_QUEUE are
+  already waiting, or a wait exceeds INFERENCE_QUEUE_TIMEOUT, the request
+  is shed with 503 and Retry-After instead of adding to the latency of
+  everyone behind it.
+
+State is per worker process, which matches the CPU each worker can use.
+"""
+
+import asyncio
+import functools
+import inspect
+import math
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import Response, request
+from prometheus_client.core import CounterMetricFamily
+
+from config import get_config
+from utils.responses import create_response
+from utils import metrics
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate_limit(limit):
+    """
+    Parse '100 per hour' or '100/hour' into (requests, period_seconds)
+
+    Raises:
+        ValueError: if the limit is not understood
+    """
+    match = re.fullmatch(r'\s*(\d+)\s*(?:per|/)\s*(\d*)\s*(second|minute|hour|day)s?\s*', limit.lower())
+    if not match:
+        raise ValueError(f"Invalid rate limit: {limit!r}")
+    count, multiplier, unit = match.groups()
+    return int(count), _PERIODS[unit] * int(multiplier or 1)
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets; each client may burst up to the full limit"""
+
+    def __init__(self, limit, max_clients=10000):
+        self.capacity, self.period = parse_rate_limit(limit)
+        self.rate = self.capacity / self.period  # tokens per second
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client -> (tokens, last_refill)
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def take(self, client):
+        """
+        Take a token for a client
+
+        Returns:
+            Tuple of (allowed, remaining_tokens, retry_after_seconds)
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(client, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.limited += 1
+
+            self._buckets[client] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                # Least recently seen clients go first; they come back with a full bucket
+                self._buckets.popitem(last=False)
+
+        retry_after = 0 if allowed else math.ceil((1 - tokens) / self.rate)
+        return allowed, int(tokens), retry_after
+
+    def stats(self):
+        with self._lock:
+            clients = len(self._buckets)
+        return {'limit': self.capacity, 'period_seconds': self.period,
+                'clients_tracked': clients, 'rate_limited': self.limited}
+
+
+class _Waiter:
+    """A queued request, woken either on its event loop or through an Event"""
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+
+    def wake(self):
+        self.granted = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ConcurrencyLimiter:
+    """Bounded concurrency with a bounded FIFO queue, usable from threads and coroutines"""
+
+    def __init__(self, max_concurrent, max_queue, queue_timeout):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = deque()
+        self._service_time = None  # EWMA of seconds a slot is held
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+
+    def _enter(self, make_waiter):
+        """Take a slot, or join the queue; None means shed"""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                self.admitted += 1
+                return True
+            if len(self._waiters) >= self.max_queue:
+                self.shed_queue_full += 1
+                return None
+            waiter = make_waiter()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter, timed_out=True):
+        """Give up waiting; False if the slot was handed over in the meantime"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+            if timed_out:
+                self.shed_timeout += 1
+            return True
+
+    def acquire(self):
+        """Blocking acquire; False when the request is shed"""
+        entered = self._enter(_Waiter)
+        if entered is None or entered is True:
+            return entered is True
+        if entered.event.wait(self.queue_timeout) or not self._abandon(entered):
+            return True
+        return False
+
+    async def acquire_async(self):
+        """Acquire from a coroutine without blocking its event loop"""
+        loop = asyncio.get_running_loop()
+        entered = self._enter(lambda: _Waiter(loop))
+        if entered is None or entered is True:
+            return entered is True
+        try:
+            await asyncio.wait_for(asyncio.shield(entered.future), self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return not self._abandon(entered)
+        except asyncio.CancelledError:
+            # Client went away while queued; pass on a slot it may just have been given
+            if not self._abandon(entered, timed_out=False):
+                self.release()
+            raise
+
+    def release(self, held_for=None):
+        """Free a slot, handing it straight to the next waiter if any"""
+        with self._lock:
+            if held_for is not None:
+                self._service_time = held_for if self._service_time is None else (
+                    0.8 * self._service_time + 0.2 * held_for)
+            if self._waiters:
+                self.admitted += 1
+                self._waiters.popleft().wake()
+            else:
+                self._active -= 1
+
+    def retry_after(self):
+        """Seconds until a shed client is likely to get in"""
+        with self._lock:
+            service_time = self._service_time or 1.0
+            backlog = len(self._waiters) + 1
+        return max(1, math.ceil(service_time * backlog / self.max_concurrent))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self._active,
+                'queue_depth': len(self._waiters),
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'shed_queue_full': self.shed_queue_full,
+                'shed_timeout': self.shed_timeout,
+                'avg_service_seconds': self._service_time
+            }
+
+
+_rate_limiter = None
+_concurrency_limiter = None
+_init_lock = threading.Lock()
+
+
+def get_limiters():
+    """Process-wide (rate limiter or None, concurrency limiter), built from config"""
+    global _rate_limiter, _concurrency_limiter
+    if _concurrency_limiter is None:
+        with _init_lock:
+            if _concurrency_limiter is None:
+                config = get_config()
+                if config.RATE_LIMIT_ENABLED:
+                    _rate_limiter = TokenBucketLimiter(config.RATE_LIMIT, config.RATE_LIMIT_MAX_CLIENTS)
+                _concurrency_limiter = ConcurrencyLimiter(
+                    config.INFERENCE_MAX_CONCURRENT,
+                    config.INFERENCE_MAX_QUEUE,
+                    config.INFERENCE_QUEUE_TIMEOUT
+                )
+    return _rate_limiter, _concurrency_limiter
+
+
+def admission_stats():
+    rate_limiter, concurrency_limiter = get_limiters()
+    return {
+        'rate_limit': rate_limiter.stats() if rate_limiter is not None else None,
+        'concurrency': concurrency_limiter.stats()
+    }
+
+
+def _admission_metrics():
+    """Limiter state for /metrics (this worker's view)"""
+    if _concurrency_limiter is None:
+        return
+    stats = admission_stats()
+    concurrency = stats['concurrency']
+    yield metrics.gauge('agri_admission_queue_depth', 'Requests waiting for an inference slot',
+                        samples=[([], concurrency['queue_depth'])])
+    yield metrics.gauge('agri_admission_active', 'Requests holding an inference slot',
+                        samples=[([], concurrency['active'])])
+    
+    shed = CounterMetricFamily('agri_admission_shed', 'Requests rejected with 503', labels=['reason'])
+    shed.add_metric(['queue_full'], concurrency['shed_queue_full'])
+    shed.add_metric(['timeout'], concurrency['shed_timeout'])
+    yield shed
+    
+    if stats['rate_limit'] is not None:
+        limited = CounterMetricFamily('agri_rate_limited', 'Requests rejected with 429')
+        limited.add_metric([], stats['rate_limit']['rate_limited'])
+        yield limited
+
+
+metrics.add_gauge_callback(_admission_metrics)
+
+
+def _client_key():
+    header = get_config().RATE_LIMIT_KEY_HEADER
+    if header and request.headers.get(header):
+        # First hop of X-Forwarded-For style lists is the original client
+        return request.headers[header].split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+
+def _check_rate():
+    """429 response if the client is over its limit, else None"""
+    rate_limiter, _ = get_limiters()
+    if rate_limiter is None:
+        return None
+    allowed, remaining, retry_after = rate_limiter.take(_client_key())
+    if allowed:
+        return None
+    response = create_response('error', 'Rate limit exceeded', status_code=429)
+    response.headers['Retry-After'] = str(retry_after)
+    response.headers['X-RateLimit-Limit'] = str(rate_limiter.capacity)
+    response.headers['X-RateLimit-Remaining'] = str(remaining)
+    return response
+
+
+def _shed(limiter):
+    response = create_response('error', 'Server busy, please retry', status_code=503)
+    response.headers['Retry-After'] = str(limiter.retry_after())
+    return response
+
+
+def _release_when_done(response, limiter, started):
+    """
+    Release the slot now, or when a streamed body is closed
+
+    A streaming view returns before its work is done, so its slot is held
+    until the server has sent (or abandoned) the whole body.
+
+    Returns:
+        True if the release was deferred to the response
+    """
+    if isinstance(response, Response) and response.is_streamed:
+        response.call_on_close(lambda: limiter.release(time.perf_counter() - started))
+        return True
+    limiter.release(time.perf_counter() - started)
+    return False
+
+
+def admission_control(view):
+    """Rate-limit and concurrency-limit a sync or async view"""
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            limited = _check_rate()
+            if limited is not None:
+                return limited
+            _, limiter = get_limiters()
+            if not await limiter.acquire_async():
+                return _shed(limiter)
+            started = time.perf_counter()
+            try:
+                response = await view(*args, **kwargs)
+            except BaseException:
+                limiter.release(time.perf_counter() - started)
+                raise
+            _release_when_done(response, limiter, started)
+            return response
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        limited = _check_rate()
+        if limited is not None:
+            return limited
+        _, limiter = get_limiters()
+        if not limiter.acquire():
+            return _shed(limiter)
+        started = time.perf_counter()
+        try:
+            response = view(*args, **kwargs)
+        except BaseException:
+            limiter.release(time.perf_counter() - started)
+            raise
+        _release_when_done(response, limiter, started)
+        return response
+    return wrapper
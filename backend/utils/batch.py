@@ -0,0 +1,189 @@
+"""
+Request batching for POST /api/batch
+
+A page that needs several endpoints sends them in one round trip:
+
+    {"requests": [
+        {"path": "/dashboard/1"},
+        {"path": "/farms/1/predictions"},
+        {"method": "POST", "path": "/api/farmer-workflow", "body": {...}}
+    ]}
+
+Each sub-request goes through the app as if it had arrived on its own
+(routing, validation, admission control, conditional GETs, metrics and
+logs under its own request id), on the batch pool so they run
+concurrently. The answer holds one {status, body} per sub-request, in the
+order they were sent; a failing sub-request does not fail the others.
+
+Streaming endpoints cannot be batched: their answer has no end to wait for.
+They are refused when the batch is parsed, and any other sub-response that
+turns out to be streamed is closed unread and answered with an error.
+
+Sub-requests that cannot differ in their answer are dispatched once and the
+answer is reused: identical GETs, and identical POSTs to the prediction
+endpoints, which compute without writing. All sub-requests share database
+connections (database.shared_connections).
+"""
+
+import asyncio
+import json
+import logging
+from collections import namedtuple
+from typing import Dict, List
+
+from flask import request
+from werkzeug.test import EnvironBuilder
+
+from database import shared_connections
+from executors import run_subrequest
+from utils import responses
+from utils.log import get_request_id
+
+logger = logging.getLogger(__name__)
+
+SubRequest = namedtuple('SubRequest', ['method', 'path', 'body', 'headers'])
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'DELETE'}
+
+# POST endpoints whose answer depends only on the body
+SHAREABLE_POSTS = {
+    '/api/recommend-crop', '/api/predict-yield', '/api/calculate-efficiency',
+    '/api/predict-revenue', '/api/farmer-workflow'
+}
+
+# Endpoints that stream their answer; a batch would wait for them forever
+STREAMING_PATHS = {'/events', '/api/farmer-workflow/stream'}
+
+# Outer request headers not passed on: they describe the batch itself
+_OWN_HEADERS = {
+    'content-type', 'content-length', 'transfer-encoding', 'accept-encoding',
+    'if-none-match', 'if-modified-since', 'x-request-id'
+}
+
+# Sub-response headers worth returning to the client
+_RETURNED_HEADERS = ('ETag', 'Last-Modified', 'Retry-After')
+
+
+def parse_requests(data, max_requests: int) -> List[SubRequest]:
+    """
+    Validate a /api/batch body
+
+    Raises:
+        ValueError: If the body or any sub-request is malformed
+    """
+    items = data.get('requests') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError('Expected a non-empty "requests" list')
+    if len(items) > max_requests:
+        raise ValueError(f'At most {max_requests} requests per batch')
+
+    subrequests = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f'Request {index} must be an object')
+        method = str(item.get('method', 'GET')).upper()
+        path = item.get('path')
+        headers = item.get('headers') or {}
+        if method not in METHODS:
+            raise ValueError(f'Request {index}: unsupported method {method}')
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise ValueError(f'Request {index}: "path" must start with /')
+        route = path.split('?', 1)[0].rstrip('/')
+        if route == request.path.rstrip('/'):
+            raise ValueError(f'Request {index}: batches cannot be nested')
+        if route in STREAMING_PATHS:
+            raise ValueError(f'Request {index}: {route} streams its answer and cannot be batched')
+        if not isinstance(headers, dict):
+            raise ValueError(f'Request {index}: "headers" must be an object')
+        subrequests.append(SubRequest(method, path, item.get('body'),
+                                      {str(k): str(v) for k, v in headers.items()}))
+    return subrequests
+
+
+def share_key(subrequest: SubRequest):
+    """Key under which identical sub-requests share one answer, None if they must all run"""
+    path = subrequest.path.split('?', 1)[0]
+    if subrequest.method not in ('GET', 'HEAD') and not (
+            subrequest.method == 'POST' and path in SHAREABLE_POSTS):
+        return None
+    return (subrequest.method, subrequest.path,
+            json.dumps(subrequest.body, sort_keys=True, default=str),
+            tuple(sorted(subrequest.headers.items())))
+
+
+def _body(response):
+    if response.status_code == 304 or not response.get_data():
+        return None
+    if response.mimetype == responses.JSON_MIMETYPE:
+        raw = response.get_data()
+        return responses.orjson.loads(raw) if responses.orjson is not None else json.loads(raw)
+    return response.get_data(as_text=True)
+
+
+def dispatch(app, subrequest: SubRequest, environ_base: Dict, headers: Dict, request_id: str) -> Dict:
+    """Run one sub-request through the app and summarise its response"""
+    builder = EnvironBuilder(
+        path=subrequest.path,
+        method=subrequest.method,
+        headers={**headers, **subrequest.headers, 'X-Request-ID': request_id},
+        environ_base=environ_base,
+        **({'json': subrequest.body} if subrequest.body is not None else {})
+    )
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+
+    # A fresh app context, so the sub-request gets its own `g`
+    with app.app_context(), app.request_context(environ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            logger.error("Batch sub-request %s %s failed: %s", subrequest.method, subrequest.path, e,
+                         exc_info=True)
+            return {'status': 500, 'body': {'status': 'error', 'message': f'Internal server error: {e}'}}
+
+    if response.is_streamed:
+        # Never drained: an endless stream would hold this thread for good
+        response.close()
+        return {'status': 400, 'body': {'status': 'error',
+                                        'message': f'{subrequest.path} streams its answer and cannot be batched'}}
+
+    try:
+        result = {'status': response.status_code, 'body': _body(response)}
+        returned = {name: response.headers[name] for name in _RETURNED_HEADERS if name in response.headers}
+        if returned:
+            result['headers'] = returned
+        return result
+    finally:
+        response.close()
+
+
+async def run_batch(app, subrequests: List[SubRequest]) -> List[Dict]:
+    """Dispatch the sub-requests concurrently; answers in request order"""
+    environ_base = {'REMOTE_ADDR': request.remote_addr or ''}
+    headers = {name: value for name, value in request.headers.items() if name.lower() not in _OWN_HEADERS}
+    batch_id = get_request_id() or 'batch'
+
+    # Index of the sub-request whose answer each one gets
+    first = {}
+    leader_of = []
+    for index, subrequest in enumerate(subrequests):
+        key = share_key(subrequest)
+        leader_of.append(index if key is None else first.setdefault(key, index))
+    leaders = sorted(set(leader_of))
+
+    with shared_connections():
+        answers = await asyncio.gather(*(
+            run_subrequest(dispatch, app, subrequests[index], environ_base, headers, f'{batch_id}-{index}')
+            for index in leaders
+        ))
+    answers = dict(zip(leaders, answers))
+
+    results = []
+    for index, leader in enumerate(leader_of):
+        result = dict(answers[leader])
+        if leader != index:
+            result['shared'] = True
+        results.append(result)
+    return results
@@ -0,0 +1,396 @@
+"""
+Cache layer configured by CACHE_TYPE and CACHE_DEFAULT_TIMEOUT
+
+Backends:
+- 'simple': in-process LRU bounded by CACHE_MAX_BYTES of pickled values
+- 'sqlite': a SQLite file (CACHE_SQLITE_PATH) shared by every worker on the
+  host; WAL mode keeps readers from blocking each other
+- 'null': caching disabled
+
+Values are stored pickled, so callers always get their own copy and may
+mutate it. Keys live in namespaces ('market', 'dashboard', ...);
+invalidate(namespace) bumps the namespace's generation, which orphans every
+key in it at once (entries then age out by TTL or LRU). Under the sqlite
+backend, generations are stored in the shared file, so an invalidation in
+one worker is seen by all of them.
+
+    @memoize('market', timeout=60)
+    def get_market_price(self, crop_name=None): ...
+
+Misses go through a single-flight layer (utils.singleflight), so a burst
+of identical requests computes once. Hits and misses are counted per
+namespace in agri_cache_requests_total.
+"""
+
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter
+
+from config import get_config
+from utils import metrics
+from utils.singleflight import SingleFlight
+
+CACHE_REQUESTS = Counter(
+    'agri_cache_requests_total', 'Cache lookups by namespace and result',
+    ['namespace', 'result']
+)
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class NullBackend:
+    """Stores nothing"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def generation(self, namespace):
+        return 0
+
+    def bump_generation(self, namespace):
+        pass
+
+    def stats(self):
+        return {}
+
+
+class MemoryBackend:
+    """In-process LRU bounded by the total size of the pickled values"""
+
+    def __init__(self, max_bytes, max_entries=100000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, payload)
+        self._generations = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, payload, timeout):
+        if len(payload) > self.max_bytes:
+            return
+        expires_at = time.time() + timeout if timeout else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, payload)
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def generation(self, namespace):
+        return self._generations.get(namespace, 0)
+
+    def bump_generation(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'max_bytes': self.max_bytes, 'evictions': self.evictions}
+
+
+class SQLiteBackend:
+    """Cache table in a SQLite file shared across worker processes"""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_generations (
+                namespace TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL
+            )
+        ''')
+        conn.commit()
+
+    def _connection(self):
+        # One connection per thread and process; connections do not survive a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, payload, timeout):
+        if len(payload) > self.max_bytes:
+            return
+        expires_at = time.time() + timeout if timeout else None
+        conn = self._connection()
+        try:
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, size, expires_at) VALUES (?, ?, ?, ?)',
+                         (key, payload, len(payload), expires_at))
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._trim(conn)
+        except sqlite3.OperationalError:
+            # Locked by another writer for longer than the timeout; caching is best effort
+            pass
+
+    def _trim(self, conn):
+        """Drop expired entries, then the soonest-expiring ones until under max_bytes"""
+        conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in conn.execute('SELECT key, size FROM cache ORDER BY expires_at IS NULL, expires_at').fetchall():
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany('DELETE FROM cache WHERE key = ?', doomed)
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def generation(self, namespace):
+        row = self._connection().execute(
+            'SELECT generation FROM cache_generations WHERE namespace = ?', (namespace,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self, namespace):
+        self._connection().execute('''
+            INSERT INTO cache_generations (namespace, generation) VALUES (?, 1)
+            ON CONFLICT(namespace) DO UPDATE SET generation = generation + 1
+        ''', (namespace,))
+
+    def stats(self):
+        entries, total = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+        return {'entries': entries, 'bytes': total, 'max_bytes': self.max_bytes, 'path': self.path}
+
+
+class Cache:
+    """Namespaced cache over a backend"""
+
+    def __init__(self, backend, default_timeout=300):
+        self.backend = backend
+        self.default_timeout = default_timeout
+        self._counters = {}
+        self._counts = {}  # (namespace, result) -> lookups in this process
+        self._lock = threading.Lock()
+        self.flights = SingleFlight()
+
+    def _count(self, namespace, result):
+        counter = self._counters.get((namespace, result))
+        if counter is None:
+            counter = self._counters[(namespace, result)] = CACHE_REQUESTS.labels(namespace, result)
+        counter.inc()
+        with self._lock:
+            self._counts[(namespace, result)] = self._counts.get((namespace, result), 0) + 1
+
+    def _key(self, namespace, key):
+        return f'{namespace}:{self.backend.generation(namespace)}:{key}'
+
+    def _read(self, namespace, key):
+        """Pickled payload for namespace/key and its full key, or None"""
+        try:
+            full_key = self._key(namespace, key)
+            payload = self.backend.get(full_key)
+        except Exception as e:
+            # A broken cache degrades to a miss, never to a failed request
+            logger.warning("Cache read failed: %s", e)
+            full_key, payload = None, None
+        self._count(namespace, 'miss' if payload is None else 'hit')
+        return full_key, payload
+
+    def _write(self, namespace, key, full_key, value, timeout):
+        """Store a value and return its pickled payload (None if it could not be stored)"""
+        timeout = self.default_timeout if timeout is None else timeout
+        try:
+            payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            self.backend.set(full_key or self._key(namespace, key), payload, timeout)
+            return payload
+        except Exception as e:
+            logger.warning("Cache write failed: %s", e)
+            return None
+
+    def get(self, namespace, key, default=None):
+        _, payload = self._read(namespace, key)
+        return default if payload is None else pickle.loads(payload)
+
+    def set(self, namespace, key, value, timeout=None):
+        """Store a value; timeout in seconds, None for CACHE_DEFAULT_TIMEOUT, 0 for no expiry"""
+        self._write(namespace, key, None, value, timeout)
+
+    def get_or_set(self, namespace, key, compute, timeout=None):
+        """
+        Cached value for key, computing and storing it on a miss
+
+        Concurrent misses for the same key are coalesced: one caller
+        computes, the rest wait for it and get their own copy of its result.
+        """
+        full_key, payload = self._read(namespace, key)
+        if payload is not None:
+            return pickle.loads(payload)
+
+        def fill():
+            value = compute()
+            return value, self._write(namespace, key, full_key, value, timeout)
+
+        (value, payload), shared = self.flights.do(full_key or f'{namespace}:{key}', fill, namespace)
+        if shared and payload is not None:
+            return pickle.loads(payload)
+        return value
+
+    def delete(self, namespace, key):
+        self.backend.delete(self._key(namespace, key))
+
+    def invalidate(self, namespace):
+        """Drop every key in a namespace"""
+        self.backend.bump_generation(namespace)
+
+    def stats(self):
+        namespaces = {}
+        with self._lock:
+            counts = dict(self._counts)
+        for (namespace, result), count in counts.items():
+            namespaces.setdefault(namespace, {'hit': 0, 'miss': 0})[result] = count
+        for counts in namespaces.values():
+            lookups = counts['hit'] + counts['miss']
+            counts['hit_ratio'] = round(counts['hit'] / lookups, 4) if lookups else None
+        for namespace, roles in self.flights.stats().items():
+            namespaces.setdefault(namespace, {'hit': 0, 'miss': 0, 'hit_ratio': None})
+            namespaces[namespace]['computed'] = roles['leader']
+            namespaces[namespace]['coalesced'] = roles['follower']
+        return {'backend': type(self.backend).__name__, 'default_timeout': self.default_timeout,
+                'storage': self.backend.stats(), 'in_flight': self.flights.in_flight(),
+                'namespaces': namespaces}
+
+
+def _create_cache():
+    config = get_config()
+    cache_type = config.CACHE_TYPE
+    if cache_type == 'simple':
+        backend = MemoryBackend(config.CACHE_MAX_BYTES)
+    elif cache_type == 'sqlite':
+        backend = SQLiteBackend(config.CACHE_SQLITE_PATH, config.CACHE_MAX_BYTES)
+    elif cache_type == 'null':
+        backend = NullBackend()
+    else:
+        raise ValueError(f"Unknown CACHE_TYPE: {cache_type!r}")
+    return Cache(backend, config.CACHE_DEFAULT_TIMEOUT)
+
+
+_cache = None
+_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide cache built from config"""
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = _create_cache()
+    return _cache
+
+
+def _default_key(args, kwargs):
+    raw = repr((args, sorted(kwargs.items())))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def memoize(namespace, timeout=None, key=None):
+    """
+    Cache a function's results in a namespace
+
+    Args:
+        namespace: Namespace to store results in (invalidate() drops them all)
+        timeout: Seconds to keep results; None for CACHE_DEFAULT_TIMEOUT
+        key: Optional callable taking the function's arguments and returning
+            the key; by default the repr of the arguments (without self) is hashed
+    """
+    def decorator(func):
+        parameters = list(inspect.signature(func).parameters)
+        is_method = bool(parameters) and parameters[0] == 'self'
+        prefix = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if key is not None:
+                cache_key = f'{prefix}:{key(*args, **kwargs)}'
+            else:
+                cache_key = f'{prefix}:{_default_key(args[1:] if is_method else args, kwargs)}'
+            return get_cache().get_or_set(namespace, cache_key, lambda: func(*args, **kwargs), timeout)
+        return wrapper
+    return decorator
+
+
+def _cache_metrics():
+    if _cache is None:
+        return
+    storage = _cache.backend.stats()
+    if 'bytes' in storage:
+        yield metrics.gauge('agri_cache_bytes', 'Bytes of cached values',
+                            samples=[([], storage['bytes'])])
+        yield metrics.gauge('agri_cache_entries', 'Cached entries', samples=[([], storage['entries'])])
+
+
+metrics.add_gauge_callback(_cache_metrics)
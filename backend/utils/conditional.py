@@ -0,0 +1,123 @@
+"""
+Conditional GET support (ETag / Last-Modified)
+
+A view decorated with @conditional(versions) declares which data it
+depends on. versions(**view_args) returns {name: (version, updated_at)}:
+data_versions scopes from the database, the price dataset version, and so
+on. The strong ETag is derived from those versions and the request path
+alone, so a matching If-None-Match is answered with 304 before the view
+runs any queries or model calls.
+"""
+
+import functools
+import hashlib
+import inspect
+from email.utils import formatdate, parsedate_to_datetime
+
+from flask import Response, make_response, request
+
+from config import get_config
+from executors import run_io
+
+# Content-Encoding suffixes utils.responses appends to the ETag of compressed bodies
+ENCODING_SUFFIXES = ('-br', '-gzip')
+
+
+def compute_etag(versions):
+    """Strong ETag for the current request path and data versions"""
+    parts = [get_config().API_VERSION, request.full_path]
+    for name in sorted(versions):
+        version, updated_at = versions[name]
+        parts.append(f'{name}={version}@{updated_at}')
+    return '"' + hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest() + '"'
+
+
+def _last_modified(versions):
+    timestamps = [updated_at for _, updated_at in versions.values() if updated_at]
+    return max(timestamps) if timestamps else None
+
+
+def _base_tag(tag):
+    """Strip the weak prefix and any compression suffix from a client's ETag"""
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def _not_modified(etag, last_modified):
+    """304 response if the request's validators match, else None"""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        for tag in if_none_match.split(','):
+            if tag.strip() == '*' or _base_tag(tag) == etag:
+                return _validated(Response(status=304), tag.strip() if tag.strip() != '*' else etag,
+                                  last_modified)
+        return None
+
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return None
+        if last_modified <= since:
+            return _validated(Response(status=304), etag, last_modified)
+
+    return None
+
+
+def _validated(response, etag, last_modified):
+    """Attach the validators to a response"""
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+    # Let browsers keep the body but revalidate on every poll
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _finish(rv, etag, last_modified):
+    response = make_response(rv)
+    if response.status_code == 200:
+        _validated(response, etag, last_modified)
+    return response
+
+
+def conditional(versions):
+    """
+    Answer If-None-Match / If-Modified-Since from data versions
+
+    Args:
+        versions: Callable taking the view's arguments and returning
+            {name: (version, updated_at)} for everything the response depends on
+    """
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                current = await run_io(versions, **kwargs)
+                etag, last_modified = compute_etag(current), _last_modified(current)
+                cached = _not_modified(etag, last_modified)
+                if cached is not None:
+                    return cached
+                return _finish(await view(*args, **kwargs), etag, last_modified)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            current = versions(**kwargs)
+            etag, last_modified = compute_etag(current), _last_modified(current)
+            cached = _not_modified(etag, last_modified)
+            if cached is not None:
+                return cached
+            return _finish(view(*args, **kwargs), etag, last_modified)
+        return wrapper
+
+    return decorator
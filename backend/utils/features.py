@@ -0,0 +1,25 @@
+"""
+Engineered features of the yield model
+
+The yield pipeline is trained on the crop-yield.csv columns plus these
+derived ones, so they must be computed the same way wherever the pipeline
+sees data: rebuild_models.py when it trains, retraining.py when it
+continues training, and the yield service when it predicts.
+"""
+
+# One-hot encoded by the pipeline; values it was not trained on (such as
+# 'Unknown' for a missing input) encode as all zeros
+CATEGORICAL_YIELD_COLUMNS = ['Soil_Type', 'Region', 'Season', 'Crop_Type', 'Irrigation_Type']
+
+ENGINEERED_YIELD_COLUMNS = ['NPK_Total', 'N_to_P', 'Water_Stress', 'Fertilizer_Efficiency', 'Climate_Index']
+
+
+def add_yield_features(df):
+    """Copy of a yield input frame with the engineered columns added"""
+    df = df.copy()
+    df['NPK_Total'] = df['N'] + df['P'] + df['K']
+    df['N_to_P'] = df['N'] / (df['P'] + 1)
+    df['Water_Stress'] = df['Temperature'] / (df['Rainfall'] + 1)
+    df['Fertilizer_Efficiency'] = df['Fertilizer_Used'] / (df['NPK_Total'] + 1)
+    df['Climate_Index'] = df['Temperature'] * 0.4 + df['Humidity'] * 0.3 + df['Sunlight_Hours'] * 0.3
+    return df
@@ -1,65 +1,9 @@
-from flask import jsonify
+import logging
 from typing import Dict, Any
-import traceback
 from datetime import datetime
+import os
 
-def create_response(status: str, message: str, data: Any = None, status_code: int = 200) -> tuple:
-    """
-    Create standardized API response
-    
-    Args:
-        status: Response status ('success', 'error', 'warning')
-        message: Response message
-        data: Response data (optional)
-        status_code: HTTP status code
-        
-    Returns:
-        Tuple of (response, status_code)
-    """
-    response = {
-        'status': status,
-        'message': message,
-        'timestamp': datetime.now().isoformat()
-    }
-    
-    if data is not None:
-        response['data'] = data
-    
-    return jsonify(response), status_code
-
-def handle_errors(error: Exception) -> tuple:
-    """
-    Handle exceptions and return standardized error response
-    
-    Args:
-        error: Exception object
-        
-    Returns:
-        Tuple of (error_response, status_code)
-    """
-    error_message = str(error)
-    error_traceback = traceback.format_exc()
-    
-    # Log the error (in production, use proper logging)
-    print(f"Error occurred: {error_message}")
-    print(f"Traceback: {error_traceback}")
-    
-    # Determine appropriate status code
-    if "not found" in error_message.lower():
-        status_code = 404
-    elif "permission" in error_message.lower() or "unauthorized" in error_message.lower():
-        status_code = 403
-    elif "validation" in error_message.lower() or "invalid" in error_message.lower():
-        status_code = 400
-    else:
-        status_code = 500
-    
-    return create_response(
-        'error',
-        f"An error occurred: {error_message}",
-        {'error_type': type(error).__name__},
-        status_code
-    )
+logger = logging.getLogger(__name__)
 
 def format_currency(amount: float, currency: str = 'EGP') -> str:
     """
@@ -305,3 +249,19 @@ def safe_int_conversion(value: Any, default: int = 0) -> int:
         return int(value)
     except (ValueError, TypeError):
         return default
+
+def file_version(path: str) -> str:
+    """
+    Cheap identifier for a file's contents (modification time and size)
+    
+    Args:
+        path: File path
+        
+    Returns:
+        Hex version string, or None if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
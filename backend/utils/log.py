@@ -0,0 +1,227 @@
+"""
+Structured, non-blocking logging
+
+Request threads only put records on an in-memory queue; a QueueListener
+thread formats them and does the I/O, so a slow stdout or disk never stalls
+a request. Records are written as one JSON object per line carrying the
+request id (X-Request-ID, or generated) and any structured fields passed
+through `extra`, such as stage timings.
+
+Errors are sampled: per logger and message template, the first
+LOG_ERROR_BURST records in each LOG_ERROR_WINDOW seconds are written with
+their traceback and the rest are counted. The next record written for that
+error reports how many were suppressed. When the queue is full, records are
+dropped rather than blocking; both counts are exported on /metrics.
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, request
+
+from utils import metrics
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+# LogRecord attributes; everything else on a record came from `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_state = {'listener': None, 'handler': None, 'handlers': None, 'queue_size': None}
+_lock = threading.Lock()
+
+
+def get_request_id():
+    """Id of the request being handled, or None outside a request"""
+    return request_id.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_type'] = record.exc_info[0].__name__
+            entry['traceback'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['traceback'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ContextFilter(logging.Filter):
+    """Stamp records with the request id on the thread that logged them"""
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class ErrorSampler(logging.Filter):
+    """Let through a burst of each distinct error per window and count the rest"""
+
+    def __init__(self, burst, window):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        self._seen = {}  # key -> [window_start, passed, suppressed]
+        self.suppressed = 0
+
+    def filter(self, record):
+        if record.levelno < logging.ERROR or self.burst <= 0:
+            return True
+        exc_type = record.exc_info[0].__name__ if record.exc_info else None
+        key = (record.name, str(record.msg), exc_type)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None or now - entry[0] >= self.window:
+                if entry is not None and entry[2]:
+                    record.suppressed = entry[2]
+                if len(self._seen) > 10000:
+                    self._seen.clear()
+                self._seen[key] = [now, 1, 0]
+                return True
+            if entry[1] < self.burst:
+                entry[1] += 1
+                return True
+            entry[2] += 1
+            self.suppressed += 1
+            return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of waiting on a full queue"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Unlike the stock prepare(), leave traceback formatting to the listener thread
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+def _output_handlers(config):
+    formatter = JsonFormatter() if config.LOG_FORMAT == 'json' else logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if config.LOG_FILE:
+        handlers.append(logging.FileHandler(config.LOG_FILE, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _start_listener():
+    log_queue = queue.Queue(_state['queue_size'])
+    _state['handler'].queue = log_queue
+    listener = QueueListener(log_queue, *_state['handlers'], respect_handler_level=True)
+    listener.start()
+    _state['listener'] = listener
+
+
+def _restart_in_child():
+    # The listener thread does not survive a fork (gunicorn preload_app)
+    if _state['listener'] is not None:
+        _start_listener()
+
+
+def stop():
+    """Flush queued records and stop the writer thread"""
+    listener = _state['listener']
+    if listener is not None:
+        _state['listener'] = None
+        listener.stop()
+
+
+def setup_logging(config):
+    """Route the root logger through the queue; safe to call more than once"""
+    with _lock:
+        if _state['listener'] is not None:
+            return
+
+        handler = NonBlockingQueueHandler(None)
+        handler.addFilter(ContextFilter())
+        handler.addFilter(ErrorSampler(config.LOG_ERROR_BURST, config.LOG_ERROR_WINDOW))
+        _state.update(handler=handler, handlers=_output_handlers(config), queue_size=config.LOG_QUEUE_SIZE)
+        _start_listener()
+
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(config.LOG_LEVEL)
+
+        if not _state.get('registered'):
+            _state['registered'] = True
+            os.register_at_fork(after_in_child=_restart_in_child)
+            atexit.register(stop)
+            metrics.add_gauge_callback(_logging_metrics)
+
+
+def _logging_metrics():
+    handler = _state['handler']
+    if handler is None:
+        return
+    sampler = next(f for f in handler.filters if isinstance(f, ErrorSampler))
+    yield metrics.gauge('agri_log_records_dropped', 'Log records dropped on a full queue',
+                        samples=[([], handler.dropped)])
+    yield metrics.gauge('agri_log_errors_suppressed', 'Error records suppressed by sampling',
+                        samples=[([], sampler.suppressed)])
+    yield metrics.gauge('agri_log_queue_depth', 'Log records waiting to be written',
+                        samples=[([], handler.queue.qsize())])
+
+
+def _before_request():
+    incoming = request.headers.get('X-Request-ID', '')
+    # Trust a caller's id only if it looks like one
+    rid = incoming if 0 < len(incoming) <= 64 and incoming.replace('-', '').isalnum() else uuid.uuid4().hex
+    g.request_id_token = request_id.set(rid)
+
+
+def _after_request(response):
+    rid = request_id.get()
+    if rid is not None:
+        response.headers['X-Request-ID'] = rid
+    return response
+
+
+def _teardown_request(exc):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        request_id.reset(token)
+
+
+def init_app(app):
+    """Assign every request an id, echoed in X-Request-ID and stamped on its log records"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,198 @@
+"""
+Prometheus metrics for the API
+
+- agri_http_request_duration_seconds{method, route}: request latency, including
+  serialization and compression
+- agri_http_requests_total{method, route, status}
+- agri_stage_duration_seconds{stage, name}: time spent in model inference, DB
+  queries, price lookups, SHAP explanations and response serialization
+- agri_fallback_total{service}: calls answered by a service's fallback rules
+  instead of its model or data
+- gauges read at scrape time: loaded model versions, price-data age,
+  admission queue depth and shed counts
+
+Routes are labelled with their URL rule ('/dashboard/<int:farm_id>'), so
+label cardinality stays bounded. Recording is a couple of perf_counter
+calls and a histogram observe (a few microseconds), cheap enough to leave
+on in production.
+
+With several worker processes, PROMETHEUS_MULTIPROC_DIR must name a directory
+shared by all of them, set before this module is imported, so every worker's
+samples are aggregated into one scrape. run.py does this for gunicorn;
+`uvicorn --workers` needs it set in its environment (see asgi.py).
+"""
+
+import logging
+import contextvars
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+# *_created series double the exposition size and nothing here uses them;
+# read by prometheus_client at import time
+os.environ.setdefault('PROMETHEUS_DISABLE_CREATED_SERIES', 'true')
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram,
+                               REGISTRY, generate_latest)
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Request latencies: 5 ms .. 30 s
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Stage latencies reach down to tens of microseconds (serialization, small queries)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REQUEST_DURATION = Histogram(
+    'agri_http_request_duration_seconds', 'HTTP request latency',
+    ['method', 'route'], buckets=REQUEST_BUCKETS
+)
+REQUESTS = Counter(
+    'agri_http_requests_total', 'HTTP requests by status',
+    ['method', 'route', 'status']
+)
+STAGE_DURATION = Histogram(
+    'agri_stage_duration_seconds', 'Time spent in a processing stage',
+    ['stage', 'name'], buckets=STAGE_BUCKETS
+)
+
+FALLBACKS = Counter(
+    'agri_fallback_total', 'Calls answered by fallback rules instead of a model',
+    ['service']
+)
+
+_gauge_callbacks = []
+_fallback_trace = contextvars.ContextVar('fallback_trace', default=None)
+
+
+def observe_stage(stage, name, seconds):
+    STAGE_DURATION.labels(stage, name).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage, name):
+    """Time a block as a stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(stage, name).observe(time.perf_counter() - started)
+
+
+def timed(stage, name=None):
+    """Decorator timing every call of a function as a stage"""
+    def decorator(func):
+        child = STAGE_DURATION.labels(stage, name or func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def fallback(service):
+    """Decorator marking a service's fallback path; counted, and visible to trace_fallbacks()"""
+    def decorator(func):
+        child = FALLBACKS.labels(service)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            child.inc()
+            trace = _fallback_trace.get()
+            if trace is not None:
+                trace.add(service)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def trace_fallbacks():
+    """Collect the services whose fallback path ran inside the block"""
+    used = set()
+    token = _fallback_trace.set(used)
+    try:
+        yield used
+    finally:
+        _fallback_trace.reset(token)
+
+
+def add_gauge_callback(callback):
+    """
+    Register a callable producing GaugeMetricFamily objects at scrape time
+
+    Used for values that are cheaper to read on demand than to keep
+    updated: model versions, data age, limiter state.
+    """
+    _gauge_callbacks.append(callback)
+
+
+class _CallbackCollector:
+    def collect(self):
+        for callback in _gauge_callbacks:
+            try:
+                yield from callback()
+            except Exception as e:
+                logger.warning("Metrics callback failed: %s", e, exc_info=True)
+
+
+def gauge(name, documentation, labels=None, samples=()):
+    """GaugeMetricFamily from (label_values, value) pairs"""
+    family = GaugeMetricFamily(name, documentation, labels=labels or [])
+    for label_values, value in samples:
+        family.add_metric(label_values, value)
+    return family
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        REQUEST_DURATION.labels(request.method, route).observe(time.perf_counter() - started)
+        REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+    return response
+
+
+def render():
+    """Current metrics in Prometheus text format"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    body = generate_latest(registry)
+
+    callbacks = CollectorRegistry()
+    callbacks.register(_CallbackCollector())
+    return body + generate_latest(callbacks)
+
+
+def metrics_view():
+    return Response(render(), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    """
+    Record request metrics and serve /metrics
+
+    Call before other after_request hooks are registered: Flask runs them
+    in reverse order, so the duration then includes serialization and
+    compression done by the later hooks.
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,315 @@
+"""
+On-demand profiling of single requests
+
+With PROFILING_ENABLED set and a PROFILING_TOKEN configured, a request
+carrying the token in the X-Profile-Token header (or ?profile=<token>) runs
+under a profiler:
+
+- deterministic (default): cProfile. Writes <id>.pstats for pstats/snakeviz
+  and <id>.collapsed, flamegraph input apportioned from the call graph
+- sampling (X-Profile-Mode: sampling or ?profile_mode=sampling): a thread
+  samples the request's stacks every PROFILING_SAMPLE_INTERVAL seconds.
+  Much lower overhead; writes exact collapsed stacks to <id>.collapsed
+
+Files go to PROFILE_DIR and the response carries the id in X-Profile-Id.
+Profiling follows the request onto the inference and I/O executors and into
+the thread asgiref runs async views on, so model calls and SQLite queries
+show up. Under the ASGI server the event-loop thread is shared, so other
+requests' coroutine steps may appear in the profile as well.
+
+Requests without the token pay one context-variable lookup.
+"""
+
+import logging
+import contextvars
+import cProfile
+import functools
+import hmac
+import inspect
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, request
+
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+MODES = ('deterministic', 'sampling')
+
+_session = contextvars.ContextVar('profile_session', default=None)
+# One profiled request at a time per process keeps the numbers readable
+_busy = threading.Lock()
+
+
+class ProfileSession:
+    """Profiler state for one request, shared by every thread it runs on"""
+
+    def __init__(self, mode, sample_interval=0.001):
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.started = time.perf_counter()
+        self.duration = None
+        self._lock = threading.Lock()
+        self._threads = {}  # thread ident -> [depth, profiler or None]
+        self._profiles = []
+        self._samples = Counter()
+        self._stop = threading.Event()
+        self._sampler = None
+        if mode == 'sampling':
+            self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+            self._sampler.start()
+
+    def enter(self):
+        """Start profiling the calling thread; nested calls are counted"""
+        ident = threading.get_ident()
+        with self._lock:
+            entry = self._threads.get(ident)
+            if entry is not None:
+                entry[0] += 1
+                return
+            entry = self._threads[ident] = [1, None]
+        if self.mode == 'deterministic':
+            entry[1] = cProfile.Profile()
+            entry[1].enable()
+
+    def exit(self):
+        """Stop profiling the calling thread once its outermost enter() returns"""
+        ident = threading.get_ident()
+        with self._lock:
+            entry = self._threads.get(ident)
+            if entry is None:
+                return
+            entry[0] -= 1
+            if entry[0] > 0:
+                return
+            del self._threads[ident]
+        if entry[1] is not None:
+            entry[1].disable()
+            with self._lock:
+                self._profiles.append(entry[1])
+
+    def run(self, func, *args, **kwargs):
+        """Call func with the calling thread profiled"""
+        self.enter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.exit()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            with self._lock:
+                idents = set(self._threads)
+            idents.discard(own)
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                self._samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        """Finish the session; threads still inside enter() are dropped"""
+        self.duration = time.perf_counter() - self.started
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def save(self, directory, metadata):
+        """Write the profile files and return their paths"""
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.id)
+        paths = {}
+
+        if self.mode == 'deterministic' and self._profiles:
+            stats = pstats.Stats(self._profiles[0])
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(base + '.pstats')
+            paths['pstats'] = base + '.pstats'
+            collapsed = collapse_stats(stats)
+        else:
+            collapsed = self._samples
+
+        with open(base + '.collapsed', 'w') as f:
+            for stack, count in sorted(collapsed.items()):
+                f.write(f'{stack} {count}\n')
+        paths['collapsed'] = base + '.collapsed'
+
+        with open(base + '.json', 'w') as f:
+            json.dump(dict(metadata, id=self.id, mode=self.mode,
+                           duration_ms=round(self.duration * 1000, 3),
+                           samples=sum(self._samples.values()) if self.mode == 'sampling' else None,
+                           files=sorted(os.path.basename(p) for p in paths.values())), f, indent=2)
+        return paths
+
+
+def _frame_label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _stats_label(func):
+    filename, line, name = func
+    if filename == '~':  # builtins
+        return name
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def collapse_stats(stats, min_fraction=0.001):
+    """
+    Collapsed stacks (microseconds) from cProfile's caller graph
+
+    cProfile keeps caller -> callee edges rather than whole stacks, so each
+    function's time is split across its callers in proportion to the edge
+    times, as flameprof does. Branches below min_fraction of the total are
+    dropped.
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    total = stats.total_tt or 1e-9
+    threshold = total * min_fraction
+    collapsed = Counter()
+
+    def walk(func, stack, on_stack, share):
+        _, _, tt, ct, _ = entries[func]
+        stack = stack + [_stats_label(func)]
+        self_time = tt * share
+        if self_time > 0:
+            collapsed[';'.join(stack)] += self_time
+        for callee, edge_ct in callees.get(func, ()):
+            callee_ct = entries[callee][3]
+            callee_time = edge_ct * share
+            if callee in on_stack or callee_time < threshold or callee_ct <= 0:
+                continue
+            walk(callee, stack, on_stack | {callee}, callee_time / callee_ct)
+
+    for func, entry in entries.items():
+        if not entry[4] and entry[3] >= threshold:
+            walk(func, [], frozenset([func]), 1.0)
+
+    return Counter({stack: max(1, round(seconds * 1e6)) for stack, seconds in collapsed.items()})
+
+
+def current_session():
+    """Profile session of the running request, or None"""
+    return _session.get()
+
+
+def profiled(func):
+    """Wrap func so it is profiled when called under an active session"""
+    session = _session.get()
+    if session is None:
+        return func
+    return functools.partial(session.run, func)
+
+
+def _requested_mode():
+    """Mode the request asks for, or None if it is not an authorized profile request"""
+    config = get_config()
+    if not config.PROFILING_ENABLED or not config.PROFILING_TOKEN:
+        return None
+    token = request.headers.get('X-Profile-Token') or request.args.get('profile')
+    if not token or not hmac.compare_digest(token.encode(), config.PROFILING_TOKEN.encode()):
+        return None
+    mode = request.headers.get('X-Profile-Mode') or request.args.get('profile_mode') or 'deterministic'
+    return mode if mode in MODES else None
+
+
+def _before_request():
+    mode = _requested_mode()
+    if mode is None or not _busy.acquire(blocking=False):
+        return
+    session = ProfileSession(mode, get_config().PROFILING_SAMPLE_INTERVAL)
+    g.profile_token = _session.set(session)
+    g.profile_session = session
+    session.enter()
+
+
+def _finish():
+    """Stop and save the request's profile; its id, or None"""
+    session = g.pop('profile_session', None)
+    if session is None:
+        return None
+    try:
+        session.exit()
+        session.stop()
+        session.save(get_config().PROFILE_DIR, {
+            'method': request.method,
+            'path': request.path,
+            # Without the token
+            'query': {k: v for k, v in request.args.items() if k != 'profile'},
+            'endpoint': request.endpoint,
+            'created_at': time.time()
+        })
+        return session.id
+    except Exception as e:
+        logger.warning("Failed to save profile: %s", e, exc_info=True)
+        return None
+    finally:
+        _session.reset(g.pop('profile_token'))
+        _busy.release()
+
+
+def _after_request(response):
+    if 'profile_session' in g:
+        profile_id = _finish()
+        if profile_id is not None:
+            response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def _teardown_request(exc):
+    # after_request is skipped when a view raises
+    if 'profile_session' in g:
+        _finish()
+
+
+def init_app(app):
+    """
+    Enable on-demand request profiling
+
+    Call first: Flask runs after_request hooks in reverse order, so the
+    profile then includes the other hooks (metrics, serialization,
+    compression) as well.
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+    ensure_sync = app.ensure_sync
+
+    def profiled_ensure_sync(func):
+        # Flask runs async views on an event loop in another thread;
+        # profile that thread while the view's coroutine runs
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                session = _session.get()
+                if session is None:
+                    return await func(*args, **kwargs)
+                session.enter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    session.exit()
+            return ensure_sync(wrapper)
+        return ensure_sync(func)
+
+    app.ensure_sync = profiled_ensure_sync
@@ -0,0 +1,214 @@
+"""
+Response layer for the API
+
+All endpoints build their JSON envelope with create_response(). Bodies are
+serialized with orjson when it is installed, which handles NumPy scalars and
+arrays, datetimes and pandas timestamps natively. Without orjson the stdlib
+encoder is used with an equivalent fallback for those types. Large bodies
+are compressed with brotli or gzip, whichever the client accepts.
+Streamed bodies (ndjson_response) are sent uncompressed, line by line.
+"""
+
+import asyncio
+import contextvars
+import logging
+import gzip
+import json
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator
+
+from flask import Response, request
+
+from config import get_config
+from utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+COMPRESSIBLE_MIMETYPES = {JSON_MIMETYPE, NDJSON_MIMETYPE, 'text/html', 'text/plain', 'text/csv'}
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    """Types neither encoder handles natively"""
+    # NumPy values can only exist once something else imported it
+    np = sys.modules.get('numpy')
+    if np is not None and isinstance(obj, np.generic):
+        return obj.item()
+    if np is not None and isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # pandas scalars such as Timestamp/Timedelta without importing pandas here
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+@timed('serialization', 'json')
+def dumps(payload: Any) -> bytes:
+    """Serialize a payload to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(payload, default=_default, separators=(',', ':'),
+                      ensure_ascii=False).encode('utf-8')
+
+
+def json_response(payload: Any, status_code: int = 200) -> Response:
+    """Build a JSON response from any serializable payload"""
+    return Response(dumps(payload), status=status_code, mimetype=JSON_MIMETYPE)
+
+
+def ndjson_response(items: AsyncIterator[Any], status_code: int = 200) -> Response:
+    """
+    Stream an async iterator of payloads as newline-delimited JSON
+
+    Each payload is written as soon as the iterator produces it. The
+    iterator is driven from the WSGI server's thread on an event loop of
+    its own, after the view has returned, so it must not touch `request`;
+    context variables (the request id in log lines) are carried over. If
+    the client goes away the iterator is closed, which cancels whatever it
+    was waiting on.
+    """
+    context = contextvars.copy_context()
+
+    def generate():
+        loop = asyncio.new_event_loop()
+        iterator = items.__aiter__()
+        try:
+            while True:
+                try:
+                    item = context.run(loop.run_until_complete, iterator.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield dumps(item) + b'\n'
+        finally:
+            if hasattr(iterator, 'aclose'):
+                context.run(loop.run_until_complete, iterator.aclose())
+            loop.close()
+
+    response = Response(generate(), status=status_code, mimetype=NDJSON_MIMETYPE)
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: forward each line as it is written
+    return response
+
+
+def create_response(status: str, message: str, data: Any = None, status_code: int = 200) -> Response:
+    """
+    Create standardized API response
+
+    Args:
+        status: Response status ('success', 'error', 'warning')
+        message: Response message
+        data: Response data (optional)
+        status_code: HTTP status code
+
+    Returns:
+        Flask response with the JSON envelope
+    """
+    response = {
+        'status': status,
+        'message': message
+    }
+
+    if data is not None:
+        response['data'] = data
+
+    return json_response(response, status_code)
+
+
+def handle_errors(error: Exception, prefix: str = 'Internal server error') -> Response:
+    """Log an unexpected exception and return a 500 response"""
+    logger.error("API error: %s", error, exc_info=error)
+    return create_response('error', f'{prefix}: {str(error)}', status_code=500)
+
+
+# ----------------------------------------------------------------- compression
+
+def _accepted_encodings(header: str) -> dict:
+    """Parse Accept-Encoding into {encoding: q}"""
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name] = q
+    return encodings
+
+
+def choose_encoding(header: str):
+    """Best supported encoding for an Accept-Encoding header, or None"""
+    accepted = _accepted_encodings(header or '')
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best = None
+    best_q = 0.0
+    for encoding in candidates:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a body with the configured level for the encoding"""
+    config = get_config()
+    if encoding == 'br':
+        return brotli.compress(body, quality=config.COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=config.COMPRESS_GZIP_LEVEL)
+
+
+def compress_response(response: Response) -> Response:
+    """after_request hook: compress large bodies the client can decode"""
+    if (response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.status_code < 200 or response.status_code in (204, 304)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < get_config().COMPRESS_MIN_SIZE:
+        return response
+
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # A compressed body is a different representation, so it gets its own strong ETag
+    etag = response.headers.get('ETag')
+    if etag and etag.endswith('"'):
+        response.headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    return response
+
+
+def init_app(app):
+    """Enable response compression on an app"""
+    app.after_request(compress_response)
@@ -0,0 +1,77 @@
+"""
+Request coalescing ("single flight")
+
+When many callers ask for the same computation at once - a burst of
+GET /api/market-price?crop=wheat at opening time - only the first caller
+runs it. The others wait for that in-flight call and share its result or
+its exception. Nothing is kept once the call finishes; caching is
+utils.cache's job, which routes its misses through here.
+
+agri_singleflight_calls_total{name, role} counts leaders (computations
+run) and followers (computations saved).
+"""
+
+import threading
+from concurrent.futures import Future
+
+from prometheus_client import Counter
+
+SINGLEFLIGHT_CALLS = Counter(
+    'agri_singleflight_calls_total', 'Coalesced computations by role (followers are computations saved)',
+    ['name', 'role']
+)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}  # key -> Future of the in-flight call
+        self._lock = threading.Lock()
+        self._counts = {}  # (name, role) -> calls in this process
+
+    def _count(self, name, role):
+        SINGLEFLIGHT_CALLS.labels(name, role).inc()
+        with self._lock:
+            self._counts[(name, role)] = self._counts.get((name, role), 0) + 1
+
+    def do(self, key, func, name='default'):
+        """
+        Run func once for all concurrent callers with the same key
+
+        Returns:
+            Tuple of (result, shared): shared is True for callers that
+            received another caller's result
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            self._count(name, 'follower')
+            return future.result(), True
+
+        self._count(name, 'leader')
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        names = {}
+        for (name, role), count in counts.items():
+            names.setdefault(name, {'leader': 0, 'follower': 0})[role] = count
+        return names
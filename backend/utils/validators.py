@@ -1,4 +1,22 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
+import numpy as np
+import pandas as pd
+
+# agriculture_dataset.csv column layout -> farm record fields
+FARM_DATASET_COLUMNS = {
+    'Farm_ID': 'name',
+    'Crop_Type': 'crop_type',
+    'Farm_Area(acres)': 'farm_area',
+    'Irrigation_Type': 'irrigation_type',
+    'Fertilizer_Used(tons)': 'fertilizer_used',
+    'Pesticide_Used(kg)': 'pesticide_used',
+    'Yield(tons)': 'yield',
+    'Soil_Type': 'soil_type',
+    'Season': 'season',
+    'Water_Usage(cubic meters)': 'water_usage'
+}
+
+ACRES_TO_HECTARES = 0.404686
 
 def validate_input_data(data: Dict, required_fields: List[str]) -> bool:
     """
@@ -208,6 +226,68 @@ def validate_revenue_input(data: Dict) -> Dict:
         'warnings': warnings
     }
 
+def validate_farm_records(records: pd.DataFrame, defaults: Dict = None) -> Tuple[pd.DataFrame, List[Dict]]:
+    """
+    Validate a batch of farm records in one vectorized pass
+    
+    Accepts both the API field names (name, location, area_hectares, ...) and
+    the agriculture_dataset.csv column layout. Farm_Area(acres) is converted to
+    area_hectares when no hectare value is given.
+    
+    Args:
+        records: DataFrame with one farm per row
+        defaults: Values used where a row leaves a field empty (e.g. user_id, location)
+        
+    Returns:
+        Tuple of (valid rows, list of {'index': row position, 'errors': [...]})
+    """
+    df = records.rename(columns=FARM_DATASET_COLUMNS).reset_index(drop=True)
+    
+    for field, value in (defaults or {}).items():
+        if value is None:
+            continue
+        if field in df:
+            df[field] = df[field].where(df[field].notna(), value)
+        else:
+            df[field] = value
+    
+    def column(name):
+        return df[name] if name in df else pd.Series(np.nan, index=df.index, dtype=object)
+    
+    checks = []
+    
+    for field in ['name', 'location']:
+        values = column(field)
+        missing = values.isna() | (values.astype(str).str.strip() == '')
+        checks.append((missing, f"Missing required field: {field}"))
+    
+    numeric_fields = ['user_id', 'area_hectares', 'farm_area', 'fertilizer_used',
+                      'pesticide_used', 'yield', 'water_usage']
+    for field in numeric_fields:
+        raw = column(field)
+        values = pd.to_numeric(raw, errors='coerce')
+        checks.append((raw.notna() & values.isna(), f"Invalid numeric value for: {field}"))
+        checks.append((values < 0, f"{field} must not be negative"))
+        df[field] = values
+    
+    df['area_hectares'] = df['area_hectares'].fillna(df['farm_area'] * ACRES_TO_HECTARES)
+    df['farm_area'] = df['farm_area'].fillna(df['area_hectares'] / ACRES_TO_HECTARES)
+    
+    checks.append((df['user_id'].isna(), "Missing required field: user_id"))
+    checks.append((df['area_hectares'].isna(), "Missing required field: area_hectares"))
+    checks.append((df['area_hectares'] == 0, "area_hectares must be greater than 0"))
+    
+    invalid = pd.Series(False, index=df.index)
+    row_errors = {}
+    for mask, message in checks:
+        mask = mask.fillna(False).astype(bool)
+        invalid |= mask
+        for index in df.index[mask]:
+            row_errors.setdefault(int(index), []).append(message)
+    
+    errors = [{'index': index, 'errors': row_errors[index]} for index in sorted(row_errors)]
+    return df[~invalid], errors
+
 def sanitize_input(data: Dict) -> Dict:
     """
     Sanitize input data by removing potentially harmful values
@@ -17,6 +17,15 @@ const FarmWorkflow = () => {
     { title: 'Generating Recommendations', description: 'Creating actionable advice for optimization' },
   ];
 
+  // Step each streamed section completes
+  const sectionSteps = {
+    recommended_crop: 1,
+    yield_prediction: 2,
+    revenue_prediction: 3,
+    efficiency_metrics: 4,
+    insights: 5,
+  };
+
   const sampleData = {
     temperature: 25,
     humidity: 60,
@@ -37,15 +46,13 @@ const FarmWorkflow = () => {
     setCurrentStep(0);
 
     try {
-      // Simulate workflow steps
-      for (let i = 0; i < workflowSteps.length; i++) {
-        setCurrentStep(i);
-        await new Promise(resolve => setTimeout(resolve, 2000));
-      }
-
-      // Call the complete workflow API
-      const response = await ApiService.runFarmerWorkflow(sampleData);
-      setResults(response.data);
+      // Steps complete as their sections arrive from the server
+      const sections = await ApiService.streamFarmerWorkflow(sampleData, (section) => {
+        if (section in sectionSteps) {
+          setCurrentStep(step => Math.max(step, sectionSteps[section] + 1));
+        }
+      });
+      setResults(sections);
     } catch (error) {
       console.error('Workflow error:', error);
       // Fallback to mock results
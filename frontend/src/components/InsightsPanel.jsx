@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Brain, AlertCircle, CheckCircle, AlertTriangle, TrendingUp, DollarSign } from 'lucide-react';
+import ApiService from '../services/api';
 
 const InsightsPanel = ({ farmId }) => {
   const [insights, setInsights] = useState([]);
@@ -15,8 +16,7 @@ const InsightsPanel = ({ farmId }) => {
   const fetchInsights = async (farmId) => {
     try {
       setLoading(true);
-      const response = await fetch(`${import.meta.env.VITE_API_URL || ''}/farms/${farmId}/predictions`);
-      const result = await response.json();
+      const result = await ApiService.getFarmPredictions(farmId);
       
       if (result.status === 'success') {
         // Transform prediction data into insights
@@ -5,6 +5,7 @@ import PriceTrendChart from '../components/Charts/PriceTrendChart';
 import YieldChart from '../components/Charts/YieldChart';
 import InsightsPanel from '../components/InsightsPanel';
 import ConnectionTest from '../components/ConnectionTest';
+import ApiService from '../services/api';
 
 const Dashboard = () => {
   const [selectedFarm, setSelectedFarm] = useState('');
@@ -25,6 +26,16 @@ const Dashboard = () => {
     }
   }, [selectedFarm]);
 
+  // Refresh when a new analysis is saved for the farm
+  useEffect(() => {
+    if (!selectedFarm) {
+      return undefined;
+    }
+    return ApiService.subscribeToEvents([`farm:${selectedFarm}`], () => {
+      fetchDashboardData(selectedFarm);
+    });
+  }, [selectedFarm]);
+
   const fetchFarms = async () => {
     try {
       const response = await fetch(`${import.meta.env.VITE_API_URL || ''}/farms`);
@@ -49,8 +60,8 @@ const Dashboard = () => {
   const fetchDashboardData = async (farmId) => {
     try {
       setLoading(true);
-      const response = await fetch(`${import.meta.env.VITE_API_URL || ''}/dashboard/${farmId}`);
-      const result = await response.json();
+      // Batched with the insights panel's predictions request
+      const result = await ApiService.getDashboard(farmId);
       
       if (result.status === 'success') {
         setDashboardData(result.data);
@@ -2,6 +2,65 @@
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || '';
 
+// Read requests made in the same tick go out together as one POST /api/batch;
+// the server answers identical ones once
+let pendingBatch = null;
+
+// GET path -> { etag, body } of its last answer. Each batched GET revalidates with
+// its own If-None-Match, so an unchanged endpoint answers 304 without a body
+const validators = new Map();
+
+const resolveAnswer = ({ method, path }, answer) => {
+  if (method !== 'GET') {
+    return answer.body;
+  }
+  const cached = validators.get(path);
+  if (answer.status === 304 && cached) {
+    return cached.body;
+  }
+  const etag = answer.headers?.ETag;
+  if (answer.status === 200 && etag) {
+    validators.set(path, { etag, body: answer.body });
+  }
+  return answer.body;
+};
+
+const flushBatch = async () => {
+  const { requests, callbacks } = pendingBatch;
+  pendingBatch = null;
+  try {
+    const response = await fetch(`${API_BASE_URL}/api/batch`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ requests }),
+    });
+    const result = await response.json();
+    if (result.status !== 'success') {
+      throw new Error(result.message || 'Batch request failed');
+    }
+    result.data.responses.forEach((answer, index) => {
+      callbacks[index].resolve(resolveAnswer(requests[index], answer));
+    });
+  } catch (error) {
+    callbacks.forEach(({ reject }) => reject(error));
+  }
+};
+
+const batched = (path, method = 'GET', body = undefined) => {
+  if (!pendingBatch) {
+    pendingBatch = { requests: [], callbacks: [] };
+    setTimeout(flushBatch, 0);
+  }
+  const cached = method === 'GET' ? validators.get(path) : undefined;
+  const headers = cached ? { 'If-None-Match': cached.etag } : undefined;
+  return new Promise((resolve, reject) => {
+    pendingBatch.requests.push({ method, path, body, headers });
+    pendingBatch.callbacks.push({ resolve, reject });
+  });
+};
+
 class ApiService {
   // Farm Management
   static async getFarms() {
@@ -78,19 +137,36 @@ class ApiService {
   // Market Data
   static async getMarketPrices(crop = 'wheat') {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/market-price?crop=${crop}`);
-      return await response.json();
+      return await batched(`/api/market-price?crop=${encodeURIComponent(crop)}`);
     } catch (error) {
       console.error('Error fetching market prices:', error);
       throw error;
     }
   }
 
+  // Dashboard
+  static async getDashboard(farmId) {
+    try {
+      return await batched(`/dashboard/${farmId}`);
+    } catch (error) {
+      console.error('Error fetching dashboard data:', error);
+      throw error;
+    }
+  }
+
+  static async getFarmPredictions(farmId) {
+    try {
+      return await batched(`/farms/${farmId}/predictions`);
+    } catch (error) {
+      console.error('Error fetching farm predictions:', error);
+      throw error;
+    }
+  }
+
   // Analytics
   static async getFarmAnalytics(farmId) {
     try {
-      const response = await fetch(`${API_BASE_URL}/farms/${farmId}/predictions`);
-      return await response.json();
+      return await batched(`/farms/${farmId}/predictions`);
     } catch (error) {
       console.error('Error fetching farm analytics:', error);
       throw error;
@@ -99,8 +175,7 @@ class ApiService {
 
   static async getYieldImpactFactors(farmId) {
     try {
-      const response = await fetch(`${API_BASE_URL}/farms/${farmId}/predictions`);
-      return await response.json();
+      return await batched(`/farms/${farmId}/predictions`);
     } catch (error) {
       console.error('Error fetching yield factors:', error);
       throw error;
@@ -110,14 +185,57 @@ class ApiService {
   // Insights
   static async getAIInsights(farmId) {
     try {
-      const response = await fetch(`${API_BASE_URL}/farms/${farmId}/predictions`);
-      return await response.json();
+      return await batched(`/farms/${farmId}/predictions`);
     } catch (error) {
       console.error('Error fetching AI insights:', error);
       throw error;
     }
   }
 
+  // Live updates: topics like [`farm:${farmId}`]; returns a function that closes the stream.
+  // EventSource reconnects by itself and resumes from the last event it saw. A refused stream (503 when
+  // the server has no thread to spare) is not retried by EventSource: poll instead, sending a `reset`
+  // (refetch) every pollMs and trying the stream again
+  static subscribeToEvents(topics, onEvent, pollMs = 30000) {
+    const url = `${API_BASE_URL}/events?topics=${encodeURIComponent(topics.join(','))}`;
+    let source = null;
+    let timer = null;
+    let closed = false;
+
+    const connect = () => {
+      source = new EventSource(url);
+      ['analysis', 'reset'].forEach((type) => {
+        source.addEventListener(type, (event) => onEvent(type, JSON.parse(event.data)));
+      });
+      source.onerror = () => {
+        if (closed || source.readyState !== EventSource.CLOSED) {
+          return;
+        }
+        timer = setTimeout(() => {
+          onEvent('reset', {});
+          connect();
+        }, pollMs);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(timer);
+      source.close();
+    };
+  }
+
+  // Several requests in one round trip: [{ method, path, body }] -> response bodies in order
+  static async batch(requests) {
+    try {
+      return await Promise.all(requests.map(({ path, method, body }) => batched(path, method, body)));
+    } catch (error) {
+      console.error('Error running batch:', error);
+      throw error;
+    }
+  }
+
   // Complete Farmer Workflow
   static async runFarmerWorkflow(farmData) {
     try {
@@ -134,6 +252,50 @@ class ApiService {
       throw error;
     }
   }
+
+  // Farmer Workflow, section by section: onSection(name, data) is called as each stage finishes.
+  // Resolves with the sections collected, in the shape runFarmerWorkflow returns under `data`
+  static async streamFarmerWorkflow(farmData, onSection) {
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/farmer-workflow/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(farmData),
+      });
+      if (!response.ok) {
+        throw new Error((await response.json()).message);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      const sections = {};
+      let buffered = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        for (const line of lines.filter(Boolean)) {
+          const message = JSON.parse(line);
+          if (message.section) {
+            sections[message.section] = message.data;
+            if (onSection) onSection(message.section, message.data);
+          } else if (message.status === 'error') {
+            throw new Error(message.message);
+          } else if (message.stage_timings_ms) {
+            sections.stage_timings_ms = message.stage_timings_ms;
+          }
+        }
+      }
+      return sections;
+    } catch (error) {
+      console.error('Error streaming farmer workflow:', error);
+      throw error;
+    }
+  }
 }
 
 export default ApiService;
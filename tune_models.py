@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Hyperparameter search for the crop and yield models
+
+Each candidate configuration is cross-validated on the training split used
+by rebuild_models.py, in a pool of worker processes (one thread each), then
+fitted on the whole training split and scored on the held-out test split.
+Once the pool is done, the fitted candidates are timed one at a time in
+this process, so the timings don't compete with training: median and p95
+latency of a single-row predict (how the API serves), and the time to
+predict a batch of rows. Candidates no other candidate beats on error,
+single-row and batch latency together form the Pareto frontier.
+
+    python tune_models.py search                            # both models, full grid
+    python tune_models.py search --models crop --trials 8   # 8 sampled candidates
+    python tune_models.py promote crop 5                    # use trial 5 from now on
+
+Results go to model/tuning_report.json. `promote` copies a trial's settings
+into model/model_params.json, which rebuild_models.py applies on the next
+rebuild.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import pickle
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache
+
+from rebuild_models import (ROOT_DIR, available_cores, crop_dataset, crop_estimator,
+                            load_params, yield_dataset, yield_estimator)
+
+# Values tried for each hyperparameter; the others keep their current setting
+SEARCH_SPACES = {
+    'crop': {
+        'n_estimators': [25, 50, 100, 200, 400],
+        'max_depth': [None, 8, 12, 16]
+    },
+    'yield': {
+        'n_estimators': [100, 250, 500, 1000],
+        'max_depth': [3, 4, 6, 8],
+        'learning_rate': [0.05, 0.1]
+    }
+}
+
+# Cross-validation scoring and how the error is read from it
+METRICS = {
+    'crop': {'scoring': 'accuracy', 'name': 'accuracy', 'error': lambda score: 1 - score},
+    'yield': {'scoring': 'neg_root_mean_squared_error', 'name': 'rmse', 'error': lambda score: -score}
+}
+
+SINGLE_ROW_REPEATS = 200
+BATCH_ROWS = 1000
+BATCH_REPEATS = 10
+
+
+@lru_cache(maxsize=None)
+def dataset(name, data_dir):
+    """Train/test split for a model, loaded once per process"""
+    return crop_dataset(data_dir) if name == 'crop' else yield_dataset(data_dir)
+
+
+def estimator(name, params, n_jobs, columns):
+    return crop_estimator(params, n_jobs) if name == 'crop' else yield_estimator(params, n_jobs, columns)
+
+
+def serving_threads(name, model):
+    """Thread settings the model is saved with by rebuild_models.py"""
+    if name == 'crop':
+        model.set_params(n_jobs=None)
+    else:
+        model.set_params(model__n_jobs=None)
+    return model
+
+
+def candidates(name, current, trials=None, seed=42):
+    """
+    Parameter sets to try: the current settings first, then the grid of
+    SEARCH_SPACES (a random sample of it if `trials` is given)
+    """
+    space = SEARCH_SPACES[name]
+    grid = [{**current, **dict(zip(space, values))} for values in itertools.product(*space.values())]
+    grid = [params for params in grid if params != current]
+    if trials is not None and trials - 1 < len(grid):
+        grid = random.Random(seed).sample(grid, max(0, trials - 1))
+    return [current] + grid
+
+
+def run_trial(name, trial, params, data_dir, folds):
+    """Cross-validate one candidate and fit it on the training split (in a pool worker)"""
+    from sklearn.metrics import get_scorer
+    from sklearn.model_selection import KFold, StratifiedKFold, cross_val_score
+
+    X_train, X_test, y_train, y_test = dataset(name, data_dir)
+    metric = METRICS[name]
+    splitter = (StratifiedKFold if name == 'crop' else KFold)(n_splits=folds, shuffle=True, random_state=42)
+
+    started = time.perf_counter()
+    scores = cross_val_score(estimator(name, params, 1, X_train.columns), X_train, y_train,
+                             scoring=metric['scoring'], cv=splitter, n_jobs=1)
+    cv_seconds = time.perf_counter() - started
+
+    model = estimator(name, params, 1, X_train.columns)
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+
+    holdout = get_scorer(metric['scoring'])(model, X_test, y_test)
+
+    return {
+        'trial': trial,
+        'params': params,
+        f"cv_{metric['name']}": round(abs(float(statistics.fmean(scores))), 4),
+        f"cv_{metric['name']}_std": round(float(statistics.pstdev(scores)), 4),
+        f"holdout_{metric['name']}": round(abs(float(holdout)), 4),
+        'error': round(float(metric['error'](statistics.fmean(scores))), 4),
+        'cv_seconds': round(cv_seconds, 3),
+        'fit_seconds': round(fit_seconds, 3),
+        'model': pickle.dumps(serving_threads(name, model))
+    }
+
+
+def measure_latency(model, X):
+    """Single-row p50/p95 and batch predict times in milliseconds"""
+    single = X.iloc[[0]]
+    batch = X.iloc[:BATCH_ROWS]
+    for _ in range(5):
+        model.predict(single)
+
+    samples = []
+    for _ in range(SINGLE_ROW_REPEATS):
+        started = time.perf_counter()
+        model.predict(single)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+
+    batch_samples = []
+    for _ in range(BATCH_REPEATS):
+        started = time.perf_counter()
+        model.predict(batch)
+        batch_samples.append((time.perf_counter() - started) * 1000)
+
+    return {
+        'single_p50_ms': round(statistics.median(samples), 3),
+        'single_p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'batch_ms': round(statistics.median(batch_samples), 3),
+        'batch_rows': len(batch)
+    }
+
+
+def pareto_frontier(trials, objectives=('error', 'single_p50_ms', 'batch_ms')):
+    """Trial numbers no other trial matches or beats on every objective (lower is better)"""
+    def dominates(a, b):
+        return (all(a[key] <= b[key] for key in objectives)
+                and any(a[key] < b[key] for key in objectives))
+    return [trial['trial'] for trial in trials
+            if not any(dominates(other, trial) for other in trials if other is not trial)]
+
+
+def parse_models(value):
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SEARCH_SPACES]
+    if unknown or not names:
+        raise argparse.ArgumentTypeError(
+            f"unknown model(s) {', '.join(unknown) or '(none)'}; choose from {', '.join(SEARCH_SPACES)}")
+    return list(dict.fromkeys(names))
+
+
+def search(args):
+    current = load_params(args.params or os.path.join(args.model_dir, 'model_params.json'))
+    plans = {name: candidates(name, current[name], args.trials) for name in args.models}
+    workers = max(1, args.jobs)
+    total = sum(len(plan) for plan in plans.values())
+    print(f"🔎 {total} candidate(s), {args.folds}-fold CV, {workers} worker(s)")
+
+    started = time.perf_counter()
+    results = {name: [] for name in args.models}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(run_trial, name, trial, params, args.data_dir, args.folds): name
+            for name, plan in plans.items() for trial, params in enumerate(plan)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            name = futures[future]
+            result = future.result()
+            results[name].append(result)
+            print(f"  [{done}/{total}] {name} trial {result['trial']}: error {result['error']} "
+                  f"({result['cv_seconds']:.1f}s CV)")
+
+    # Timed after the pool has shut down, one model at a time
+    report = {}
+    for name, trials in results.items():
+        X_test = dataset(name, args.data_dir)[1]
+        for result in trials:
+            model = pickle.loads(result['model'])
+            result['model_bytes'] = len(result.pop('model'))
+            result.update(measure_latency(model, X_test))
+        trials.sort(key=lambda result: result['trial'])
+        frontier = pareto_frontier(trials)
+        for result in trials:
+            result['current'] = result['trial'] == 0
+            result['on_frontier'] = result['trial'] in frontier
+        report[name] = {
+            'metric': METRICS[name]['name'],
+            'folds': args.folds,
+            'search_space': SEARCH_SPACES[name],
+            'trials': trials,
+            'frontier': frontier
+        }
+        print_table(name, report[name])
+
+    # Keep earlier results for models not searched this time
+    existing = {}
+    if os.path.exists(args.report):
+        with open(args.report) as f:
+            existing = json.load(f)
+    existing.update({name: {'searched_at': datetime.now().isoformat(), **entry} for name, entry in report.items()})
+    with open(args.report, 'w') as f:
+        json.dump(existing, f, indent=2)
+    print(f"\n📄 Report in {args.report} ({time.perf_counter() - started:.1f}s). "
+          f"Promote a trial with: python tune_models.py promote MODEL TRIAL")
+    return 0
+
+
+def print_table(name, entry):
+    metric = entry['metric']
+    print(f"\n{name}: {len(entry['trials'])} trials, frontier {entry['frontier']} (* on the frontier)")
+    print(f"  {'trial':>5}  {'cv_' + metric:>12}  {'holdout':>8}  {'1-row p50':>10}  {'batch':>9}  "
+          f"{'size':>9}  params")
+    for result in sorted(entry['trials'], key=lambda result: result['error']):
+        print(f"{'*' if result['on_frontier'] else ' '} {result['trial']:>5}  {result['cv_' + metric]:>12}  "
+              f"{result['holdout_' + metric]:>8}  {result['single_p50_ms']:>8.3f}ms  "
+              f"{result['batch_ms']:>7.1f}ms  {result['model_bytes'] / 1024:>7.0f}KB  "
+              f"{json.dumps(result['params'])}{'  (current)' if result['current'] else ''}")
+
+
+def promote(args):
+    if not os.path.exists(args.report):
+        print(f"❌ No tuning report at {args.report}; run a search first")
+        return 1
+    with open(args.report) as f:
+        entry = json.load(f).get(args.model)
+    chosen = next((trial for trial in (entry or {}).get('trials', []) if trial['trial'] == args.trial), None)
+    if chosen is None:
+        print(f"❌ No trial {args.trial} for {args.model} in {args.report}")
+        return 1
+    if not chosen['on_frontier']:
+        print(f"⚠️  Trial {args.trial} is not on the frontier {entry['frontier']}; promoting anyway")
+
+    params_path = args.params or os.path.join(args.model_dir, 'model_params.json')
+    promoted = {}
+    if os.path.exists(params_path):
+        with open(params_path) as f:
+            promoted = json.load(f)
+    promoted[args.model] = chosen['params']
+    with open(params_path, 'w') as f:
+        json.dump(promoted, f, indent=2)
+
+    print(f"✅ {args.model} trial {args.trial} promoted to {params_path}: {json.dumps(chosen['params'])}")
+    print(f"   Rebuild with: python rebuild_models.py --models {args.model}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search crop and yield hyperparameters for accuracy and latency')
+    parser.add_argument('--model-dir', default=os.path.join(ROOT_DIR, 'model'))
+    parser.add_argument('--report', default=None,
+                        help='Tuning report (default: MODEL_DIR/tuning_report.json)')
+    parser.add_argument('--params', default=None,
+                        help='Promoted hyperparameters (default: MODEL_DIR/model_params.json)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search_parser = commands.add_parser('search', help='Run the trials and report the frontier')
+    search_parser.add_argument('--models', default=list(SEARCH_SPACES), type=parse_models,
+                               help=f"Comma-separated subset of {','.join(SEARCH_SPACES)}")
+    search_parser.add_argument('--trials', type=int, default=None,
+                               help='Candidates per model, sampled from the grid (default: the whole grid)')
+    search_parser.add_argument('--folds', type=int, default=5)
+    search_parser.add_argument('--jobs', type=int, default=available_cores(),
+                               help='Worker processes (default: all available cores)')
+    search_parser.add_argument('--data-dir', default=os.path.join(ROOT_DIR, 'data'))
+
+    promote_parser = commands.add_parser('promote', help="Use a trial's settings in rebuild_models.py")
+    promote_parser.add_argument('model', choices=list(SEARCH_SPACES))
+    promote_parser.add_argument('trial', type=int)
+
+    args = parser.parse_args(argv)
+    args.report = args.report or os.path.join(args.model_dir, 'tuning_report.json')
+    if args.command == 'search':
+        os.makedirs(args.model_dir, exist_ok=True)
+        return search(args)
+    return promote(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())